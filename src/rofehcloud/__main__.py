@@ -5,29 +5,41 @@ import sys
 if __package__ is None:
     os.sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import time
 import uuid
 import argparse
 import questionary
-import tzlocal
 from pathlib import Path
 from datetime import datetime
 from colorama import init, Style
 from rich.console import Console
+from rich.live import Live
 from rich.markdown import Markdown
 
 from rofehcloud.logger import log_message
-from rofehcloud.agent import handle_user_prompt, setup_services
 from rofehcloud.chat import (
-    get_conversation_label,
-    save_data,
-    load_data,
+    generate_conversation_label_in_background,
+    get_heuristic_conversation_label,
+    get_troubleshooting_prompt,
+    save_session,
+    load_session,
     get_conversations_list,
+    search_conversations,
 )
 from rofehcloud.config import Config as config
 from rofehcloud.profile import check_available_tools, read_profile, save_profile
 from rofehcloud.utils import initialize_environment
 from rofehcloud.llm import verify_llm_functionality
-from rofehcloud.aws import get_regions_with_resources
+from rofehcloud.aws import get_default_aws_region, get_regions_with_resources
+from rofehcloud.history import get_history_for_prompt
+from rofehcloud.answer_cache import (
+    get_cached_answer,
+    recording_commands,
+    refresh_answer,
+    save_answer,
+)
+from rofehcloud.constants import error_response
+from rofehcloud.tracing import format_waterfall, span
 
 
 # menu prompts
@@ -36,20 +48,172 @@ troubleshoot_problem = "Troubleshoot a problem"
 continue_conversation = "Continue a previous conversation"
 discover_cloud_resources = "Find AWS regions with deployed resources"
 exit_item = "Exit"
+search_conversations_item = "Search conversations..."
+
+# questionary supports up to 36 shortcuts, one of them is used by the search item
+MAX_LISTED_CONVERSATIONS = 35
+
+
+def create_agent_llm_stage(results):
+    # LangChain is imported here to keep "--version" and argument parsing fast (and
+    # to overlap the import with the other startup stages)
+    from rofehcloud.agent import create_agent_llm
+
+    return create_agent_llm(config.LLM_TO_USE)
+
+
+def start_services(profile: str, profile_data: dict, show_timing: bool = False):
+    from rofehcloud.startup import (
+        StartupStageError,
+        format_startup_timings,
+        run_startup_stages,
+    )
+
+    def setup_services_stage(results):
+        from rofehcloud.agent import setup_services
+
+        return setup_services(
+            profile_data, results["agent_llm"], results.get("aws_region")
+        )
+
+    # The LLM verification, the LangChain import and the AWS region lookup overlap
+    # with the tool discovery; the agent is built once they are done
+    stages = [
+        ("tools", lambda results: check_available_tools(profile), []),
+        ("llm_verification", lambda results: verify_llm_functionality(), []),
+        ("agent_llm", create_agent_llm_stage, []),
+    ]
+    agent_dependencies = ["tools", "agent_llm"]
+    if "aws" in config.ALL_TOOLS:
+        stages.append(("aws_region", lambda results: get_default_aws_region(), []))
+        agent_dependencies.append("aws_region")
+    stages.append(("agent", setup_services_stage, agent_dependencies))
+
+    try:
+        _, timings = run_startup_stages(stages)
+    except StartupStageError as e:
+        log_message("ERROR", str(e))
+        return False
+
+    if show_timing:
+        print(format_startup_timings(timings))
+    return True
+
+
+def use_cached_answer(question, profile, conversation_type, entry, console):
+    """Show the cached answer and let the user use it, refresh it or ask the agent.
+
+    Returns the answer and whether it is already displayed; the answer is None if
+    the question should be investigated by the agent.
+    """
+    print(
+        Style.BRIGHT
+        + f"Cached answer ({entry['age'] / 60:.0f} minutes old):"
+        + Style.RESET_ALL
+    )
+    console.print(Markdown(entry["answer"]))
+
+    use_choice = "Use the cached answer"
+    refresh_choice = (
+        f"Refresh the answer (re-run {len(entry['commands'])} recorded commands)"
+    )
+    new_investigation_choice = "Run a new investigation"
+    choice = questionary.select(
+        "What would you like to do?",
+        choices=[use_choice, refresh_choice, new_investigation_choice],
+    ).ask()
+
+    if choice == refresh_choice:
+        if config.STREAM_LLM_RESPONSES:
+            print(Style.BRIGHT + "Answer: " + Style.RESET_ALL)
+            streamed_text = []
+            with Live(console=console, refresh_per_second=8) as live:
+
+                def render_chunk(chunk):
+                    streamed_text.append(chunk)
+                    live.update(Markdown("".join(streamed_text)))
+
+                answer = refresh_answer(
+                    question, profile, conversation_type, entry, render_chunk
+                )
+            if answer is not None:
+                return answer, True
+        else:
+            answer = refresh_answer(question, profile, conversation_type, entry)
+            if answer is not None:
+                return answer, False
+        print("Failed to refresh the answer, running a new investigation...")
+    if choice == new_investigation_choice or choice == refresh_choice:
+        return None, False
+    return entry["answer"], True
+
+
+def select_conversation(profile):
+    """Let the user pick a recent conversation or search for one; return its session ID."""
+    conversations_list = get_conversations_list(profile)
+    if not conversations_list:
+        print("No conversations found.")
+        return None
+
+    while True:
+        if len(conversations_list) <= MAX_LISTED_CONVERSATIONS:
+            prompt = (
+                "Select a conversation to continue (press Ctrl+C to exit the menu):"
+            )
+        else:
+            prompt = (
+                "Select a conversation to continue - only "
+                f"{MAX_LISTED_CONVERSATIONS} conversations are displayed, search to "
+                "find others (press Ctrl+C to exit the menu):"
+            )
+        choices = [search_conversations_item]
+        for conversation in conversations_list[:MAX_LISTED_CONVERSATIONS]:
+            title = (
+                f"{conversation['label']} (started on {conversation['date']}, "
+                f"session ID {conversation['session_id']})"
+            )
+            if conversation.get("snippet"):
+                title += f": {conversation['snippet'][:80]}"
+            choices.append(questionary.Choice(title, value=conversation["session_id"]))
+
+        session_id = questionary.select(
+            prompt, use_shortcuts=True, choices=choices
+        ).ask()
+        if session_id != search_conversations_item:
+            return session_id
+
+        query = questionary.text(
+            "Search for (words from labels, questions or answers):"
+        ).ask()
+        if not query:
+            continue
+        start_time = time.time()
+        search_results = search_conversations(
+            profile, query, limit=MAX_LISTED_CONVERSATIONS
+        )
+        if search_results is None:
+            print("Error while searching conversations.")
+        elif not search_results:
+            print("No matching conversations found.")
+        else:
+            print(
+                f"Found {len(search_results)} matching conversations "
+                f"in {(time.time() - start_time) * 1000:.0f} ms"
+            )
+            conversations_list = search_results
 
 
-def text_based_interaction(profile: str, console: Console):
+def text_based_interaction(profile: str, console: Console, show_timing=False):
     profile_data = read_profile(profile)
     if profile_data is None:
         print(f"Profile {profile} not found.")
         return
-    if (
-        not check_available_tools(profile)
-        or not setup_services(profile_data)
-        or not verify_llm_functionality()
-    ):
+    if not start_services(profile, profile_data, show_timing):
         exit(1)
 
+    from rofehcloud.agent import handle_user_prompt
+    from rofehcloud.callbacks import StreamingOutputHandler
+
     while True:
         choice = questionary.select(
             "Choose an option (or use Ctrl+C to exit):",
@@ -86,42 +250,16 @@ def text_based_interaction(profile: str, console: Console):
             first_question = True
             conversation_details = {}
             session_id = None
+            label_thread = None
 
             if choice == continue_conversation:
-                conversations_list = get_conversations_list(profile)
-                if not conversations_list:
-                    print("No conversations found.")
-                    continue
-                formatted_conversations_list = []
-                for conversation in conversations_list:
-                    formatted_conversations_list.append(
-                        f"{conversation['label']} (started on {conversation['date']}, "
-                        f"session ID {conversation['session_id']})"
-                    )
-
-                if len(formatted_conversations_list) <= 36:
-                    prompt = "Select a conversation to continue (press Ctrl+C to exit the menu):"
-                else:
-                    prompt = (
-                        "Select a conversation to continue - only last 36 conversations "
-                        "are displayed (press Ctrl+C to exit the menu):"
-                    )
-
-                conversation_to_continue = questionary.select(
-                    prompt,
-                    use_shortcuts=True,
-                    choices=formatted_conversations_list[:31],
-                ).ask()
-
-                if conversation_to_continue is None:
+                session_id = select_conversation(profile)
+                if session_id is None:
                     print("Returning to the main menu...")
                     continue
-
-                session_id = conversation_to_continue.split("session ID ")[1].strip(")")
                 log_message("DEBUG", f"Session ID: {session_id}")
 
-                session_file_name = f"{config.SESSION_DIR}/{session_id}.yaml"
-                conversation_details = load_data(session_file_name)
+                conversation_details = load_session(session_id)
                 if not conversation_details:
                     print("Error while loading the conversation details.")
                     continue
@@ -159,70 +297,113 @@ def text_based_interaction(profile: str, console: Console):
                     break
 
                 if troubleshooting and first_question:
-                    local_tz = tzlocal.get_localzone()
-                    current_time = datetime.now(local_tz)
-                    formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
-
-                    question_full = (
-                        "Using available tools, investigate the alert/issue provided below in XML tag "
-                        "<issue_to_investigate>. "
-                        "Review all reasonable scenarios "
-                        "why the problem could happen. Use available tooling to collect "
-                        "necessary debugging information. Perform Root Cause Analysis. "
-                        "Suggest remediation steps. "
-                        "Using bullet points, mention a summary of taken investigation steps. "
-                        f"The current GMT date/time is {formatted_time}.\n\n"
-                        f"<issue_to_investigate>{question}</issue_to_investigate>"
-                    )
+                    question_full = get_troubleshooting_prompt(question)
                 else:
                     question_full = question
 
-                if first_question:
-                    first_question = False
-                    conversation_label = get_conversation_label(profile, question)
-                    print(
-                        Style.BRIGHT
-                        + "New conversation label: "
-                        + Style.RESET_ALL
-                        + conversation_label
-                    )
-
-                    session_id = str(uuid.uuid4())
-                    conversation_details = {
-                        "start_time": datetime.now(),
-                        "profile": profile,
-                        "session_id": session_id,
-                        "conversation_label": conversation_label,
-                        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "conversation_type": (
-                            "troubleshooting" if troubleshooting else "question"
-                        ),
-                        "conversation_history": [],
-                    }
-
-                session_file_name = f"{config.SESSION_DIR}/{session_id}.yaml"
-
-                answer = handle_user_prompt(
-                    profile,
-                    question if not troubleshooting else question_full,
-                    conversation_details["conversation_history"],
-                )
+                with span("turn") as turn_span:
+                    new_conversation = first_question
+                    if first_question:
+                        first_question = False
+                        session_id = str(uuid.uuid4())
+                        conversation_details = {
+                            "start_time": datetime.now(),
+                            "profile": profile,
+                            "session_id": session_id,
+                            "conversation_label": get_heuristic_conversation_label(
+                                question
+                            ),
+                            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                            "conversation_type": (
+                                "troubleshooting" if troubleshooting else "question"
+                            ),
+                            "conversation_history": [],
+                        }
+                        # The LLM-generated label replaces the heuristic one when
+                        # ready, without delaying the answer
+                        label_thread = generate_conversation_label_in_background(
+                            profile, question, conversation_details
+                        )
+
+                    # Only the first question of a conversation does not depend
+                    # on the conversation history, so only it is cached
+                    use_answer_cache = config.ANSWER_CACHE_ENABLED and new_conversation
+                    answer = None
+                    answer_displayed = False
+                    streaming_handler = None
+                    if use_answer_cache:
+                        cached_entry = get_cached_answer(
+                            question,
+                            profile,
+                            conversation_details["conversation_type"],
+                        )
+                        if cached_entry is not None:
+                            answer, answer_displayed = use_cached_answer(
+                                question,
+                                profile,
+                                conversation_details["conversation_type"],
+                                cached_entry,
+                                console,
+                            )
+
+                    if answer is None:
+                        callbacks = []
+                        if config.STREAM_LLM_RESPONSES:
+                            streaming_handler = StreamingOutputHandler(console)
+                            callbacks.append(streaming_handler)
+
+                        history_summary, recent_history = get_history_for_prompt(
+                            conversation_details
+                        )
+                        with recording_commands() as executed_commands:
+                            answer = handle_user_prompt(
+                                profile,
+                                question if not troubleshooting else question_full,
+                                recent_history,
+                                callbacks=callbacks,
+                                history_summary=history_summary,
+                            )
+                        if use_answer_cache and answer != error_response:
+                            save_answer(
+                                question,
+                                profile,
+                                conversation_details["conversation_type"],
+                                answer,
+                                executed_commands,
+                            )
+
+                # The streamed final answer is already on the screen
+                if not answer_displayed and (
+                    streaming_handler is None
+                    or not streaming_handler.final_answer_rendered
+                ):
+                    print(Style.BRIGHT + "Answer: " + Style.RESET_ALL)
+                    console.print(Markdown(answer))
 
-                print(Style.BRIGHT + "Answer: " + Style.RESET_ALL)
-                console.print(Markdown(answer))
+                if config.TRACE_SHOW_WATERFALL:
+                    print(format_waterfall(turn_span))
 
                 conversation_details["conversation_history"].append(
                     {"question": question, "answer": answer}
                 )
 
-                result = save_data(session_file_name, conversation_details)
+                result = save_session(conversation_details)
                 if not result:
                     print(
-                        f"Error while saving the conversation details to file {session_file_name}."
+                        f"Error while saving the conversation details ({session_id})."
                     )
                     break
 
-                log_message("DEBUG", f"Conversation details: {conversation_details}")
+                if label_thread is not None:
+                    label_thread = None
+                    print(
+                        Style.BRIGHT
+                        + "Conversation label: "
+                        + Style.RESET_ALL
+                        + conversation_details["conversation_label"]
+                    )
+
+                log_message("DEBUG", "Conversation details: %s", conversation_details)
 
         else:
             print("Exiting...")
@@ -247,8 +428,8 @@ def main() -> int:
         "--mode",
         "-m",
         type=str,
-        help="Select mode: interactive (default) or command",
-        choices=["interactive", "command"],
+        help="Select mode: interactive (default), command or server",
+        choices=["interactive", "command", "server"],
     )
     parser.add_argument(
         "--profile",
@@ -256,6 +437,42 @@ def main() -> int:
         type=str,
         help='Configuration profile to use (the default is "default")',
     )
+    parser.add_argument(
+        "--input",
+        "-i",
+        type=str,
+        default="-",
+        help="Command mode: JSONL file with questions/problems (default: stdin)",
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        type=str,
+        default="-",
+        help="Command mode: file for the JSONL results (default: stdout)",
+    )
+    parser.add_argument(
+        "--workers",
+        "-w",
+        type=int,
+        help="Command mode: number of worker processes "
+        f"(the default is {config.BATCH_MODE_MAX_WORKERS})",
+    )
+    parser.add_argument(
+        "--startup-timing",
+        action="store_true",
+        help="Show how long every startup stage took",
+    )
+    parser.add_argument(
+        "--host",
+        type=str,
+        help=f"Server mode: address to listen on (the default is {config.SERVER_HOST})",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        help=f"Server mode: port to listen on (the default is {config.SERVER_PORT})",
+    )
 
     args = parser.parse_args()
 
@@ -278,14 +495,23 @@ def main() -> int:
     if args.profile:
         log_message("DEBUG", f"Using profile: {args.profile}")
         profile = args.profile
-    print(Style.BRIGHT + "Profile: " + Style.RESET_ALL + profile)
 
     mode = "interactive"
-    if args.mode == "interactive":
-        mode = "interactive"
+    if args.mode in ["command", "server"]:
+        mode = args.mode
 
     log_message("DEBUG", f"Running in {mode} mode")
-    text_based_interaction(profile, console)
+    if mode == "command":
+        from rofehcloud.batch import run_batch
+
+        return run_batch(profile, args.input, args.output, args.workers)
+    if mode == "server":
+        from rofehcloud.server import run_server
+
+        return run_server(profile, args.host, args.port)
+
+    print(Style.BRIGHT + "Profile: " + Style.RESET_ALL + profile)
+    text_based_interaction(profile, console, args.startup_timing)
 
     return 0
 
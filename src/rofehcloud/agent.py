@@ -1,29 +1,29 @@
-import openai
 import platform
 import os
 
 import time
-import subprocess
+import json
+import threading
+import contextvars
 import questionary
+from concurrent.futures import ThreadPoolExecutor
 from colorama import init, Style
 
-from langchain import hub
 from langchain_community.tools import Tool
 from langchain.agents import AgentExecutor, create_react_agent
 from langchain_core.runnables.history import RunnableWithMessageHistory
 from langchain_core.chat_history import BaseChatMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
-
-from langchain_aws import ChatBedrock
-from langchain_openai import ChatOpenAI as OpenAILangChain
-from langchain_openai import AzureChatOpenAI
-from langchain_ollama import OllamaLLM
-from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_core.prompts import PromptTemplate
+from langchain_core.messages import SystemMessage
 
 from rofehcloud.config import Config as config
 from rofehcloud.logger import log_message
 
 from rofehcloud.utils import fix_unclosed_quote
+from rofehcloud.callbacks import TracingCallbackHandler, TurnStatsHandler
+from rofehcloud.tracing import is_tracing_enabled, span
+from rofehcloud.shell import run_shell_command, command_stats
 from rofehcloud.constants import (
     error_response,
     agent_prompt_with_history,
@@ -32,35 +32,59 @@ from rofehcloud.constants import (
     response_format_instruction,
 )
 from rofehcloud.llm import call_llm
+from rofehcloud.aws import get_default_aws_region
+from rofehcloud.environment_cache import get_cached_value
+from rofehcloud import answer_cache, code_index, command_cache, inventory, reducer
+from rofehcloud.safety import (
+    SAFE,
+    UNSAFE,
+    get_local_verdict,
+    save_verdict,
+    safety_check_stats,
+)
 
 init(autoreset=True)
 
 chat_history_store = {}
 
-prompt_with_chat_history = hub.pull("hwchase17/react-chat")
+# The ReAct prompt ships with the package (see constants.py), no download needed
+prompt_with_chat_history = PromptTemplate.from_template(agent_prompt_with_history)
 
-prompt_with_chat_history.template = agent_prompt_with_history
 
-
-def get_session_history(conversation_history) -> BaseChatMessageHistory:
+def get_session_history(session) -> BaseChatMessageHistory:
     chat_history_store = ChatMessageHistory()
-    for chat_entry in conversation_history:
+    if session["history_summary"]:
+        chat_history_store.add_message(
+            SystemMessage(
+                content="Summary of the earlier part of the conversation: "
+                + session["history_summary"]
+            )
+        )
+    for chat_entry in session["conversation_history"]:
         chat_history_store.add_user_message(chat_entry["question"])
         chat_history_store.add_ai_message(chat_entry["answer"])
 
     result = chat_history_store
-    log_message("DEBUG", f"Chat history records: {result}")
+    log_message("DEBUG", "Chat history records: %s", result)
     return result
 
 
 def check_that_command_is_safe(command):
+    # Known read-only/mutating commands and previously reviewed command templates
+    # do not need an LLM round trip
+    verdict = get_local_verdict(command)
+    if verdict == SAFE:
+        return True, "The command is not making any changes to the system"
+    if verdict == UNSAFE:
+        return False, "ERROR: The command is making changes to the system"
+
     prompt = (
         "Review the following command and reply with Yes if the command is making any "
         "changes to the system. Reply with No if the command is not making any changes and is safe to"
         f"execute. Do not add any comments. You must reply with either Yes or No. Command to review: \n\n{command}"
     )
     response = call_llm(prompt, config.LLM_TO_USE)
-    log_message("DEBUG", f"Response to the command validation prompt: {response}")
+    log_message("DEBUG", "Response to the command validation prompt: %s", response)
 
     if response is None or response == "":
         log_message(
@@ -72,9 +96,11 @@ def check_that_command_is_safe(command):
         )
 
     if response.lower() == "yes":
+        save_verdict(command, UNSAFE)
         return False, "ERROR: The command is making changes to the system"
 
     if response.lower() == "no":
+        save_verdict(command, SAFE)
         return True, "The command is not making any changes to the system"
 
     return (
@@ -83,39 +109,101 @@ def check_that_command_is_safe(command):
     )
 
 
-def api_command_executor(command):
-    return local_command_executor(command)
+# Commands of a batch run in parallel, but the user is asked about one command at a time
+user_confirmation_lock = threading.Lock()
 
 
-def repo_command_executor(command, local_directory):
-    return local_command_executor(command, local_directory)
+def parse_batch_commands(commands_input):
+    commands_input = commands_input.strip().strip("`").strip()
+    try:
+        commands = json.loads(commands_input)
+        if isinstance(commands, str):
+            commands = [commands]
+    except json.JSONDecodeError:
+        commands = commands_input.splitlines()
 
+    if not isinstance(commands, list):
+        return []
+    return [str(command).strip() for command in commands if str(command).strip()]
 
-def local_command_executor(command, local_directory=None):
-    command = fix_unclosed_quote(command)
 
-    if config.ASK_FOR_USER_CONFIRMATION_BEFORE_EXECUTING_EACH_COMMAND:
-        print(
-            Style.BRIGHT
-            + "\nThe system would like to execute the following command:\n"
-            + Style.RESET_ALL
-            + command
-        )
-        print("\n\n")
-        response = questionary.confirm(
-            "Would you like the command to be executed?"
-        ).ask()
-        if not response:
-            return data_modification_command_denied
-
-    elif config.ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS in ["ask", "no"]:
-        safe_command, safe_command_message = check_that_command_is_safe(command)
-        if not safe_command:
-            if config.ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS == "ask":
+def batch_command_executor(commands_input, profile=None):
+    commands = parse_batch_commands(commands_input)
+    if not commands:
+        return (
+            "ERROR: The tool input must be a JSON list of commands, "
+            'e.g. ["kubectl get pods -A", "kubectl get events -A"]'
+        )
+    if len(commands) > config.BATCH_COMMAND_MAX_COMMANDS:
+        return (
+            f"ERROR: Too many commands ({len(commands)}); "
+            f"run at most {config.BATCH_COMMAND_MAX_COMMANDS} commands at once"
+        )
+
+    # All outputs together must fit into the usual single command output limit
+    output_budget = config.COMMAND_OUTPUT_MAX_LENGTH_CHARS // len(commands)
+    log_message(
+        "DEBUG",
+        f"Running {len(commands)} commands in parallel "
+        f"({output_budget} characters of output per command)",
+    )
+
+    def run_command(command):
+        output = local_command_executor(
+            command, profile=profile, max_output_length=output_budget
+        )
+        # Cached results and truncation notes come on top of the command output
+        if len(output) > output_budget:
+            output = (
+                output[:output_budget]
+                + "\n... (output truncated to fit the batch output budget)"
+            )
+        return output
+
+    # Every command runs in a copy of the caller's context to keep the trace spans
+    # nested under the current tool call
+    contexts = [contextvars.copy_context() for _ in commands]
+    with ThreadPoolExecutor(
+        max_workers=min(len(commands), config.BATCH_COMMAND_MAX_WORKERS)
+    ) as executor:
+        outputs = list(
+            executor.map(
+                lambda context, command: context.run(run_command, command),
+                contexts,
+                commands,
+            )
+        )
+
+    return "\n\n".join(
+        f"### Command {index}: {command}\n{output}"
+        for index, (command, output) in enumerate(zip(commands, outputs), start=1)
+    )
+
+
+def api_command_executor(command, profile=None):
+    return local_command_executor(command, profile=profile)
+
+
+def repo_command_executor(command, local_directory, profile=None):
+    return local_command_executor(command, local_directory, profile)
+
+
+def local_command_executor(
+    command, local_directory=None, profile=None, max_output_length=None, use_cache=True
+):
+    with span("command", command=command) as command_span:
+        command = fix_unclosed_quote(command)
+        if max_output_length is None:
+            max_output_length = config.COMMAND_OUTPUT_MAX_LENGTH_CHARS
+
+        if config.ASK_FOR_USER_CONFIRMATION_BEFORE_EXECUTING_EACH_COMMAND:
+            # Nobody can confirm the command in the command (batch) and server modes
+            if config.NON_INTERACTIVE:
+                return data_modification_command_denied
+            with user_confirmation_lock:
                 print(
                     Style.BRIGHT
-                    + "\nAttention! The system would like to execute a command that may change some data.\n"
-                    "The command that is planned to be executed:\n"
+                    + "\nThe system would like to execute the following command:\n"
                     + Style.RESET_ALL
                     + command
                 )
@@ -123,40 +211,106 @@ def local_command_executor(command, local_directory=None):
                 response = questionary.confirm(
                     "Would you like the command to be executed?"
                 ).ask()
-                if not response:
-                    return data_modification_command_denied
-
-            else:
+            if not response:
                 return data_modification_command_denied
 
-    if local_directory is None:
-        local_directory = os.getcwd()
-
-    result = subprocess.run(
-        command, shell=True, capture_output=True, text=True, cwd=local_directory
-    )
-    stdout = result.stdout
-    stderr = result.stderr
-    error_code = result.returncode
-    if len(stdout) == 0 and len(stderr) == 0:
-        return f"Empty Response (command exit code: {error_code})"
+        elif config.ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS in ["ask", "no"]:
+            with span("safety_check") as safety_check_span:
+                safe_command, safe_command_message = check_that_command_is_safe(command)
+                safety_check_span["attributes"]["safe"] = safe_command
+            if not safe_command:
+                if (
+                    config.ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS == "ask"
+                    and not config.NON_INTERACTIVE
+                ):
+                    with user_confirmation_lock:
+                        print(
+                            Style.BRIGHT
+                            + "\nAttention! The system would like to execute a command that may change some data.\n"
+                            "The command that is planned to be executed:\n"
+                            + Style.RESET_ALL
+                            + command
+                        )
+                        print("\n\n")
+                        response = questionary.confirm(
+                            "Would you like the command to be executed?"
+                        ).ask()
+                    if not response:
+                        return data_modification_command_denied
+
+                else:
+                    return data_modification_command_denied
 
-    output = stdout + stderr
+        if local_directory is None:
+            local_directory = os.getcwd()
+        answer_cache.record_command(command, local_directory)
 
-    if len(output) > config.COMMAND_OUTPUT_MAX_LENGTH_CHARS:
-        log_message(
-            "DEBUG",
-            f"Output is too long: {len(output)} characters; "
-            f"truncating to {config.COMMAND_OUTPUT_MAX_LENGTH_CHARS} characters",
+        cached_output = (
+            command_cache.get_cached_result(
+                command, local_directory, profile, max_output_length
+            )
+            if use_cache
+            else None
         )
-        output = (
-            output[: config.COMMAND_OUTPUT_MAX_LENGTH_CHARS]
-            + f"\n... {truncated_message}"
+        if cached_output is not None:
+            command_span["attributes"]["cached"] = True
+            return cached_output
+
+        # Expected structured output is captured beyond the limit, as it may fit
+        # after reduction
+        reduce_output = reducer.is_reducer_enabled(command)
+        capture_length = (
+            max(max_output_length, config.COMMAND_OUTPUT_REDUCER_MAX_INPUT_CHARS)
+            if reduce_output and reducer.expects_structured_output(command)
+            else max_output_length
         )
-    else:
-        log_message("DEBUG", f"Output length: {len(output)} characters")
+        with span("subprocess") as subprocess_span:
+            result = run_shell_command(command, local_directory, capture_length)
+            subprocess_span["attributes"].update(
+                exit_code=result["exit_code"],
+                output_chars=result["total_length"],
+                timed_out=result["timed_out"],
+            )
+        output = result["output"]
+        error_code = result["exit_code"]
+        truncated = result["truncated"]
+        if reduce_output and not truncated and not result["timed_out"]:
+            output = reducer.reduce_output(command, output)
+            command_span["attributes"]["reduced_output_chars"] = len(output)
+        if len(output) > max_output_length:
+            output = output[:max_output_length]
+            truncated = True
+
+        if result["timed_out"]:
+            return (
+                output
+                + f"\n... ERROR: the command timed out after {result['timeout']} seconds "
+                "and was terminated; the output above is partial. Try a command that "
+                "returns less data or does not wait for input/new events."
+            )
+        if result["total_length"] == 0:
+            return f"Empty Response (command exit code: {error_code})"
+
+        if result["overflow_file"]:
+            output += (
+                f"\n... ({result['total_length'] - len(output) - len(result['tail'])} "
+                f"characters skipped; the complete output was saved to "
+                f"{result['overflow_file']}; the last {len(result['tail'])} characters follow)\n"
+                + result["tail"]
+                + f"\n... {truncated_message}"
+            )
+        elif truncated:
+            output += f"\n... {truncated_message}"
+        else:
+            log_message("DEBUG", f"Output length: {len(output)} characters")
 
-    return output
+        # The overflow file is removed at exit, so its path must not outlive the session
+        if error_code == 0 and not result["overflow_file"]:
+            command_cache.save_result(
+                command, local_directory, profile, max_output_length, output
+            )
+
+        return output
 
 
 def return_current_date_time(string):
@@ -169,12 +323,127 @@ def before_generating_the_final_answer(prompt: str) -> str:
     return "Please generate the final answer to the original input question."
 
 
+def create_agent_llm(llm):
+    # Provider packages are imported on first use, so only the selected one is loaded
+    if llm == "openai":
+        from langchain_openai import ChatOpenAI as OpenAILangChain
+
+        log_message(
+            "INFO",
+            f"Using OpenAI LLM, model ID for the agent: {config.OPENAI_LANGCHAIN_AGENT_MODEL_ID}"
+            f" with temperature: {config.LANGCHAIN_AGENT_MODEL_TEMPERATURE}; "
+            f"model ID for general calls: {config.OPENAI_GENERAL_MODEL_ID}",
+        )
+        llm_langchain = OpenAILangChain(
+            temperature=config.OPENAI_TEMPERATURE,
+            model=config.OPENAI_LANGCHAIN_AGENT_MODEL_ID,
+            openai_api_key=config.OPENAI_API_KEY,
+            request_timeout=240,
+            max_tokens=config.OPENAI_MAX_RESPONSE_TOKENS,
+            streaming=config.STREAM_LLM_RESPONSES,
+        )
+    elif llm == "bedrock":
+        from langchain_aws import ChatBedrock
+
+        log_message(
+            "INFO",
+            f"Using Bedrock LLM, model ID for the agent: {config.BEDROCK_LANGCHAIN_AGENT_MODEL_ID}"
+            f" with profile name: {config.BEDROCK_PROFILE_NAME} in region: {config.BEDROCK_AWS_REGION}, "
+            f"model ID for general calls: {config.BEDROCK_GENERAL_MODEL_ID}",
+        )
+
+        llm_langchain = ChatBedrock(
+            credentials_profile_name=config.BEDROCK_PROFILE_NAME,
+            region_name=config.BEDROCK_AWS_REGION,
+            model_id=config.BEDROCK_LANGCHAIN_AGENT_MODEL_ID,
+            model_kwargs={
+                "temperature": config.BEDROCK_TEMPERATURE,
+                "max_tokens": config.BEDROCK_MAX_RESPONSE_TOKENS,
+            },
+            streaming=config.STREAM_LLM_RESPONSES,
+        )
+
+    elif llm == "azure-openai":
+        from langchain_openai import AzureChatOpenAI
+
+        log_message(
+            "INFO",
+            f"Using Azure OpenAI LLM, model ID for the agent: {config.AZURE_OPENAI_MODEL_ID}"
+            f" with temperature: {config.AZURE_OPENAI_TEMPERATURE}, "
+            f"deployment ID: {config.AZURE_OPENAI_DEPLOYMENT_ID}, "
+            f"API version: {config.AZURE_OPENAI_API_VERSION}",
+        )
+
+        llm_langchain = AzureChatOpenAI(
+            azure_deployment=config.AZURE_OPENAI_DEPLOYMENT_ID,
+            api_version=config.AZURE_OPENAI_API_VERSION,
+            temperature=config.AZURE_OPENAI_TEMPERATURE,
+            max_tokens=config.AZURE_OPENAI_MAX_RESPONSE_TOKENS,
+            timeout=240,
+            max_retries=2,
+            streaming=config.STREAM_LLM_RESPONSES,
+        )
+    elif llm == "ollama":
+        from langchain_ollama import OllamaLLM
+
+        log_message(
+            "INFO",
+            f"Using Ollama LLM, model ID for the agent: {config.OLLAMA_MODEL_ID}"
+            f" with endpoint URL: {config.OLLAMA_ENDPOINT_URL}",
+        )
+
+        llm_langchain = OllamaLLM(
+            base_url=config.OLLAMA_ENDPOINT_URL,
+            model=config.OLLAMA_MODEL_ID,
+            temperature=config.OLLAMA_TEMPERATURE,
+            max_tokens=config.OLLAMA_MAX_TOKENS,
+            disable_streaming=not config.STREAM_LLM_RESPONSES,
+        )
+    elif llm == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        llm_langchain = ChatGoogleGenerativeAI(
+            model=config.GEMINI_MODEL_ID,
+            temperature=config.GEMINI_TEMPERATURE,
+            max_tokens=config.GEMINI_MAX_OUTPUT_TOKENS,
+            api_key=config.GOOGLE_API_KEY,
+        )
+    elif llm == "cassette":
+        from rofehcloud.cassette import CassetteLLM
+
+        log_message(
+            "INFO",
+            f"Using cassette LLM in {config.CASSETTE_MODE} mode, "
+            f"cassette file: {config.CASSETTE_FILE}",
+        )
+        recorded_llm = None
+        if config.CASSETTE_MODE == "record":
+            recorded_llm = create_agent_llm(config.CASSETTE_RECORDED_LLM)
+        llm_langchain = CassetteLLM(recorded_llm=recorded_llm)
+    else:
+        raise ValueError(f"LLM {llm} is not supported.")
+
+    return llm_langchain
+
+
 agent_with_chat_history = None
 
 
-def setup_services(profile_data: dict):
+def setup_services(profile_data: dict, llm_langchain=None, aws_region=None):
     global agent_with_chat_history
 
+    agent_with_chat_history = build_agent(profile_data, llm_langchain, aws_region)
+    return True
+
+
+def build_agent(profile_data: dict, llm_langchain=None, aws_region=None):
+    """Create the LangChain agent (with its tools) for the profile.
+
+    The agent LLM and the default AWS region are created/looked up unless they are
+    passed in (e.g. prepared concurrently by the startup pipeline). The agent keeps
+    no conversation state, so one agent can serve concurrent conversations of the
+    profile.
+    """
     try:
         log_message(
             "DEBUG",
@@ -182,81 +451,10 @@ def setup_services(profile_data: dict):
         )
         start_time = time.time()
         tools = {}
+        profile_name = profile_data.get("name")
 
-        if config.LLM_TO_USE == "openai":
-            log_message(
-                "INFO",
-                f"Using OpenAI LLM, model ID for the agent: {config.OPENAI_LANGCHAIN_AGENT_MODEL_ID}"
-                f" with temperature: {config.LANGCHAIN_AGENT_MODEL_TEMPERATURE}; "
-                f"model ID for general calls: {config.OPENAI_GENERAL_MODEL_ID}",
-            )
-            openai.api_key = config.OPENAI_API_KEY
-            llm_langchain = OpenAILangChain(
-                temperature=config.OPENAI_TEMPERATURE,
-                model=config.OPENAI_LANGCHAIN_AGENT_MODEL_ID,
-                openai_api_key=config.OPENAI_API_KEY,
-                request_timeout=240,
-                max_tokens=config.OPENAI_MAX_RESPONSE_TOKENS,
-                streaming=False,
-            )
-        elif config.LLM_TO_USE == "bedrock":
-            log_message(
-                "INFO",
-                f"Using Bedrock LLM, model ID for the agent: {config.BEDROCK_LANGCHAIN_AGENT_MODEL_ID}"
-                f" with profile name: {config.BEDROCK_PROFILE_NAME} in region: {config.BEDROCK_AWS_REGION}, "
-                f"model ID for general calls: {config.BEDROCK_GENERAL_MODEL_ID}",
-            )
-
-            llm_langchain = ChatBedrock(
-                credentials_profile_name=config.BEDROCK_PROFILE_NAME,
-                region_name=config.BEDROCK_AWS_REGION,
-                model_id=config.BEDROCK_LANGCHAIN_AGENT_MODEL_ID,
-                model_kwargs={
-                    "temperature": config.BEDROCK_TEMPERATURE,
-                    "max_tokens": config.BEDROCK_MAX_RESPONSE_TOKENS,
-                },
-            )
-
-        elif config.LLM_TO_USE == "azure-openai":
-            log_message(
-                "INFO",
-                f"Using Azure OpenAI LLM, model ID for the agent: {config.AZURE_OPENAI_MODEL_ID}"
-                f" with temperature: {config.AZURE_OPENAI_TEMPERATURE}, "
-                f"deployment ID: {config.AZURE_OPENAI_DEPLOYMENT_ID}, "
-                f"API version: {config.AZURE_OPENAI_API_VERSION}",
-            )
-
-            llm_langchain = AzureChatOpenAI(
-                azure_deployment=config.AZURE_OPENAI_DEPLOYMENT_ID,
-                api_version=config.AZURE_OPENAI_API_VERSION,
-                temperature=config.AZURE_OPENAI_TEMPERATURE,
-                max_tokens=config.AZURE_OPENAI_MAX_RESPONSE_TOKENS,
-                timeout=240,
-                max_retries=2,
-            )
-        elif config.LLM_TO_USE == "ollama":
-            log_message(
-                "INFO",
-                f"Using Ollama LLM, model ID for the agent: {config.OLLAMA_MODEL_ID}"
-                f" with endpoint URL: {config.OLLAMA_ENDPOINT_URL}",
-            )
-
-            llm_langchain = OllamaLLM(
-                base_url=config.OLLAMA_ENDPOINT_URL,
-                model=config.OLLAMA_MODEL_ID,
-                temperature=config.OLLAMA_TEMPERATURE,
-                max_tokens=config.OLLAMA_MAX_TOKENS,
-                disable_streaming=True,
-            )
-        elif config.LLM_TO_USE == "gemini":
-            llm_langchain = ChatGoogleGenerativeAI(
-                model=config.GEMINI_MODEL_ID,
-                temperature=config.GEMINI_TEMPERATURE,
-                max_tokens=config.GEMINI_MAX_OUTPUT_TOKENS,
-                api_key=config.GOOGLE_API_KEY,
-            )
-        else:
-            raise ValueError(f"LLM {config.LLM_TO_USE} is not supported.")
+        if llm_langchain is None:
+            llm_langchain = create_agent_llm(config.LLM_TO_USE)
 
         tools = []
         tool_names = []
@@ -281,8 +479,11 @@ def setup_services(profile_data: dict):
             ]
         )
 
+        platform_description = get_cached_value(
+            "platform", lambda: f"{platform.system()} {platform.version()}"
+        )
         cli_tool_description = (
-            f"Run a shell command on this machine (OS {platform.system()} {platform.version()}). "
+            f"Run a shell command on this machine (OS {platform_description}). "
             "Keep in mind the platform specific command syntax, e.g. macOS/Darwin does not support "
             "-d flag for 'date' command. In addition to the common platform commands, you can use "
             "the folowing tools/commands:"
@@ -291,12 +492,8 @@ def setup_services(profile_data: dict):
         if "aws" in config.ALL_TOOLS:
             log_message("DEBUG", "Adding AWS CLI tool...")
             tool_names.append("aws")
-            # Run aws to find out the default aws region
-            aws_region = subprocess.run(
-                "aws configure get region", shell=True, capture_output=True, text=True
-            ).stdout.strip()
-            if not aws_region or aws_region == "":
-                aws_region = "us-east-1"
+            if aws_region is None:
+                aws_region = get_default_aws_region()
 
             cli_tool_description += (
                 "\n* 'aws' for getting the current state of AWS resources. When requesting "
@@ -311,6 +508,27 @@ def setup_services(profile_data: dict):
                 aws_regions = profile_data["aws_regions_with_resources"]
                 cli_tool_description += f"The following AWS regions are available with resources: {aws_regions}. "
 
+            if config.INVENTORY_ENABLED:
+                inventory_profile = profile_name or "default"
+                inventory_regions = aws_regions or [aws_region]
+                inventory.refresh_inventory_in_background(
+                    inventory_profile, inventory_regions
+                )
+
+                def inventory_query_wrapper(query):
+                    with span("inventory_query", query=query):
+                        return inventory.query_inventory(
+                            inventory_profile, inventory_regions, query
+                        )
+
+                tools.append(
+                    Tool.from_function(
+                        func=inventory_query_wrapper,
+                        name="Query the AWS inventory",
+                        description=inventory.get_inventory_tool_description(),
+                    )
+                )
+
         if "gcloud" in config.ALL_TOOLS:
             log_message("DEBUG", "Adding gcloud CLI tool...")
             tool_names.append("gcloud")
@@ -367,9 +585,12 @@ def setup_services(profile_data: dict):
             "and try to fix the command."
         )
 
+        def shell_command_wrapper(command):
+            return api_command_executor(command, profile_name)
+
         tools.append(
             Tool.from_function(
-                func=api_command_executor,
+                func=shell_command_wrapper,
                 name="Run a shell command or access CLI tools",
                 description=cli_tool_description,
             )
@@ -392,12 +613,38 @@ def setup_services(profile_data: dict):
                 "If a command returns an error, then analyze the error message and try to fix the command. "
             )
 
+        def batch_command_wrapper(commands_input):
+            return batch_command_executor(commands_input, profile_name)
+
+        tools.append(
+            Tool.from_function(
+                func=batch_command_wrapper,
+                name="Run multiple shell commands in parallel",
+                description=(
+                    "Run several independent read-only shell commands at once, for example to "
+                    "collect pods, events and node status in one step. The tool accepts a JSON "
+                    'list of commands, e.g. ["kubectl get pods -A", "kubectl get events -A"] '
+                    f"(at most {config.BATCH_COMMAND_MAX_COMMANDS} commands; the same rules as "
+                    "for the single shell command tool apply to every command). The outputs "
+                    "are returned labelled with the command number and share one output "
+                    "size limit, so filter the output of every command."
+                ),
+            )
+        )
+
         def create_git_command_wrapper(repo_directory):
             def git_command_wrapper(command):
-                return repo_command_executor(command, repo_directory)
+                return repo_command_executor(command, repo_directory, profile_name)
 
             return git_command_wrapper
 
+        def create_code_search_wrapper(repo_directory):
+            def code_search_wrapper(query):
+                with span("code_search", query=query):
+                    return code_index.search_code(repo_directory, query)
+
+            return code_search_wrapper
+
         git_command_wrappers = {}
 
         if (
@@ -430,6 +677,23 @@ def setup_services(profile_data: dict):
                         ),
                     ),
                 )
+                if config.CODE_INDEX_ENABLED:
+                    code_index.build_index_in_background(repo_directory)
+                    tools.append(
+                        Tool.from_function(
+                            func=create_code_search_wrapper(repo_directory),
+                            name=f"Search code in repository '{repo_name}'",
+                            description=(
+                                "Fast indexed search in the tracked files of source code "
+                                f"repository '{repo_name}'. The tool accepts a literal "
+                                "string (case-insensitive, no regular expressions, at "
+                                "least 3 characters for the indexed search) and returns "
+                                "ranked 'file:line: text' hits, definitions first. Prefer "
+                                "it to grep when looking for identifiers, error messages "
+                                "or configuration keys."
+                            ),
+                        ),
+                    )
         else:
             log_message("INFO", "No source code repositories to add")
 
@@ -459,14 +723,15 @@ def setup_services(profile_data: dict):
         agent_executors_with_history = AgentExecutor(
             agent=agents_with_history,
             tools=tools,
-            verbose=True,
+            # With streaming enabled the progress is rendered by StreamingOutputHandler
+            verbose=not config.STREAM_LLM_RESPONSES,
             max_iterations=config.AGENT_MAX_ITERATIONS,
             handle_parsing_errors=(
                 f"Check your output and make sure it conforms!\n\n{response_format_instruction}"
             ),
         )
 
-        agent_with_chat_history = RunnableWithMessageHistory(
+        agent = RunnableWithMessageHistory(
             agent_executors_with_history,
             get_session_history,
             input_messages_key="input",
@@ -479,7 +744,7 @@ def setup_services(profile_data: dict):
             f"Client initialization was successful (elapsed time: {str(elapsed_time)} seconds)",
         )
 
-        return True
+        return agent
 
     except Exception as e:
         log_message("ERROR", f"Client initialization failed: {str(e)}")
@@ -487,17 +752,34 @@ def setup_services(profile_data: dict):
         return False
 
 
-def agent_chat(user_input, conversation_history):
+def agent_chat(
+    user_input, conversation_history, callbacks=None, agent=None, history_summary=None
+):
     try:
-        full_agent_response = agent_with_chat_history.invoke(
-            {"input": user_input},
-            config={"configurable": {"session_id": conversation_history}},
-        )
+        if agent is None:
+            agent = agent_with_chat_history
+        callbacks = list(callbacks or [])
+        if is_tracing_enabled():
+            callbacks.append(TracingCallbackHandler())
+        with span("agent_chat", history_turns=len(conversation_history)):
+            full_agent_response = agent.invoke(
+                {"input": user_input},
+                config={
+                    "configurable": {
+                        "session_id": {
+                            "conversation_history": conversation_history,
+                            "history_summary": history_summary,
+                        }
+                    },
+                    "callbacks": callbacks,
+                },
+            )
 
         agent_response = full_agent_response["output"]
         log_message(
             "DEBUG",
-            "Received response from the LangChain agent: " + agent_response,
+            "Received response from the LangChain agent: %s",
+            agent_response,
         )
         return str(agent_response)
 
@@ -506,14 +788,43 @@ def agent_chat(user_input, conversation_history):
         return error_response
 
 
-def handle_user_prompt(profile, user_input, conversation_history=[]):
+def handle_user_prompt(
+    profile,
+    user_input,
+    conversation_history=[],
+    callbacks=None,
+    turn_stats=None,
+    agent=None,
+    history_summary=None,
+):
     try:
         start_time = time.time()
-        bot_response = agent_chat(user_input, conversation_history)
+        turn_stats_handler = TurnStatsHandler()
+        bot_response = agent_chat(
+            user_input,
+            conversation_history,
+            [turn_stats_handler] + (callbacks or []),
+            agent,
+            history_summary,
+        )
 
         final_response_time = time.time()
         seconds_lapsed = final_response_time - start_time
         log_message("DEBUG", "Time elapsed: %s seconds" % seconds_lapsed)
+        log_message(
+            "DEBUG",
+            f"Time to first token: {turn_stats_handler.time_to_first_token} seconds, "
+            f"LLM calls: {turn_stats_handler.llm_calls}",
+        )
+        if turn_stats is not None:
+            turn_stats["latency"] = seconds_lapsed
+            turn_stats["time_to_first_token"] = turn_stats_handler.time_to_first_token
+            turn_stats["llm_calls"] = turn_stats_handler.llm_calls
+            turn_stats["tool_calls"] = turn_stats_handler.tool_calls
+            turn_stats["prompt_tokens"] = turn_stats_handler.prompt_tokens
+            turn_stats["completion_tokens"] = turn_stats_handler.completion_tokens
+        log_message("DEBUG", "Command safety check statistics: %s", safety_check_stats)
+        log_message("DEBUG", "Command execution statistics: %s", command_stats)
 
         return bot_response
 
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.llm import call_llm, call_llm_stream
+from rofehcloud.safety import split_pipeline
+from rofehcloud.tracing import span
+
+
+# Answers to the first question of a conversation are cached per normalized question,
+# profile and set of available tools. An entry records the commands executed while
+# the answer was produced, so the answer can be refreshed by re-running only those
+# commands and asking the LLM once to update the answer.
+
+# Commands executed by the current turn, see recording_commands()
+recorded_commands = contextvars.ContextVar("recorded_commands", default=None)
+
+_local = threading.local()
+
+
+def get_connection():
+    # sqlite3 connections cannot be shared between threads, so each thread gets its own
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(config.ANSWER_CACHE_FILE, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS answers (
+                    key TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    answer TEXT NOT NULL,
+                    commands TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    ttl REAL NOT NULL
+                )
+                """
+            )
+        _local.connection = connection
+    return connection
+
+
+@contextmanager
+def recording_commands():
+    """Collect the commands executed within the block (including parallel batches)."""
+    commands = []
+    token = recorded_commands.set(commands)
+    try:
+        yield commands
+    finally:
+        recorded_commands.reset(token)
+
+
+def record_command(command, local_directory):
+    commands = recorded_commands.get()
+    if commands is not None:
+        commands.append({"command": command, "directory": local_directory})
+
+
+def normalize_question(question):
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.!").strip().lower()
+
+
+def get_cache_key(question, profile, conversation_type):
+    # The raw question is used, as the troubleshooting prompt embeds the current time
+    key_data = [
+        normalize_question(question),
+        profile,
+        conversation_type,
+        sorted(config.ALL_TOOLS),
+    ]
+    return hashlib.sha256(json.dumps(key_data).encode("utf-8")).hexdigest()
+
+
+def get_entry_ttl(commands):
+    # An answer is valid for the shortest TTL of the tools used to produce it
+    ttls = config.ANSWER_CACHE_TTLS
+    tool_ttls = [
+        ttls[os.path.basename(segment[0])]
+        for command in commands
+        for segment in split_pipeline(command["command"]) or []
+        if os.path.basename(segment[0]) in ttls
+    ]
+    return min(tool_ttls) if tool_ttls else ttls.get("default", 0)
+
+
+def get_cached_answer(question, profile, conversation_type):
+    """Return the cached entry for the question (a dict) or None."""
+    key = get_cache_key(question, profile, conversation_type)
+    try:
+        connection = get_connection()
+        row = connection.execute(
+            "SELECT * FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if time.time() - row["created_at"] > row["ttl"]:
+            with connection:
+                connection.execute("DELETE FROM answers WHERE key = ?", (key,))
+            return None
+    except sqlite3.Error as e:
+        log_message("WARNING", f"Error while reading the answer cache: {e}")
+        return None
+
+    entry = dict(row)
+    entry["commands"] = json.loads(entry["commands"])
+    entry["age"] = time.time() - entry["created_at"]
+    log_message(
+        "DEBUG", f"Answer cache hit (age {entry['age']:.0f} seconds): {question}"
+    )
+    return entry
+
+
+def save_answer(question, profile, conversation_type, answer, commands):
+    # The agent may run the same command several times
+    commands = list({json.dumps(command): command for command in commands}.values())
+    ttl = get_entry_ttl(commands)
+    if ttl <= 0:
+        return
+    try:
+        connection = get_connection()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO answers "
+                "(key, profile, question, answer, commands, created_at, ttl) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    get_cache_key(question, profile, conversation_type),
+                    profile,
+                    question,
+                    answer,
+                    json.dumps(commands),
+                    time.time(),
+                    ttl,
+                ),
+            )
+    except sqlite3.Error as e:
+        log_message("WARNING", f"Error while saving the answer cache: {e}")
+
+
+def refresh_answer(question, profile, conversation_type, entry, on_chunk=None):
+    """Re-run the commands of the cached entry and update the answer with one LLM call.
+
+    The answer is streamed to on_chunk if given. Returns the new answer (also saved
+    to the cache) or None on failure.
+    """
+    from rofehcloud.agent import local_command_executor
+
+    commands = entry["commands"]
+    with span("answer_refresh", commands=len(commands)):
+        # Every command runs in a copy of the caller's context to keep the trace spans;
+        # the command result cache is bypassed, as the outputs must be current
+        contexts = [contextvars.copy_context() for _ in commands]
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(len(commands), config.BATCH_COMMAND_MAX_WORKERS))
+        ) as executor:
+            outputs = list(
+                executor.map(
+                    lambda context, command: context.run(
+                        local_command_executor,
+                        command["command"],
+                        command["directory"],
+                        profile,
+                        use_cache=False,
+                    ),
+                    contexts,
+                    commands,
+                )
+            )
+
+        command_outputs = "\n\n".join(
+            f"### Command {index}: {command['command']} "
+            f"(directory {command['directory']})\n{output}"
+            for index, (command, output) in enumerate(zip(commands, outputs), start=1)
+        )
+        prompt = (
+            "You answered the question below earlier using the outputs of shell "
+            "commands. The commands were executed again, update the answer using "
+            "their current outputs. Keep the format of the previous answer. Do not "
+            "add any comments about the update - just reply with the answer.\n\n"
+            f"Question:\n{question}\n\nPrevious answer:\n{entry['answer']}\n\n"
+            f"Current command outputs:\n{command_outputs or 'No commands were executed.'}"
+        )
+        if on_chunk is not None:
+            answer = call_llm_stream(prompt, config.LLM_TO_USE, on_chunk)
+        else:
+            answer = call_llm(prompt, config.LLM_TO_USE)
+
+    if not answer:
+        log_message("WARNING", "Failed to refresh the cached answer")
+        return None
+    answer = answer.strip()
+    save_answer(question, profile, conversation_type, answer, commands)
+    return answer
@@ -1,75 +1,291 @@
-import subprocess
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from rofehcloud.config import Config as config
 from rofehcloud.logger import log_message
+from rofehcloud.environment_cache import get_cached_value
+from rofehcloud.shell import run_shell_command
 
 
-def get_regions_with_resources():
-    # Get list of all regions
+# Large enough for any listing; the output is only parsed to check for resources
+AWS_COMMAND_MAX_OUTPUT_LENGTH = 100000000
+
+# Service name and the CLI command used to check that the service has resources in a region
+AWS_RESOURCE_PROBES = [
+    ("EC2", "aws ec2 describe-instances --region {region} --output json"),
+    ("RDS", "aws rds describe-db-instances --region {region} --output json"),
+    ("EKS", "aws eks list-clusters --region {region} --output json"),
+    ("ECS", "aws ecs list-clusters --region {region} --output json"),
+    ("DynamoDB", "aws dynamodb list-tables --region {region} --output json"),
+    ("Lambda", "aws lambda list-functions --region {region} --output json"),
+]
+
+
+def get_default_aws_region():
+    def probe_aws_region():
+        return run_shell_command(
+            "aws configure get region", merge_stderr=False, timeout=10
+        )["output"].strip()
+
+    return get_cached_value("aws_region", probe_aws_region) or "us-east-1"
+
+
+def get_all_regions():
     log_message("INFO", "Getting list of all regions")
-    regions = json.loads(
-        subprocess.check_output("aws ec2 describe-regions --output json", shell=True)
-    )
-    region_names = [region["RegionName"] for region in regions["Regions"]]
+    regions = json.loads(run_aws_command("aws ec2 describe-regions --output json"))
+    return [region["RegionName"] for region in regions["Regions"]]
 
-    # List to store regions with resources
-    regions_with_resources = []
 
-    # Check each region for resources in various services
-    for region in region_names:
+def get_regions_with_resources(backend=None, session=None):
+    backend = backend or config.AWS_DISCOVERY_BACKEND
+    if backend not in DISCOVERY_BACKENDS:
         log_message(
-            "INFO",
-            f"Checking region {region} for resources (EC2, RDS, EKS, ECS, DynamoDB, Lambda)",
+            "ERROR",
+            f"Unknown AWS discovery backend {backend}; "
+            f"supported backends: {', '.join(DISCOVERY_BACKENDS)}",
+        )
+        backend = "probes"
+
+    if backend != "probes":
+        import boto3
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            return DISCOVERY_BACKENDS[backend](session or boto3.Session())
+        except (BotoCoreError, ClientError) as e:
+            log_message(
+                "WARNING",
+                f"AWS discovery backend {backend} failed ({e}); "
+                "falling back to per-service probes",
+            )
+
+    return get_regions_with_resources_using_probes()
+
+
+def get_enabled_regions(session):
+    ec2_client = session.client("ec2", region_name=session.region_name or "us-east-1")
+    regions = ec2_client.describe_regions()["Regions"]
+    return [region["RegionName"] for region in regions]
+
+
+def get_regions_with_resources_using_tagging_api(session):
+    """Find regions with resources using one Resource Groups Tagging API query per region.
+
+    The Tagging API covers every taggable service, but it only returns resources
+    that have (or used to have) at least one tag.
+    """
+    region_names = get_enabled_regions(session)
+    log_message(
+        "INFO",
+        f"Checking {len(region_names)} regions for resources using the "
+        "Resource Groups Tagging API",
+    )
+    start_time = time.time()
+
+    # Clients are created upfront because boto3 sessions are not thread-safe
+    clients = {
+        region: session.client("resourcegroupstaggingapi", region_name=region)
+        for region in region_names
+    }
+
+    def region_has_tagged_resources(region):
+        paginator = clients[region].get_paginator("get_resources")
+        for page in paginator.paginate(ResourcesPerPage=100):
+            if page.get("ResourceTagMappingList"):
+                return True
+        return False
+
+    regions_found = set()
+    with ThreadPoolExecutor(max_workers=config.AWS_DISCOVERY_MAX_WORKERS) as executor:
+        futures = {
+            executor.submit(region_has_tagged_resources, region): region
+            for region in region_names
+        }
+        for future in as_completed(futures):
+            region = futures[future]
+            if future.result():
+                log_message("INFO", f"Found tagged resources in region {region}")
+                regions_found.add(region)
+
+    log_message(
+        "INFO",
+        f"Resource discovery finished in {time.time() - start_time:.1f} seconds",
+    )
+    return [region for region in region_names if region in regions_found]
+
+
+def get_regions_with_resources_using_resource_explorer(session):
+    """Find regions with resources using the Resource Explorer aggregator index.
+
+    A single account-wide search is enough unless the search result is capped, in
+    which case the regions not seen yet are checked with one query each.
+    """
+    region_names = get_enabled_regions(session)
+    start_time = time.time()
+
+    client = session.client(
+        "resource-explorer-2", region_name=session.region_name or "us-east-1"
+    )
+    indexes = client.list_indexes(Type="AGGREGATOR").get("Indexes", [])
+    if not indexes:
+        from botocore.exceptions import ClientError
+
+        raise ClientError(
+            {
+                "Error": {
+                    "Code": "ResourceNotFoundException",
+                    "Message": "No Resource Explorer aggregator index found",
+                }
+            },
+            "ListIndexes",
         )
-        resources_found = []
+    aggregator_region = indexes[0]["Region"]
+    log_message(
+        "INFO",
+        f"Searching for resources using the Resource Explorer aggregator index "
+        f"in region {aggregator_region}",
+    )
+
+    client = session.client("resource-explorer-2", region_name=aggregator_region)
+    regions_found = set()
+    search_complete = True
+    for page in client.get_paginator("search").paginate(QueryString=""):
+        for resource in page.get("Resources", []):
+            regions_found.add(resource.get("Region"))
+        search_complete = page.get("Count", {}).get("Complete", True)
+
+    if not search_complete:
+        for region in region_names:
+            if region in regions_found:
+                continue
+            response = client.search(QueryString=f"region:{region}", MaxResults=1)
+            if response.get("Resources"):
+                regions_found.add(region)
+
+    log_message(
+        "INFO",
+        f"Resource discovery finished in {time.time() - start_time:.1f} seconds",
+    )
+    # Global resources are reported with region "global" and are not relevant here
+    return [region for region in region_names if region in regions_found]
+
+
+def get_regions_with_resources_using_probes():
+    region_names = get_all_regions()
+    services = ", ".join(service for service, _ in AWS_RESOURCE_PROBES)
+    log_message(
+        "INFO",
+        f"Checking {len(region_names)} regions for resources ({services}) "
+        f"using up to {config.AWS_DISCOVERY_MAX_WORKERS} parallel workers",
+    )
+
+    start_time = time.time()
+    regions_found = set()
+    pending_probes = {region: len(AWS_RESOURCE_PROBES) for region in region_names}
+    futures_by_region = {region: [] for region in region_names}
+    service_time = {service: 0.0 for service, _ in AWS_RESOURCE_PROBES}
+    probes_executed = 0
+    probes_skipped = 0
+    regions_checked = 0
+
+    def probe(region, service, command):
+        # Another probe may have found resources in the region while this one was queued
+        if region in regions_found:
+            return None, 0.0
+        probe_start_time = time.time()
+        result = has_resources(command.format(region=region))
+        return result, time.time() - probe_start_time
 
-        # Check for EC2 instances
-        if has_resources(f"aws ec2 describe-instances --region {region} --output json"):
-            log_message("INFO", "Found EC2 instances")
-            resources_found.append("EC2")
+    with ThreadPoolExecutor(max_workers=config.AWS_DISCOVERY_MAX_WORKERS) as executor:
+        futures = {}
+        for region in region_names:
+            for service, command in AWS_RESOURCE_PROBES:
+                future = executor.submit(probe, region, service, command)
+                futures[future] = (region, service)
+                futures_by_region[region].append(future)
 
-        # Check for RDS databases
-        if has_resources(
-            f"aws rds describe-db-instances --region {region} --output json"
-        ):
-            log_message("INFO", "Found RDS databases")
-            resources_found.append("RDS")
+        for future in as_completed(futures):
+            region, service = futures[future]
+            if future.cancelled():
+                probes_skipped += 1
+            else:
+                result, elapsed_time = future.result()
+                if result is None:
+                    probes_skipped += 1
+                else:
+                    probes_executed += 1
+                    service_time[service] += elapsed_time
 
-        # Check for EKS clusters
-        if has_resources(f"aws eks list-clusters --region {region} --output json"):
-            log_message("INFO", "Found EKS clusters")
-            resources_found.append("EKS")
+                if result and region not in regions_found:
+                    log_message("INFO", f"Found {service} resources in region {region}")
+                    regions_found.add(region)
+                    # No need to check other services once the region is known to have resources
+                    for other_future in futures_by_region[region]:
+                        other_future.cancel()
+
+            pending_probes[region] -= 1
+            if pending_probes[region] == 0:
+                regions_checked += 1
+                log_message(
+                    "INFO",
+                    f"Progress: {regions_checked}/{len(region_names)} regions checked, "
+                    f"{len(regions_found)} with resources "
+                    f"(elapsed time: {time.time() - start_time:.1f} seconds)",
+                )
+
+    elapsed_time = time.time() - start_time
+    log_message(
+        "INFO",
+        f"Resource discovery finished in {elapsed_time:.1f} seconds: "
+        f"{probes_executed} probes executed, {probes_skipped} skipped",
+    )
+    for service, total_time in service_time.items():
+        log_message(
+            "DEBUG", f"Total time spent probing {service}: {total_time:.1f} seconds"
+        )
 
-        # Check for ECS clusters
-        if has_resources(f"aws ecs list-clusters --region {region} --output json"):
-            log_message("INFO", "Found ECS clusters")
-            resources_found.append("ECS")
+    # Keep the order returned by "aws ec2 describe-regions"
+    return [region for region in region_names if region in regions_found]
 
-        # Check for DynamoDB tables
-        if has_resources(f"aws dynamodb list-tables --region {region} --output json"):
-            log_message("INFO", "Found DynamoDB tables")
-            resources_found.append("DynamoDB")
 
-        # Check for Lambda functions
-        if has_resources(f"aws lambda list-functions --region {region} --output json"):
-            log_message("INFO", "Found Lambda functions")
-            resources_found.append("Lambda")
+class AwsCommandError(Exception):
+    pass
 
-        if resources_found:
-            regions_with_resources.append(region)
 
-    return regions_with_resources
+def run_aws_command(command):
+    result = run_shell_command(
+        command,
+        max_output_length=AWS_COMMAND_MAX_OUTPUT_LENGTH,
+        timeout=config.AWS_DISCOVERY_COMMAND_TIMEOUT,
+        merge_stderr=False,
+    )
+    if result["timed_out"]:
+        raise AwsCommandError(f"Command timed out: {command}")
+    if result["exit_code"] != 0:
+        raise AwsCommandError(
+            f"Command failed with exit code {result['exit_code']}: {command}"
+        )
+    return result["output"]
 
 
 def has_resources(command):
     try:
-        output = subprocess.check_output(command, shell=True)
-        log_message("DEBUG", f"Command output: {output}")
+        output = run_aws_command(command)
+        log_message("DEBUG", "Command output: %s", output)
         data = json.loads(output)
         # Check if any key in the JSON contains a non-empty list
         return any(
             data[key] for key in data if isinstance(data[key], list) and data[key]
         )
-    except subprocess.CalledProcessError:
-        # Handle exceptions, such as no resources found or no permissions
+    except (AwsCommandError, json.JSONDecodeError) as e:
+        # Handle exceptions, such as no resources found, no permissions or timeouts
+        log_message("DEBUG", str(e))
         return False
+
+
+DISCOVERY_BACKENDS = {
+    "tagging": get_regions_with_resources_using_tagging_api,
+    "resource-explorer": get_regions_with_resources_using_resource_explorer,
+    "probes": get_regions_with_resources_using_probes,
+}
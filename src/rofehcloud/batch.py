@@ -0,0 +1,221 @@
+import sys
+import json
+import time
+import uuid
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.chat import (
+    get_heuristic_conversation_label,
+    get_troubleshooting_prompt,
+    save_session,
+)
+from rofehcloud.constants import error_response
+from rofehcloud.answer_cache import get_cached_answer, recording_commands, save_answer
+
+
+# Requests are read as JSON lines, one question or problem per line:
+# {"id": "alert-1", "problem": "Pods of the checkout service are crash-looping"}
+# {"id": "q-1", "question": "Which EC2 instances are stopped?", "label": "Stopped EC2"}
+# A line holding a JSON string is treated as a question.
+
+worker_profile = None
+
+
+def read_batch_requests(input_file):
+    requests = []
+    file = sys.stdin if input_file == "-" else open(input_file, "r")
+    try:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                log_message("ERROR", f"Invalid JSON on line {line_number}: {e}")
+                request = {}
+            if isinstance(request, str):
+                request = {"question": request}
+            if not isinstance(request, dict):
+                request = {}
+            request.setdefault("id", str(line_number))
+            request["index"] = len(requests)
+            requests.append(request)
+    finally:
+        if file is not sys.stdin:
+            file.close()
+    return requests
+
+
+def initialize_worker(profile):
+    global worker_profile
+
+    # Results are written to stdout, so the progress output of the agent goes to stderr
+    sys.stdout = sys.stderr
+    config.NON_INTERACTIVE = True
+
+    from rofehcloud.agent import setup_services
+    from rofehcloud.profile import check_available_tools, read_profile
+
+    profile_data = read_profile(profile)
+    if profile_data is None:
+        raise RuntimeError(f"Profile {profile} not found")
+    if not check_available_tools(profile) or not setup_services(profile_data):
+        raise RuntimeError(f"Failed to initialize the agent for profile {profile}")
+    worker_profile = profile
+
+
+def answer_batch_request(request):
+    from rofehcloud.agent import handle_user_prompt
+
+    troubleshooting = "problem" in request
+    question = request.get("problem") if troubleshooting else request.get("question")
+    result = {
+        "id": request["id"],
+        "index": request["index"],
+        "conversation_type": "troubleshooting" if troubleshooting else "question",
+        "question": question,
+    }
+    if not question or not isinstance(question, str):
+        result["status"] = "error"
+        result["error"] = 'The request must have a "question" or a "problem" string'
+        return result
+
+    session_id = str(uuid.uuid4())
+    conversation_details = {
+        "start_time": datetime.now(),
+        "profile": worker_profile,
+        "session_id": session_id,
+        "conversation_label": request.get("label")
+        or get_heuristic_conversation_label(question),
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "conversation_type": result["conversation_type"],
+        "conversation_history": [],
+    }
+
+    prompt = get_troubleshooting_prompt(question) if troubleshooting else question
+    turn_stats = {}
+    cached_entry = None
+    if config.ANSWER_CACHE_ENABLED:
+        cached_entry = get_cached_answer(
+            question, worker_profile, result["conversation_type"]
+        )
+    if cached_entry is not None:
+        answer = cached_entry["answer"]
+    else:
+        with recording_commands() as executed_commands:
+            answer = handle_user_prompt(
+                worker_profile,
+                prompt,
+                conversation_details["conversation_history"],
+                turn_stats=turn_stats,
+            )
+        if config.ANSWER_CACHE_ENABLED and answer != error_response:
+            save_answer(
+                question,
+                worker_profile,
+                result["conversation_type"],
+                answer,
+                executed_commands,
+            )
+    conversation_details["conversation_history"].append(
+        {"question": question, "answer": answer}
+    )
+
+    result.update(
+        {
+            "status": "error" if answer == error_response else "ok",
+            "session_id": session_id,
+            "answer": answer,
+            "cached": cached_entry is not None,
+            "latency": turn_stats.get("latency"),
+            "time_to_first_token": turn_stats.get("time_to_first_token"),
+            # The ReAct agent makes one LLM call per iteration
+            "iterations": turn_stats.get("llm_calls"),
+            "tool_calls": turn_stats.get("tool_calls"),
+            "prompt_tokens": turn_stats.get("prompt_tokens"),
+            "completion_tokens": turn_stats.get("completion_tokens"),
+        }
+    )
+    if not save_session(conversation_details):
+        result["status"] = "error"
+        result["error"] = f"Error while saving the conversation details ({session_id})"
+    return result
+
+
+def run_batch(profile, input_file="-", output_file="-", workers=None):
+    """Answer the questions of the input file in parallel, one session per question.
+
+    Results are written as JSON lines in the order of completion; the "index" field
+    holds the position of the request in the input file. Returns the exit code.
+    """
+    if workers is None:
+        workers = config.BATCH_MODE_MAX_WORKERS
+
+    try:
+        requests = read_batch_requests(input_file)
+    except OSError as e:
+        log_message("ERROR", f"Error while reading batch requests: {e}")
+        return 1
+    if not requests:
+        log_message("WARNING", "No batch requests to process")
+        return 0
+
+    log_message(
+        "INFO",
+        f"Processing {len(requests)} requests with {workers} worker processes",
+    )
+    start_time = time.time()
+    failed_requests = 0
+    output = sys.stdout if output_file == "-" else open(output_file, "w")
+    try:
+        # Worker processes are started fresh rather than forked, so they do not
+        # inherit open database connections or locks of the parent process
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(requests)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=initialize_worker,
+            initargs=(profile,),
+        ) as executor:
+            futures = {
+                executor.submit(answer_batch_request, request): request
+                for request in requests
+            }
+            for future in as_completed(futures):
+                request = futures[future]
+                try:
+                    result = future.result()
+                except BrokenProcessPool:
+                    log_message(
+                        "ERROR", "Batch worker initialization failed, see errors above"
+                    )
+                    return 1
+                except Exception as e:
+                    log_message(
+                        "ERROR", f"Error while processing request {request['id']}: {e}"
+                    )
+                    result = {
+                        "id": request["id"],
+                        "index": request["index"],
+                        "status": "error",
+                        "error": str(e),
+                    }
+
+                if result["status"] != "ok":
+                    failed_requests += 1
+                output.write(json.dumps(result) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    log_message(
+        "INFO",
+        f"Processed {len(requests)} requests ({failed_requests} failed) "
+        f"in {time.time() - start_time:.2f} seconds",
+    )
+    return 1 if failed_requests else 0
@@ -0,0 +1,183 @@
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+from rich.console import Group
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.text import Text
+
+from rofehcloud import tracing
+from rofehcloud.llm import estimate_tokens
+from rofehcloud.logger import log_message
+
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+OBSERVATION_PREVIEW_MAX_LINES = 10
+
+
+class TurnStatsHandler(BaseCallbackHandler):
+    """Collects timing statistics of a single agent turn."""
+
+    def __init__(self):
+        self.turn_start_time = time.time()
+        self.time_to_first_token = None
+        self.llm_calls = 0
+        self.tool_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.pending_prompt_tokens = 0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.llm_calls += 1
+        self.pending_prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.llm_calls += 1
+        self.pending_prompt_tokens = sum(
+            estimate_tokens(str(message.content))
+            for message_list in messages
+            for message in message_list
+        )
+
+    def on_agent_action(self, action, **kwargs):
+        self.tool_calls += 1
+
+    def record_token_usage(self, response):
+        # Token counts reported by the provider are preferred over the estimates
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        generation = response.generations[0][0] if response.generations else None
+        usage_metadata = getattr(
+            getattr(generation, "message", None), "usage_metadata", None
+        )
+        if usage.get("prompt_tokens"):
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage.get("completion_tokens", 0)
+        elif usage_metadata:
+            self.prompt_tokens += usage_metadata.get("input_tokens", 0)
+            self.completion_tokens += usage_metadata.get("output_tokens", 0)
+        else:
+            self.prompt_tokens += self.pending_prompt_tokens
+            self.completion_tokens += sum(
+                estimate_tokens(generation.text)
+                for generations in response.generations
+                for generation in generations
+            )
+        self.pending_prompt_tokens = 0
+
+    def on_llm_new_token(self, token, **kwargs):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.time() - self.turn_start_time
+            log_message(
+                "DEBUG", f"Time to first token: {self.time_to_first_token:.2f} seconds"
+            )
+
+    def on_llm_end(self, response, **kwargs):
+        # Non-streaming models deliver the whole response at once
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.time() - self.turn_start_time
+        self.record_token_usage(response)
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records the agent's LLM calls and tool executions as trace spans."""
+
+    def __init__(self):
+        self.spans = {}
+
+    def start_span(self, run_id, name, **attributes):
+        self.spans[run_id] = tracing.start_span(name, **attributes)
+
+    def end_span(self, run_id, error=None):
+        span = self.spans.pop(run_id, None)
+        if span is not None:
+            tracing.end_span(span, error)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start_span(
+            run_id, "agent_llm", prompt_chars=sum(len(prompt) for prompt in prompts)
+        )
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start_span(
+            run_id,
+            "agent_llm",
+            prompt_chars=sum(
+                len(str(message.content))
+                for message_list in messages
+                for message in message_list
+            ),
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self.end_span(run_id)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self.end_span(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.start_span(run_id, "tool", tool=(serialized or {}).get("name"))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self.end_span(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self.end_span(run_id, error)
+
+
+class StreamingOutputHandler(BaseCallbackHandler):
+    """Renders the agent's thoughts and the final answer while they are generated."""
+
+    def __init__(self, console):
+        self.console = console
+        self.live = None
+        self.text = ""
+        self.streamed = False
+        self.final_answer_rendered = False
+
+    def render(self):
+        if FINAL_ANSWER_MARKER not in self.text:
+            return Text(self.text, style="dim")
+        thoughts, answer = self.text.split(FINAL_ANSWER_MARKER, 1)
+        return Group(
+            Text(thoughts, style="dim"),
+            Text("Answer:", style="bold"),
+            Markdown(answer.strip()),
+        )
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self.text = ""
+        self.streamed = False
+        self.final_answer_rendered = False
+        self.live = Live(
+            self.render(), console=self.console, refresh_per_second=8, transient=False
+        )
+        self.live.start()
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.streamed = True
+        self.text += token
+        if self.live is not None:
+            self.live.update(self.render())
+
+    def on_llm_end(self, response, **kwargs):
+        if not self.streamed and response.generations and response.generations[0]:
+            self.text = response.generations[0][0].text
+        if self.live is not None:
+            self.live.update(self.render(), refresh=True)
+            self.live.stop()
+            self.live = None
+        self.final_answer_rendered = FINAL_ANSWER_MARKER in self.text
+
+    def on_llm_error(self, error, **kwargs):
+        if self.live is not None:
+            self.live.stop()
+            self.live = None
+
+    def on_tool_end(self, output, **kwargs):
+        lines = str(output).splitlines()
+        preview = "\n".join(lines[:OBSERVATION_PREVIEW_MAX_LINES])
+        if len(lines) > OBSERVATION_PREVIEW_MAX_LINES:
+            preview += (
+                f"\n... ({len(lines) - OBSERVATION_PREVIEW_MAX_LINES} more lines)"
+            )
+        self.console.print(Text("Observation: ", style="bold"), Text(preview))
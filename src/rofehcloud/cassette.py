@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Any, List, Optional
+
+from langchain_core.language_models.llms import LLM
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+# Exchanges are stored in the cassette file as JSON lines:
+# {"kind": "general" | "agent", "key": ..., "prompt": ..., "stop": ..., "response": ...}
+cassette_entries = None
+consumed_entries = set()
+cassette_lock = threading.Lock()
+
+
+def get_exchange_key(kind, prompt, stop=None):
+    data = json.dumps([kind, prompt, stop or []])
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def load_cassette():
+    global cassette_entries
+
+    if cassette_entries is None:
+        cassette_entries = []
+        if os.path.exists(config.CASSETTE_FILE):
+            with open(config.CASSETTE_FILE, "r") as file:
+                cassette_entries = [json.loads(line) for line in file if line.strip()]
+            log_message(
+                "DEBUG",
+                f"Loaded {len(cassette_entries)} LLM exchanges from {config.CASSETTE_FILE}",
+            )
+    return cassette_entries
+
+
+def record_exchange(kind, prompt, response, stop=None):
+    entry = {
+        "kind": kind,
+        "key": get_exchange_key(kind, prompt, stop),
+        "prompt": prompt,
+        "stop": stop,
+        "response": response,
+    }
+    with cassette_lock:
+        load_cassette().append(entry)
+        os.makedirs(
+            os.path.dirname(os.path.abspath(config.CASSETTE_FILE)), exist_ok=True
+        )
+        with open(config.CASSETTE_FILE, "a") as file:
+            file.write(json.dumps(entry) + "\n")
+
+
+def replay_exchange(kind, prompt, stop=None):
+    """Return the recorded response for the prompt.
+
+    Raises ValueError if the exact prompt was not recorded. With
+    CASSETTE_REPLAY_LENIENT (e.g. when a command output in the agent scratchpad
+    differs), the next unused exchange of the same kind is returned instead.
+    Exchanges are replayed once, unless CASSETTE_REPLAY_REUSE is set (by the server
+    mode, so a short recording can serve a load test).
+    """
+    key = get_exchange_key(kind, prompt, stop)
+    with cassette_lock:
+        entries = load_cassette()
+        candidates = [
+            index
+            for index, entry in enumerate(entries)
+            if entry["kind"] == kind and entry["key"] == key
+        ]
+        if not candidates and not config.CASSETTE_REPLAY_LENIENT:
+            raise ValueError(
+                f"No recorded {kind} exchange matches the prompt; set "
+                "CASSETTE_REPLAY_LENIENT=true to replay the next recorded exchange"
+            )
+        if not candidates:
+            kind_entries = [
+                index for index, entry in enumerate(entries) if entry["kind"] == kind
+            ]
+            candidates = [i for i in kind_entries if i not in consumed_entries]
+            if not candidates and kind_entries and config.CASSETTE_REPLAY_REUSE:
+                # All exchanges were replayed; start over
+                consumed_entries.difference_update(kind_entries)
+                candidates = kind_entries
+            if candidates:
+                log_message(
+                    "DEBUG",
+                    f"No recorded {kind} exchange for the prompt; "
+                    f"replaying exchange #{candidates[0]} instead",
+                )
+        if not candidates:
+            log_message("ERROR", f"No more recorded {kind} exchanges to replay")
+            return None
+
+        unused_candidates = [i for i in candidates if i not in consumed_entries]
+        if not unused_candidates and not config.CASSETTE_REPLAY_REUSE:
+            log_message("ERROR", f"No more recorded {kind} exchanges to replay")
+            return None
+        index = unused_candidates[0] if unused_candidates else candidates[-1]
+        consumed_entries.add(index)
+        response = entries[index]["response"]
+
+    if config.CASSETTE_REPLAY_LATENCY_SECONDS > 0:
+        time.sleep(config.CASSETTE_REPLAY_LATENCY_SECONDS)
+    return response
+
+
+class CassetteLLM(LLM):
+    """LangChain LLM that records the agent's LLM exchanges or replays them."""
+
+    recorded_llm: Optional[Any] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "cassette"
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> str:
+        if config.CASSETTE_MODE == "record":
+            response = self.recorded_llm.invoke(prompt, stop=stop)
+            response = getattr(response, "content", response)
+            record_exchange("agent", prompt, response, stop)
+            return response
+
+        response = replay_exchange("agent", prompt, stop)
+        if response is None:
+            raise ValueError("The cassette has no more recorded agent exchanges")
+        return response
@@ -1,28 +1,98 @@
 import os
+import re
 import yaml
+import tzlocal
+import threading
+from datetime import datetime
 
+from rofehcloud import session_store
 from rofehcloud.llm import call_llm
+from rofehcloud.tracing import span
 from rofehcloud.logger import log_message
 from rofehcloud.config import Config as config
 
 
 def get_conversation_label(profile, user_input):
-    convo_label = call_llm(
-        f"For the provided below user prompt, suggest a short (20-30 characters) description "
-        "of the conversation. Do not add any comments - just reply with the "
-        f"description string.\n\n{user_input}",
-        config.LLM_TO_USE,
-    )
+    with span("conversation_label"):
+        convo_label = call_llm(
+            f"For the provided below user prompt, suggest a short (20-30 characters) description "
+            "of the conversation. Do not add any comments - just reply with the "
+            f"description string.\n\n{user_input}",
+            config.LLM_TO_USE,
+        )
 
-    if convo_label is None or convo_label == "":
+    if not convo_label:
         convo_label = "Unknown"
     convo_label = convo_label.strip("\"`'")
     log_message("DEBUG", f"Conversation label: {convo_label}")
     return convo_label
 
 
+def get_heuristic_conversation_label(user_input, max_length=30):
+    # Used until the LLM-generated label is ready: the first words of the prompt
+    words = " ".join(user_input.split()).strip(" .?!")
+    if len(words) <= max_length:
+        return words or "Unknown"
+    label = words[: max_length + 1].rsplit(" ", 1)[0] or words[:max_length]
+    return label.rstrip(" ,.;:") + "..."
+
+
+# Serializes saving of the session by the conversation and by the label generator
+session_save_lock = threading.RLock()
+
+
+def generate_conversation_label_in_background(
+    profile, user_input, conversation_details
+):
+    """Generate the conversation label with the LLM without delaying the answer.
+
+    The label replaces the heuristic label in conversation_details, and in the
+    session record if the session was saved already. If generation fails, the
+    heuristic label is kept.
+    """
+
+    def generate_label():
+        try:
+            label = get_conversation_label(profile, user_input)
+        except Exception as e:
+            log_message("ERROR", f"Error while generating the conversation label: {e}")
+            return
+        if label == "Unknown":
+            return
+
+        with session_save_lock:
+            conversation_details["conversation_label"] = label
+            if conversation_details["conversation_history"]:
+                save_session(conversation_details)
+
+    thread = threading.Thread(target=generate_label, name="label", daemon=True)
+    thread.start()
+    return thread
+
+
+def get_troubleshooting_prompt(problem_description):
+    local_tz = tzlocal.get_localzone()
+    current_time = datetime.now(local_tz)
+    formatted_time = current_time.strftime("%Y-%m-%d %H:%M:%S")
+
+    return (
+        "Using available tools, investigate the alert/issue provided below in XML tag "
+        "<issue_to_investigate>. "
+        "Review all reasonable scenarios "
+        "why the problem could happen. Use available tooling to collect "
+        "necessary debugging information. Perform Root Cause Analysis. "
+        "Suggest remediation steps. "
+        "Using bullet points, mention a summary of taken investigation steps. "
+        f"The current GMT date/time is {formatted_time}.\n\n"
+        f"<issue_to_investigate>{problem_description}</issue_to_investigate>"
+    )
+
+
 def get_conversations_list(profile):
     try:
+        if config.SESSION_STORAGE_BACKEND == "sqlite":
+            return session_store.list_conversations(profile)
+
         session_files = os.listdir(config.SESSION_DIR)
         conversations_list = []
 
@@ -49,6 +119,74 @@ def get_conversations_list(profile):
         return None
 
 
+def search_conversations(profile, query, limit=50):
+    """Return conversations matching all words of the query, best matches first."""
+    try:
+        if config.SESSION_STORAGE_BACKEND == "sqlite":
+            return session_store.search_conversations(profile, query, limit)
+
+        # Session files are scanned; a conversation matches if it has all the words
+        words = re.findall(r"\w+", query.lower())
+        if not words:
+            return []
+        matches = []
+        for session_file in os.listdir(config.SESSION_DIR):
+            session = load_data(f"{config.SESSION_DIR}/{session_file}")
+            if not session or session["profile"] != profile:
+                continue
+            texts = [session.get("conversation_label") or ""] + [
+                f"{turn['question']} {turn['answer']}"
+                for turn in session.get("conversation_history", [])
+            ]
+            text = " ".join(texts).lower()
+            if all(word in text for word in words):
+                matches.append(
+                    {
+                        "session_id": session["session_id"],
+                        "label": session["conversation_label"],
+                        "date": session["date"],
+                        "snippet": " ".join(texts[1][:200].split())
+                        if len(texts) > 1
+                        else "",
+                        "score": sum(text.count(word) for word in words),
+                    }
+                )
+        matches.sort(key=lambda match: match["score"], reverse=True)
+        return matches[:limit]
+
+    except Exception as e:
+        log_message("ERROR", f"Error while searching conversations: {e}")
+        return None
+
+
+def load_session(session_id):
+    log_message("DEBUG", f"Loading session {session_id}")
+    try:
+        if config.SESSION_STORAGE_BACKEND == "sqlite":
+            return session_store.load_conversation(session_id)
+        return load_data(f"{config.SESSION_DIR}/{session_id}.yaml")
+
+    except Exception as e:
+        log_message("ERROR", f"Error while loading session {session_id}: {e}")
+        return None
+
+
+def save_session(conversation_details):
+    session_id = conversation_details["session_id"]
+    log_message("DEBUG", f"Saving session {session_id}")
+    try:
+        with session_save_lock:
+            if config.SESSION_STORAGE_BACKEND == "sqlite":
+                return session_store.save_conversation(conversation_details)
+            return save_data(
+                f"{config.SESSION_DIR}/{session_id}.yaml", conversation_details
+            )
+
+    except Exception as e:
+        log_message("ERROR", f"Error while saving session {session_id}: {e}")
+        return False
+
+
 def load_data(filename):
     log_message("DEBUG", f"Loading data from {filename}")
     try:
@@ -0,0 +1,327 @@
+import os
+import re
+import json
+import time
+import shlex
+import hashlib
+import sqlite3
+import threading
+import subprocess
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.shell import run_shell_command
+
+
+# Every source code repository gets an SQLite database with the trigrams (lowercased
+# 3-character substrings) of its tracked files. A search looks up the files that
+# contain all trigrams of the query and scans only those files for matching lines.
+# The index records the commit it was built for and is updated from the files
+# changed since that commit (committed or not).
+
+index_locks = {}
+index_locks_lock = threading.Lock()
+indexing_threads = {}
+# Time of the last update per repository; searches re-check the working tree for
+# changes at most every CODE_INDEX_REFRESH_SECONDS seconds (or when HEAD moves)
+last_update_times = {}
+
+_local = threading.local()
+
+DEFINITION_KEYWORDS = (
+    "def|class|func|function|interface|type|struct|enum|const|var|let|module|resource"
+)
+
+
+def get_index_file(repo_directory):
+    directory_hash = hashlib.sha1(
+        os.path.abspath(repo_directory).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{config.CODE_INDEX_DIR}/{directory_hash}.db"
+
+
+def get_index_lock(repo_directory):
+    with index_locks_lock:
+        return index_locks.setdefault(os.path.abspath(repo_directory), threading.Lock())
+
+
+def get_connection(repo_directory):
+    # sqlite3 connections cannot be shared between threads, so each thread gets its own
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    index_file = get_index_file(repo_directory)
+    connection = connections.get(index_file)
+    if connection is None:
+        os.makedirs(config.CODE_INDEX_DIR, exist_ok=True)
+        connection = sqlite3.connect(index_file, timeout=30)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    file_id INTEGER PRIMARY KEY,
+                    path TEXT UNIQUE NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS trigrams (
+                    trigram TEXT NOT NULL,
+                    file_id INTEGER NOT NULL,
+                    PRIMARY KEY (trigram, file_id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS trigrams_by_file ON trigrams (file_id);
+                CREATE TABLE IF NOT EXISTS metadata (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+        connections[index_file] = connection
+    return connection
+
+
+def get_metadata(connection, key):
+    row = connection.execute(
+        "SELECT value FROM metadata WHERE key = ?", (key,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def set_metadata(connection, key, value):
+    connection.execute(
+        "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+def run_git_command(repo_directory, arguments):
+    """Return the NUL or newline separated output of the git command, or None on error."""
+    try:
+        result = subprocess.run(
+            ["git", *arguments],
+            cwd=repo_directory,
+            capture_output=True,
+            timeout=config.CODE_INDEX_GIT_TIMEOUT,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        log_message("WARNING", f"Error while running git in {repo_directory}: {e}")
+        return None
+    if result.returncode != 0:
+        log_message(
+            "DEBUG",
+            f"git {' '.join(arguments)} failed in {repo_directory}: "
+            f"{result.stderr.decode('utf-8', errors='replace').strip()}",
+        )
+        return None
+    return result.stdout.decode("utf-8", errors="replace")
+
+
+def get_repo_top_level(repo_directory):
+    # git diff paths are relative to the top level, whatever the working directory
+    top_level = run_git_command(repo_directory, ["rev-parse", "--show-toplevel"])
+    return top_level.strip() if top_level else os.path.abspath(repo_directory)
+
+
+def get_trigrams(text):
+    text = text.lower()
+    return {
+        text[i : i + 3] for i in range(len(text) - 2) if not text[i : i + 3].isspace()
+    }
+
+
+def read_text_file(path):
+    try:
+        if os.path.getsize(path) > config.CODE_INDEX_MAX_FILE_SIZE_BYTES:
+            return None
+        with open(path, "rb") as file:
+            data = file.read()
+    except OSError:
+        return None
+    # Binary files are not indexed
+    if b"\0" in data[:8192]:
+        return None
+    return data.decode("utf-8", errors="replace")
+
+
+def index_file(connection, repo_directory, path):
+    connection.execute(
+        "DELETE FROM trigrams WHERE file_id = "
+        "(SELECT file_id FROM files WHERE path = ?)",
+        (path,),
+    )
+    connection.execute("DELETE FROM files WHERE path = ?", (path,))
+    text = read_text_file(os.path.join(repo_directory, path))
+    if text is None:
+        return
+    file_id = connection.execute(
+        "INSERT INTO files (path) VALUES (?)", (path,)
+    ).lastrowid
+    connection.executemany(
+        "INSERT INTO trigrams (trigram, file_id) VALUES (?, ?)",
+        ((trigram, file_id) for trigram in get_trigrams(text)),
+    )
+
+
+def update_index(repo_directory):
+    """Bring the index of the repository up to date with its working tree.
+
+    The first run indexes all tracked files; later runs re-index only the files
+    changed between the indexed commit and the working tree. Returns True if the
+    index is up to date.
+    """
+    head = run_git_command(repo_directory, ["rev-parse", "HEAD"])
+    if head is None:
+        return False
+    head = head.strip()
+
+    start_time = time.time()
+    connection = get_connection(repo_directory)
+    indexed_commit = get_metadata(connection, "commit")
+    # Uncommitted changes indexed by the previous run (they may have been reverted)
+    previously_dirty_files = json.loads(get_metadata(connection, "dirty_files") or "[]")
+
+    changed_files = None
+    if indexed_commit is not None:
+        changed_files = run_git_command(
+            repo_directory, ["diff", "--name-only", "-z", indexed_commit]
+        )
+    full_rebuild = changed_files is None
+    if full_rebuild:
+        files = run_git_command(repo_directory, ["ls-files", "--full-name", "-z"])
+        if files is None:
+            return False
+        paths = set(filter(None, files.split("\0")))
+    else:
+        paths = set(filter(None, changed_files.split("\0"))) | set(
+            previously_dirty_files
+        )
+
+    dirty_files = run_git_command(repo_directory, ["diff", "--name-only", "-z", "HEAD"])
+    dirty_files = sorted(filter(None, (dirty_files or "").split("\0")))
+    paths |= set(dirty_files)
+
+    with connection:
+        if full_rebuild:
+            connection.execute("DELETE FROM trigrams")
+            connection.execute("DELETE FROM files")
+        for path in paths:
+            index_file(connection, repo_directory, path)
+        set_metadata(connection, "commit", head)
+        set_metadata(connection, "dirty_files", json.dumps(dirty_files))
+    last_update_times[repo_directory] = time.time()
+
+    if full_rebuild or paths:
+        log_message(
+            "INFO",
+            f"Code index of {repo_directory} updated "
+            f"({'full rebuild' if full_rebuild else 'incremental'}, {len(paths)} files) "
+            f"in {time.time() - start_time:.2f} seconds",
+        )
+    return True
+
+
+def build_index_in_background(repo_directory):
+    def build_index():
+        with get_index_lock(repo_directory):
+            try:
+                update_index(repo_directory)
+            except Exception as e:
+                log_message(
+                    "WARNING", f"Error while indexing repository {repo_directory}: {e}"
+                )
+
+    repo_directory = get_repo_top_level(repo_directory)
+    thread = indexing_threads.get(repo_directory)
+    if thread is not None and thread.is_alive():
+        return
+    thread = threading.Thread(
+        target=build_index, name=f"code-index-{repo_directory}", daemon=True
+    )
+    indexing_threads[repo_directory] = thread
+    thread.start()
+
+
+def get_match_score(query, line, path):
+    score = 0
+    if re.search(
+        rf"\b({DEFINITION_KEYWORDS})\s+{re.escape(query)}\b", line, re.IGNORECASE
+    ):
+        score += 4
+    if query in line:
+        score += 2
+    if query.lower() in os.path.basename(path).lower():
+        score += 1
+    return score
+
+
+def find_candidate_files(connection, trigrams):
+    placeholders = ",".join("?" * len(trigrams))
+    rows = connection.execute(
+        f"SELECT files.path FROM trigrams JOIN files USING (file_id) "
+        f"WHERE trigram IN ({placeholders}) "
+        "GROUP BY file_id HAVING COUNT(*) = ?",
+        (*trigrams, len(trigrams)),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def search_with_git_grep(repo_directory, query):
+    # Used while the index is being built and for queries shorter than a trigram
+    result = run_shell_command(
+        shlex.join(["git", "grep", "-n", "-I", "-i", "-F", "-e", query]),
+        repo_directory,
+        config.COMMAND_OUTPUT_MAX_LENGTH_CHARS,
+    )
+    return result["output"] or "No matches found"
+
+
+def search_code(repo_directory, query):
+    """Return ranked path:line hits of the query (a case-insensitive literal string)."""
+    repo_directory = get_repo_top_level(repo_directory)
+    query = query.strip().strip("'\"")
+    if not query:
+        return "The search query is empty"
+
+    trigrams = get_trigrams(query)
+    lock = get_index_lock(repo_directory)
+    if not trigrams or not lock.acquire(blocking=False):
+        return search_with_git_grep(repo_directory, query)
+    try:
+        connection = get_connection(repo_directory)
+        indexed_commit = get_metadata(connection, "commit")
+        if indexed_commit is None:
+            return search_with_git_grep(repo_directory, query)
+        if (
+            time.time() - last_update_times.get(repo_directory, 0)
+            > config.CODE_INDEX_REFRESH_SECONDS
+            or (run_git_command(repo_directory, ["rev-parse", "HEAD"]) or "").strip()
+            != indexed_commit
+        ) and not update_index(repo_directory):
+            return search_with_git_grep(repo_directory, query)
+        candidate_files = find_candidate_files(connection, sorted(trigrams))
+    finally:
+        lock.release()
+
+    query_lower = query.lower()
+    hits = []
+    for path in candidate_files:
+        text = read_text_file(os.path.join(repo_directory, path))
+        if text is None:
+            continue
+        for line_number, line in enumerate(text.splitlines(), start=1):
+            if query_lower in line.lower():
+                hits.append(
+                    (-get_match_score(query, line, path), path, line_number, line)
+                )
+
+    if not hits:
+        return "No matches found"
+    hits.sort()
+    max_results = config.CODE_INDEX_MAX_RESULTS
+    lines = [
+        f"{path}:{line_number}: {line.strip()[:200]}"
+        for _, path, line_number, line in hits[:max_results]
+    ]
+    summary = f"{len(hits)} matches in {len(set(hit[1] for hit in hits))} files"
+    if len(hits) > max_results:
+        summary += f" (the best {max_results} are shown)"
+    return summary + "\n" + "\n".join(lines)
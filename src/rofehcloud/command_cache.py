@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import hashlib
+import shlex
+import threading
+import subprocess
+from collections import OrderedDict
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.safety import SAFE, classify_command, get_cached_verdict, split_pipeline
+
+
+cache_entries = OrderedDict()
+cache_size_chars = 0
+cache_lock = threading.Lock()
+
+cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def get_command_ttl(command):
+    # A pipeline is cached for the shortest TTL of the tools it uses
+    ttls = config.COMMAND_RESULT_CACHE_TTLS
+    segments = split_pipeline(command) or []
+    tool_ttls = [
+        ttls[os.path.basename(segment[0])]
+        for segment in segments
+        if os.path.basename(segment[0]) in ttls
+    ]
+    return min(tool_ttls) if tool_ttls else ttls.get("default", 0)
+
+
+def normalize_command(command):
+    try:
+        return shlex.join(shlex.split(command))
+    except ValueError:
+        return " ".join(command.split())
+
+
+def run_git_command(local_directory, arguments):
+    try:
+        result = subprocess.run(
+            ["git", *arguments],
+            capture_output=True,
+            text=True,
+            cwd=local_directory,
+            timeout=5,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout if result.returncode == 0 else None
+
+
+def get_file_state(path):
+    try:
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+
+def get_git_state(local_directory):
+    """Return a hash of HEAD, the index and the changed files of the working tree."""
+    repository_info = run_git_command(
+        local_directory, ["rev-parse", "--show-toplevel", "HEAD", "--git-path", "index"]
+    )
+    if repository_info is None:
+        return None
+    top_level, head, index_path = repository_info.splitlines()
+    status = run_git_command(
+        local_directory,
+        ["--no-optional-locks", "status", "--porcelain", "-z", "--untracked-files=all"],
+    )
+    if status is None:
+        return None
+    # Editing an already modified file does not change the status, its mtime does
+    changed_files = [
+        get_file_state(os.path.join(top_level, entry[3:]))
+        for entry in status.split("\0")
+        if entry
+    ]
+    state = [
+        head,
+        get_file_state(os.path.join(local_directory, index_path)),
+        status,
+        changed_files,
+    ]
+    return hashlib.sha256(json.dumps(state).encode("utf-8")).hexdigest()
+
+
+def get_cache_key(command, local_directory, profile, max_output_length):
+    # The output is cut (or reduced) to the limit of the caller, e.g. the share of
+    # a batch, so outputs for different limits are cached separately
+    key = (normalize_command(command), local_directory, profile, max_output_length)
+    # Results of git commands are valid while HEAD and the working tree do not change
+    if any(
+        os.path.basename(segment[0]) == "git"
+        for segment in split_pipeline(command) or []
+    ):
+        key += (get_git_state(local_directory),)
+    return key
+
+
+def is_cacheable(command):
+    # Only read-only commands are cached, so cache hits never skip a change
+    if not config.COMMAND_RESULT_CACHE_ENABLED or get_command_ttl(command) <= 0:
+        return False
+    return classify_command(command) == SAFE or get_cached_verdict(command) == SAFE
+
+
+def get_cached_result(command, local_directory, profile, max_output_length):
+    if not is_cacheable(command):
+        return None
+
+    key = get_cache_key(command, local_directory, profile, max_output_length)
+    with cache_lock:
+        entry = cache_entries.get(key)
+        if entry is None or time.time() > entry["expires_at"]:
+            cache_stats["misses"] += 1
+            return None
+        cache_entries.move_to_end(key)
+        cache_stats["hits"] += 1
+
+    age = int(time.time() - entry["created_at"])
+    log_message("DEBUG", f"Command result cache hit ({age} seconds old): {command}")
+    return f"(cached result from {age} seconds ago)\n{entry['output']}"
+
+
+def save_result(command, local_directory, profile, max_output_length, output):
+    global cache_size_chars
+
+    if not is_cacheable(command):
+        return
+
+    key = get_cache_key(command, local_directory, profile, max_output_length)
+    now = time.time()
+    with cache_lock:
+        if key in cache_entries:
+            cache_size_chars -= len(cache_entries.pop(key)["output"])
+        cache_entries[key] = {
+            "output": output,
+            "created_at": now,
+            "expires_at": now + get_command_ttl(command),
+        }
+        cache_size_chars += len(output)
+
+        while cache_entries and (
+            len(cache_entries) > config.COMMAND_RESULT_CACHE_MAX_ENTRIES
+            or cache_size_chars > config.COMMAND_RESULT_CACHE_MAX_SIZE_CHARS
+        ):
+            _, evicted_entry = cache_entries.popitem(last=False)
+            cache_size_chars -= len(evicted_entry["output"])
+            cache_stats["evictions"] += 1
@@ -7,11 +7,17 @@ load_dotenv(".env")
 
 class Config:
     LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+    # "text" or "json" (one JSON object per log record)
+    LOG_FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
 
     APP_DATA_DIR = os.path.expanduser(os.environ.get("APP_DATA_DIR", "~/.rofehcloud"))
     SESSION_DIR = f"{APP_DATA_DIR}/sessions"
     PROFILES_DIR = f"{APP_DATA_DIR}/profiles"
 
+    # Session storage backend: sqlite or yaml (one file per session in SESSION_DIR)
+    SESSION_STORAGE_BACKEND = os.environ.get("SESSION_STORAGE_BACKEND", "sqlite")
+    SESSION_DB_FILE = f"{APP_DATA_DIR}/sessions.db"
+
     # OpenAI-related settings
     OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
 
@@ -79,11 +85,159 @@ class Config:
         os.environ.get("BEDROCK_MAX_RESPONSE_TOKENS", 4096)
     )
 
+    # Settings shared by the clients used for general (non-agent) LLM calls
+    LLM_REQUEST_TIMEOUT = float(os.environ.get("LLM_REQUEST_TIMEOUT", 300))
+    # Ollama retries only failed connections; Gemini calls are not retried
+    LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 2))
+    LLM_MAX_POOL_CONNECTIONS = int(os.environ.get("LLM_MAX_POOL_CONNECTIONS", 10))
+
+    STREAM_LLM_RESPONSES = (
+        os.environ.get("STREAM_LLM_RESPONSES", "true").lower() == "true"
+    )
+
+    # Tracing of LLM calls, tool executions and safety checks: spans are written to
+    # TRACE_FILE as JSON lines ("jsonl") or OTLP/JSON ("otlp")
+    TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "false").lower() == "true"
+    TRACE_EXPORT_FORMAT = os.environ.get("TRACE_EXPORT_FORMAT", "jsonl").lower()
+    TRACE_FILE = os.path.expanduser(
+        os.environ.get("TRACE_FILE", f"{APP_DATA_DIR}/traces.jsonl")
+    )
+    TRACE_SHOW_WATERFALL = (
+        os.environ.get("TRACE_SHOW_WATERFALL", "false").lower() == "true"
+    )
+
+    # Token budget of the conversation history replayed to the agent, per LLM
+    # ("default" applies to the others; 0 disables summarization). Older turns are
+    # summarized, while the last HISTORY_VERBATIM_TURNS turns are kept verbatim
+    HISTORY_TOKEN_BUDGETS = {
+        llm.strip(): int(budget)
+        for llm, budget in (
+            item.split("=")
+            for item in os.environ.get(
+                "HISTORY_TOKEN_BUDGETS", "default=16000,ollama=4000"
+            ).split(",")
+            if item
+        )
+    }
+    HISTORY_VERBATIM_TURNS = int(os.environ.get("HISTORY_VERBATIM_TURNS", 3))
+
     AGENT_MAX_ITERATIONS = int(os.environ.get("AGENT_MAX_ITERATIONS", 30))
     COMMAND_OUTPUT_MAX_LENGTH_CHARS = int(
         os.environ.get("COMMAND_OUTPUT_MAX_LENGTH_CHARS", 10000)
     )
 
+    # JSON/YAML command output is reduced (noise fields removed, lists of similar
+    # objects converted to tables, minified) before it is cut to
+    # COMMAND_OUTPUT_MAX_LENGTH_CHARS; for commands requesting JSON/YAML output (or
+    # piping it to jq) up to COMMAND_OUTPUT_REDUCER_MAX_INPUT_CHARS characters of
+    # output are captured for the reduction
+    COMMAND_OUTPUT_REDUCER_ENABLED = (
+        os.environ.get("COMMAND_OUTPUT_REDUCER_ENABLED", "true").lower() == "true"
+    )
+    COMMAND_OUTPUT_REDUCER_DISABLED_TOOLS = [
+        tool.strip()
+        for tool in os.environ.get("COMMAND_OUTPUT_REDUCER_DISABLED_TOOLS", "").split(
+            ","
+        )
+        if tool.strip()
+    ]
+    COMMAND_OUTPUT_REDUCER_MAX_INPUT_CHARS = int(
+        os.environ.get("COMMAND_OUTPUT_REDUCER_MAX_INPUT_CHARS", 500000)
+    )
+    COMMAND_OUTPUT_REDUCER_NOISE_FIELDS = set(
+        os.environ.get(
+            "COMMAND_OUTPUT_REDUCER_NOISE_FIELDS",
+            "managedFields,kubectl.kubernetes.io/last-applied-configuration,"
+            "resourceVersion,selfLink,ResponseMetadata",
+        ).split(",")
+    )
+
+    # AWS resource discovery backend: probes, tagging or resource-explorer
+    AWS_DISCOVERY_BACKEND = os.environ.get("AWS_DISCOVERY_BACKEND", "probes")
+    AWS_DISCOVERY_MAX_WORKERS = int(os.environ.get("AWS_DISCOVERY_MAX_WORKERS", 16))
+    AWS_DISCOVERY_COMMAND_TIMEOUT = int(
+        os.environ.get("AWS_DISCOVERY_COMMAND_TIMEOUT", 60)
+    )
+
+    # What to do with the command output beyond COMMAND_OUTPUT_MAX_LENGTH_CHARS:
+    # "terminate" the command or "drain" the rest of the output to a temporary file
+    # (temporary files are removed when RofehCloud exits)
+    COMMAND_OUTPUT_OVERFLOW_MODE = os.environ.get(
+        "COMMAND_OUTPUT_OVERFLOW_MODE", "terminate"
+    ).lower()
+    COMMAND_OUTPUT_TAIL_WINDOW_CHARS = int(
+        os.environ.get("COMMAND_OUTPUT_TAIL_WINDOW_CHARS", 1000)
+    )
+
+    # Wall-clock limit for a single command; per-tool overrides like "kubectl=60,aws=120"
+    COMMAND_TIMEOUT_SECONDS = int(os.environ.get("COMMAND_TIMEOUT_SECONDS", 120))
+    COMMAND_TIMEOUTS = {
+        tool.strip(): int(timeout)
+        for tool, timeout in (
+            item.split("=")
+            for item in os.environ.get("COMMAND_TIMEOUTS", "").split(",")
+            if item
+        )
+    }
+
+    # Number of worker processes answering questions in the command (batch) mode
+    BATCH_MODE_MAX_WORKERS = int(os.environ.get("BATCH_MODE_MAX_WORKERS", 4))
+
+    # HTTP API server (--mode server)
+    SERVER_HOST = os.environ.get("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.environ.get("SERVER_PORT", 8080))
+    SERVER_MAX_WORKERS = int(os.environ.get("SERVER_MAX_WORKERS", 8))
+    SERVER_MAX_IN_FLIGHT_REQUESTS = int(
+        os.environ.get("SERVER_MAX_IN_FLIGHT_REQUESTS", 16)
+    )
+
+    # Set at run time by the command (batch) and server modes: commands that need a
+    # user confirmation are denied instead of prompting
+    NON_INTERACTIVE = False
+
+    BATCH_COMMAND_MAX_COMMANDS = int(os.environ.get("BATCH_COMMAND_MAX_COMMANDS", 8))
+    BATCH_COMMAND_MAX_WORKERS = int(os.environ.get("BATCH_COMMAND_MAX_WORKERS", 8))
+
+    # Opt-in cache of read-only command results; TTLs (in seconds) are set per tool
+    COMMAND_RESULT_CACHE_ENABLED = (
+        os.environ.get("COMMAND_RESULT_CACHE_ENABLED", "false").lower() == "true"
+    )
+    COMMAND_RESULT_CACHE_TTLS = {
+        tool.strip(): int(ttl)
+        for tool, ttl in (
+            item.split("=")
+            for item in os.environ.get(
+                "COMMAND_RESULT_CACHE_TTLS",
+                "default=60,kubectl=15,aws=120,gcloud=120,az=120,git=3600",
+            ).split(",")
+            if item
+        )
+    }
+    COMMAND_RESULT_CACHE_MAX_ENTRIES = int(
+        os.environ.get("COMMAND_RESULT_CACHE_MAX_ENTRIES", 200)
+    )
+    COMMAND_RESULT_CACHE_MAX_SIZE_CHARS = int(
+        os.environ.get("COMMAND_RESULT_CACHE_MAX_SIZE_CHARS", 5000000)
+    )
+
+    # Opt-in cache of answers to the first question of a conversation; an answer is
+    # valid for the shortest TTL (in seconds) of the tools used to produce it
+    ANSWER_CACHE_ENABLED = (
+        os.environ.get("ANSWER_CACHE_ENABLED", "false").lower() == "true"
+    )
+    ANSWER_CACHE_TTLS = {
+        tool.strip(): int(ttl)
+        for tool, ttl in (
+            item.split("=")
+            for item in os.environ.get(
+                "ANSWER_CACHE_TTLS",
+                "default=900,kubectl=300,aws=900,gcloud=900,az=900,git=3600",
+            ).split(",")
+            if item
+        )
+    }
+    ANSWER_CACHE_FILE = f"{APP_DATA_DIR}/answer_cache.db"
+
     OLLAMA_ENDPOINT_URL = os.environ.get(
         "OLLAMA_ENDPOINT_URL", "http://localhost:11434"
     )
@@ -99,10 +253,66 @@ class Config:
 
     LLM_TO_USE = os.environ.get("LLM_TO_USE", "openai")
 
+    # Record/replay LLM backend (LLM_TO_USE=cassette) for offline testing and benchmarks
+    CASSETTE_MODE = os.environ.get("CASSETTE_MODE", "replay").lower()
+    CASSETTE_FILE = os.path.expanduser(
+        os.environ.get("CASSETTE_FILE", f"{APP_DATA_DIR}/cassette.jsonl")
+    )
+    CASSETTE_RECORDED_LLM = os.environ.get("CASSETTE_RECORDED_LLM", "openai")
+    CASSETTE_REPLAY_LATENCY_SECONDS = float(
+        os.environ.get("CASSETTE_REPLAY_LATENCY_SECONDS", 0)
+    )
+    # Replay the next recorded exchange for prompts that were not recorded exactly,
+    # instead of failing
+    CASSETTE_REPLAY_LENIENT = (
+        os.environ.get("CASSETTE_REPLAY_LENIENT", "false").lower() == "true"
+    )
+    # Replay the recorded exchanges again once all of them were used (set by the
+    # server mode for load tests)
+    CASSETTE_REPLAY_REUSE = False
+
     ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS = os.environ.get(
         "ALLOW_POTENTIALLY_RISKY_LLM_COMMANDS", "ask"
     ).lower()
 
+    # LLM verdicts for commands not covered by the built-in safety rules
+    COMMAND_SAFETY_CACHE_FILE = f"{APP_DATA_DIR}/command_safety_cache.json"
+
+    # Local snapshot of AWS resources (EC2, ELB, RDS, EKS, Lambda) of the profile
+    # regions, collected in the background and queried by the agent with SQL; a
+    # service is re-collected when its data is older than its TTL (in seconds)
+    INVENTORY_ENABLED = os.environ.get("INVENTORY_ENABLED", "false").lower() == "true"
+    INVENTORY_DIR = f"{APP_DATA_DIR}/inventory"
+    INVENTORY_TTLS = {
+        service.strip(): int(ttl)
+        for service, ttl in (
+            item.split("=")
+            for item in os.environ.get(
+                "INVENTORY_TTLS", "default=900,ec2=300,eks=1800,lambda=1800"
+            ).split(",")
+            if item
+        )
+    }
+    INVENTORY_QUERY_MAX_ROWS = int(os.environ.get("INVENTORY_QUERY_MAX_ROWS", 200))
+
+    # Trigram indexes of the source code repositories of the profile, built in the
+    # background and used by the code search tools
+    CODE_INDEX_ENABLED = os.environ.get("CODE_INDEX_ENABLED", "false").lower() == "true"
+    CODE_INDEX_DIR = f"{APP_DATA_DIR}/code_index"
+    CODE_INDEX_MAX_FILE_SIZE_BYTES = int(
+        os.environ.get("CODE_INDEX_MAX_FILE_SIZE_BYTES", 1000000)
+    )
+    CODE_INDEX_MAX_RESULTS = int(os.environ.get("CODE_INDEX_MAX_RESULTS", 50))
+    CODE_INDEX_REFRESH_SECONDS = int(os.environ.get("CODE_INDEX_REFRESH_SECONDS", 30))
+    CODE_INDEX_GIT_TIMEOUT = int(os.environ.get("CODE_INDEX_GIT_TIMEOUT", 60))
+
+    # Results of environment probes (available tools, the default AWS region, the
+    # platform), reused until PATH, the tools, the AWS config or the profiles change
+    ENVIRONMENT_CACHE_ENABLED = (
+        os.environ.get("ENVIRONMENT_CACHE_ENABLED", "true").lower() == "true"
+    )
+    ENVIRONMENT_CACHE_FILE = f"{APP_DATA_DIR}/environment_cache.json"
+
     ASK_FOR_USER_CONFIRMATION_BEFORE_EXECUTING_EACH_COMMAND = (
         os.environ.get(
             "ASK_FOR_USER_CONFIRMATION_BEFORE_EXECUTING_EACH_COMMAND", "false"
@@ -149,20 +359,39 @@ class Config:
             "bedrock",
             "ollama",
             "gemini",
+            "cassette",
         ]:
             print(
                 f"ERROR: Invalid value for LLM_TO_USE: {self.LLM_TO_USE}. Must be one "
-                "of 'openai', 'azure-openai', 'ollama', or 'bedrock'."
+                "of 'openai', 'azure-openai', 'ollama', 'bedrock', 'gemini' or 'cassette'."
             )
             exit(1)
 
+        llm_to_use = self.LLM_TO_USE
+        if self.LLM_TO_USE == "cassette":
+            if self.CASSETTE_MODE not in ["record", "replay"]:
+                print(
+                    f"ERROR: Invalid value for CASSETTE_MODE: {self.CASSETTE_MODE}. "
+                    "Must be one of 'record' or 'replay'."
+                )
+                exit(1)
+            if self.CASSETTE_MODE == "replay" and not os.path.exists(
+                self.CASSETTE_FILE
+            ):
+                print(f"ERROR: Cassette file {self.CASSETTE_FILE} not found.")
+                exit(1)
+            # Recording needs the settings of the LLM that is recorded
+            llm_to_use = (
+                self.CASSETTE_RECORDED_LLM if self.CASSETTE_MODE == "record" else None
+            )
+
         # Check that all required variables are set; list missing environment variables before raising an exception
-        if self.LLM_TO_USE == "openai":
+        if llm_to_use == "openai":
             required_vars = [
                 "OPENAI_API_KEY",
             ]
 
-        if self.LLM_TO_USE == "azure-openai":
+        if llm_to_use == "azure-openai":
             required_vars = [
                 "AZURE_OPENAI_API_KEY",
                 "AZURE_OPENAI_DEPLOYMENT_ID",
@@ -170,7 +399,7 @@ class Config:
             ]
 
         # Add Gemini validation
-        if self.LLM_TO_USE == "gemini":
+        if llm_to_use == "gemini":
             required_vars.append("GOOGLE_API_KEY")
 
         missing_vars = [var for var in required_vars if not os.environ.get(var)]
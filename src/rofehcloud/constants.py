@@ -7,7 +7,7 @@ Use the following format:
 
 Question: the input question you must answer
 Thought: you should always think about what to do. Do you need to take an action? If not, skip to Final Answer.
-Action: the name of the action to take, should be one of [{{tool_names}}]
+Action: the name of the action to take, should be one of [{tool_names}]
 Action Input: the input to the action
 Observation: the result of the action
 ... (this Thought/Action/Action Input/Observation can repeat N times)
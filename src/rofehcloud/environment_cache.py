@@ -0,0 +1,111 @@
+import os
+import glob
+import json
+import hashlib
+import threading
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+# Results of environment probes (tool paths, the default AWS region, the platform)
+# are kept between runs. They are discarded when the fingerprint of the environment
+# they depend on changes.
+environment_cache = None
+environment_cache_lock = threading.RLock()
+
+AWS_ENVIRONMENT_VARIABLES = [
+    "AWS_PROFILE",
+    "AWS_REGION",
+    "AWS_DEFAULT_REGION",
+    "AWS_CONFIG_FILE",
+]
+
+
+def get_file_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def get_environment_fingerprint(tool_paths=None):
+    path_directories = os.environ.get("PATH", "").split(os.pathsep)
+    aws_config_file = os.environ.get("AWS_CONFIG_FILE", "~/.aws/config")
+    fingerprint_data = {
+        "path": os.environ.get("PATH", ""),
+        # Installing a new tool changes the modification time of its directory
+        "path_directories": [get_file_mtime(path) for path in path_directories],
+        "tools": config.STANDARD_TOOLS
+        + config.CLOUD_CLI_TOOLS
+        + config.ADDITIONAL_TOOLS,
+        "tool_binaries": {
+            tool: get_file_mtime(path)
+            for tool, path in (tool_paths or {}).items()
+            if path
+        },
+        "aws_config": get_file_mtime(os.path.expanduser(aws_config_file)),
+        "aws_environment": [os.environ.get(name) for name in AWS_ENVIRONMENT_VARIABLES],
+        "profiles": {
+            profile_file: get_file_mtime(profile_file)
+            for profile_file in sorted(glob.glob(f"{config.PROFILES_DIR}/*.yaml"))
+        },
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint_data, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def load_environment_cache():
+    global environment_cache
+
+    if environment_cache is None:
+        environment_cache = {}
+        try:
+            with open(config.ENVIRONMENT_CACHE_FILE, "r") as file:
+                data = json.load(file)
+            values = data.get("values", {})
+            if data.get("fingerprint") == get_environment_fingerprint(
+                values.get("tool_paths")
+            ):
+                environment_cache = values
+            else:
+                log_message("DEBUG", "The environment has changed, probing it again")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            log_message("WARNING", f"Error while reading the environment cache: {e}")
+    return environment_cache
+
+
+def save_environment_cache(values):
+    data = {
+        "fingerprint": get_environment_fingerprint(values.get("tool_paths")),
+        "values": values,
+    }
+    temporary_file = f"{config.ENVIRONMENT_CACHE_FILE}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_file, "w") as file:
+            json.dump(data, file, indent=2)
+        os.replace(temporary_file, config.ENVIRONMENT_CACHE_FILE)
+    except OSError as e:
+        log_message("WARNING", f"Error while saving the environment cache: {e}")
+
+
+def get_cached_value(key, probe):
+    """Return the cached result of the probe, running the probe on a cache miss."""
+    if not config.ENVIRONMENT_CACHE_ENABLED:
+        return probe()
+
+    with environment_cache_lock:
+        values = load_environment_cache()
+        if key in values:
+            log_message("DEBUG", f"Using the cached environment probe result: {key}")
+            return values[key]
+
+    # Probes of different keys may run concurrently (e.g. during the startup)
+    value = probe()
+    with environment_cache_lock:
+        values[key] = value
+        save_environment_cache(values)
+    return value
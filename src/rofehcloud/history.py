@@ -0,0 +1,92 @@
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.llm import call_llm, estimate_tokens
+from rofehcloud.tracing import span
+
+
+# Older turns of long conversations are folded into a running summary stored in the
+# conversation details:
+# "history_summary": {"text": <summary>, "turns": <number of summarized turns>}
+
+
+def get_history_token_budget():
+    budgets = config.HISTORY_TOKEN_BUDGETS
+    return budgets.get(config.LLM_TO_USE, budgets.get("default", 0))
+
+
+def get_turn_tokens(turn):
+    return estimate_tokens(turn["question"]) + estimate_tokens(turn["answer"])
+
+
+def summarize_turns(previous_summary, turns):
+    conversation = "\n\n".join(
+        f"User: {turn['question']}\nAssistant: {turn['answer']}" for turn in turns
+    )
+    prompt = (
+        "Summarize the conversation below between a user and a cloud troubleshooting "
+        "assistant. Keep the facts needed to continue the investigation: resource "
+        "names, identifiers, regions, error messages, findings, conclusions and "
+        "open questions. Do not add any comments - just reply with the summary."
+    )
+    if previous_summary:
+        prompt += (
+            "\n\nThe summary of the earlier part of the conversation (merge it into "
+            f"the new summary):\n{previous_summary}"
+        )
+    prompt += f"\n\nThe conversation:\n{conversation}"
+
+    with span("history_summary", turns=len(turns)):
+        summary = call_llm(prompt, config.LLM_TO_USE)
+    if not summary:
+        return None
+    return summary.strip()
+
+
+def get_history_for_prompt(conversation_details):
+    """Return the summary of older turns and the turns to replay verbatim.
+
+    While the history fits into the token budget of the LLM, all turns after the
+    stored summary are replayed verbatim. Otherwise the turns before the last
+    HISTORY_VERBATIM_TURNS ones are folded into the summary, which is saved in
+    conversation_details, so it is not recomputed when the conversation continues.
+    """
+    history = conversation_details["conversation_history"]
+    summary = conversation_details.get("history_summary") or {"text": "", "turns": 0}
+    recent_turns = history[summary["turns"] :]
+
+    budget = get_history_token_budget()
+    if budget <= 0:
+        return summary["text"], recent_turns
+
+    turn_tokens = [get_turn_tokens(turn) for turn in recent_turns]
+    total_tokens = estimate_tokens(summary["text"]) + sum(turn_tokens)
+    if total_tokens <= budget:
+        return summary["text"], recent_turns
+
+    # Keep the last turns verbatim (fewer of them if they alone exceed the budget)
+    verbatim_turns = min(config.HISTORY_VERBATIM_TURNS, len(recent_turns))
+    while verbatim_turns > 1 and sum(turn_tokens[-verbatim_turns:]) > budget:
+        verbatim_turns -= 1
+    turns_to_fold = recent_turns[: len(recent_turns) - verbatim_turns]
+    if not turns_to_fold:
+        return summary["text"], recent_turns
+
+    log_message(
+        "DEBUG",
+        "Conversation history has about %s tokens (budget %s); summarizing %s turns",
+        total_tokens,
+        budget,
+        len(turns_to_fold),
+    )
+    summary_text = summarize_turns(summary["text"], turns_to_fold)
+    if summary_text is None:
+        log_message(
+            "WARNING", "Failed to summarize the conversation history, using it as is"
+        )
+        return summary["text"], recent_turns
+
+    conversation_details["history_summary"] = {
+        "text": summary_text,
+        "turns": summary["turns"] + len(turns_to_fold),
+    }
+    return summary_text, recent_turns[len(turns_to_fold) :]
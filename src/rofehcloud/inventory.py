@@ -0,0 +1,422 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+# A local snapshot of the AWS resources of a profile, one SQLite database per profile.
+# Every (service, region) pair is collected separately and refreshed when it is older
+# than its INVENTORY_TTLS value, so a refresh only re-lists the stale services.
+
+inventory_locks = {}
+inventory_locks_lock = threading.Lock()
+refresh_threads = {}
+
+_local = threading.local()
+
+
+def get_tag(tags, key):
+    for tag in tags or []:
+        if tag.get("Key") == key:
+            return tag.get("Value")
+    return None
+
+
+def collect_ec2_instances(client):
+    rows = []
+    for page in client.get_paginator("describe_instances").paginate():
+        for reservation in page.get("Reservations", []):
+            for instance in reservation.get("Instances", []):
+                rows.append(
+                    {
+                        "resource_type": "instance",
+                        "resource_id": instance["InstanceId"],
+                        "name": get_tag(instance.get("Tags"), "Name"),
+                        "state": instance.get("State", {}).get("Name"),
+                        "details": {
+                            "instance_type": instance.get("InstanceType"),
+                            "private_ip": instance.get("PrivateIpAddress"),
+                            "public_ip": instance.get("PublicIpAddress"),
+                            "vpc_id": instance.get("VpcId"),
+                            "subnet_id": instance.get("SubnetId"),
+                            "launch_time": instance.get("LaunchTime"),
+                            "tags": {
+                                tag["Key"]: tag.get("Value")
+                                for tag in instance.get("Tags", [])
+                            },
+                        },
+                    }
+                )
+    return rows
+
+
+def collect_load_balancers(client):
+    rows = []
+    for page in client.get_paginator("describe_load_balancers").paginate():
+        for load_balancer in page.get("LoadBalancers", []):
+            rows.append(
+                {
+                    "resource_type": "load-balancer",
+                    "resource_id": load_balancer["LoadBalancerArn"],
+                    "name": load_balancer.get("LoadBalancerName"),
+                    "state": load_balancer.get("State", {}).get("Code"),
+                    "details": {
+                        "type": load_balancer.get("Type"),
+                        "scheme": load_balancer.get("Scheme"),
+                        "dns_name": load_balancer.get("DNSName"),
+                        "vpc_id": load_balancer.get("VpcId"),
+                        "created_time": load_balancer.get("CreatedTime"),
+                    },
+                }
+            )
+    return rows
+
+
+def collect_rds_instances(client):
+    rows = []
+    for page in client.get_paginator("describe_db_instances").paginate():
+        for db_instance in page.get("DBInstances", []):
+            rows.append(
+                {
+                    "resource_type": "db-instance",
+                    "resource_id": db_instance["DBInstanceIdentifier"],
+                    "name": db_instance["DBInstanceIdentifier"],
+                    "state": db_instance.get("DBInstanceStatus"),
+                    "details": {
+                        "engine": db_instance.get("Engine"),
+                        "engine_version": db_instance.get("EngineVersion"),
+                        "instance_class": db_instance.get("DBInstanceClass"),
+                        "endpoint": db_instance.get("Endpoint", {}).get("Address"),
+                        "multi_az": db_instance.get("MultiAZ"),
+                        "storage_gb": db_instance.get("AllocatedStorage"),
+                    },
+                }
+            )
+    return rows
+
+
+def collect_eks_clusters(client):
+    rows = []
+    for page in client.get_paginator("list_clusters").paginate():
+        for cluster_name in page.get("clusters", []):
+            cluster = client.describe_cluster(name=cluster_name)["cluster"]
+            rows.append(
+                {
+                    "resource_type": "cluster",
+                    "resource_id": cluster.get("arn", cluster_name),
+                    "name": cluster_name,
+                    "state": cluster.get("status"),
+                    "details": {
+                        "version": cluster.get("version"),
+                        "endpoint": cluster.get("endpoint"),
+                        "created_at": cluster.get("createdAt"),
+                    },
+                }
+            )
+    return rows
+
+
+def collect_lambda_functions(client):
+    rows = []
+    for page in client.get_paginator("list_functions").paginate():
+        for function in page.get("Functions", []):
+            rows.append(
+                {
+                    "resource_type": "function",
+                    "resource_id": function["FunctionArn"],
+                    "name": function.get("FunctionName"),
+                    "state": function.get("State"),
+                    "details": {
+                        "runtime": function.get("Runtime"),
+                        "memory_mb": function.get("MemorySize"),
+                        "timeout_seconds": function.get("Timeout"),
+                        "last_modified": function.get("LastModified"),
+                    },
+                }
+            )
+    return rows
+
+
+# Service name: (boto3 client name, collector)
+INVENTORY_COLLECTORS = {
+    "ec2": ("ec2", collect_ec2_instances),
+    "elb": ("elbv2", collect_load_balancers),
+    "rds": ("rds", collect_rds_instances),
+    "eks": ("eks", collect_eks_clusters),
+    "lambda": ("lambda", collect_lambda_functions),
+}
+
+
+def get_inventory_file(profile):
+    return f"{config.INVENTORY_DIR}/{profile}.db"
+
+
+def get_inventory_lock(profile):
+    with inventory_locks_lock:
+        return inventory_locks.setdefault(profile, threading.Lock())
+
+
+def get_connection(profile):
+    # sqlite3 connections cannot be shared between threads, so each thread gets its own
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get(profile)
+    if connection is None:
+        os.makedirs(config.INVENTORY_DIR, exist_ok=True)
+        connection = sqlite3.connect(get_inventory_file(profile), timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS resources (
+                    service TEXT NOT NULL,
+                    region TEXT NOT NULL,
+                    resource_type TEXT NOT NULL,
+                    resource_id TEXT NOT NULL,
+                    name TEXT,
+                    state TEXT,
+                    details TEXT,
+                    collected_at REAL NOT NULL,
+                    PRIMARY KEY (service, region, resource_id)
+                );
+                CREATE TABLE IF NOT EXISTS collections (
+                    service TEXT NOT NULL,
+                    region TEXT NOT NULL,
+                    collected_at REAL NOT NULL,
+                    error TEXT,
+                    PRIMARY KEY (service, region)
+                );
+                """
+            )
+        connections[profile] = connection
+    return connection
+
+
+def get_service_ttl(service):
+    ttls = config.INVENTORY_TTLS
+    return ttls.get(service, ttls.get("default", 0))
+
+
+def get_stale_collections(profile, regions):
+    connection = get_connection(profile)
+    collected_at = {
+        (row["service"], row["region"]): row["collected_at"]
+        for row in connection.execute(
+            "SELECT service, region, collected_at FROM collections"
+        )
+    }
+    now = time.time()
+    return [
+        (service, region)
+        for service in INVENTORY_COLLECTORS
+        for region in regions
+        if now - collected_at.get((service, region), 0) > get_service_ttl(service)
+    ]
+
+
+def save_collection(profile, service, region, rows, error=None):
+    connection = get_connection(profile)
+    collected_at = time.time()
+    with connection:
+        # Rows of a failed collection are kept, they are marked stale by its time
+        if error is None:
+            connection.execute(
+                "DELETE FROM resources WHERE service = ? AND region = ?",
+                (service, region),
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO resources (service, region, resource_type, "
+                "resource_id, name, state, details, collected_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    (
+                        service,
+                        region,
+                        row["resource_type"],
+                        row["resource_id"],
+                        row["name"],
+                        row["state"],
+                        json.dumps(row["details"], default=str),
+                        collected_at,
+                    )
+                    for row in rows
+                ),
+            )
+        connection.execute(
+            "INSERT OR REPLACE INTO collections (service, region, collected_at, error) "
+            "VALUES (?, ?, ?, ?)",
+            (service, region, collected_at, error),
+        )
+
+
+def refresh_inventory(profile, regions, session=None, force=False):
+    """Re-collect the stale (or all, if force is set) services of the given regions."""
+    import boto3
+
+    with get_inventory_lock(profile):
+        stale_collections = (
+            [
+                (service, region)
+                for service in INVENTORY_COLLECTORS
+                for region in regions
+            ]
+            if force
+            else get_stale_collections(profile, regions)
+        )
+        if not stale_collections:
+            return
+
+        log_message(
+            "INFO",
+            f"Collecting AWS inventory: {len(stale_collections)} services/regions "
+            f"using up to {config.AWS_DISCOVERY_MAX_WORKERS} parallel workers",
+        )
+        start_time = time.time()
+        session = session or boto3.Session()
+        # Clients are created upfront because boto3 sessions are not thread-safe
+        clients = {
+            (service, region): session.client(
+                INVENTORY_COLLECTORS[service][0], region_name=region
+            )
+            for service, region in stale_collections
+        }
+
+        def collect(service, region):
+            return INVENTORY_COLLECTORS[service][1](clients[(service, region)])
+
+        resources_collected = 0
+        with ThreadPoolExecutor(
+            max_workers=config.AWS_DISCOVERY_MAX_WORKERS
+        ) as executor:
+            futures = {
+                executor.submit(collect, service, region): (service, region)
+                for service, region in stale_collections
+            }
+            for future in as_completed(futures):
+                service, region = futures[future]
+                try:
+                    rows = future.result()
+                except Exception as e:
+                    # E.g. no permissions or the service is not available in the region
+                    log_message(
+                        "DEBUG",
+                        f"Error while collecting {service} inventory in {region}: {e}",
+                    )
+                    save_collection(profile, service, region, [], error=str(e))
+                    continue
+                save_collection(profile, service, region, rows)
+                resources_collected += len(rows)
+
+        log_message(
+            "INFO",
+            f"AWS inventory collected in {time.time() - start_time:.1f} seconds: "
+            f"{resources_collected} resources",
+        )
+
+
+def refresh_inventory_in_background(profile, regions):
+    thread = refresh_threads.get(profile)
+    if thread is not None and thread.is_alive():
+        return
+
+    def refresh():
+        try:
+            refresh_inventory(profile, regions)
+        except Exception as e:
+            log_message("WARNING", f"Error while collecting AWS inventory: {e}")
+
+    thread = threading.Thread(target=refresh, name=f"inventory-{profile}", daemon=True)
+    refresh_threads[profile] = thread
+    thread.start()
+
+
+def format_age(seconds):
+    if seconds < 120:
+        return f"{int(seconds)} seconds"
+    if seconds < 7200:
+        return f"{int(seconds // 60)} minutes"
+    return f"{int(seconds // 3600)} hours"
+
+
+def query_inventory(profile, regions, query):
+    """Run a read-only SQL query on the inventory and return the rows as text.
+
+    Stale services are refreshed in the background; the answer notes the age of the
+    data, so the agent can fall back to the CLI when it needs the current state.
+    """
+    query = query.strip().strip("`").strip()
+    if query.lower().startswith("sql"):
+        query = query[3:].strip()
+    if not re.match(r"(?is)^\s*(select|with)\b", query):
+        return "Only SELECT queries are supported"
+
+    if get_stale_collections(profile, regions):
+        refresh_inventory_in_background(profile, regions)
+
+    connection = get_connection(profile)
+    collections = connection.execute(
+        "SELECT MIN(collected_at) AS oldest, COUNT(*) AS count FROM collections"
+    ).fetchone()
+    if not collections["count"]:
+        return (
+            "The inventory is being collected, try again later or use the AWS CLI tool"
+        )
+
+    # A separate read-only connection, so the query cannot modify the inventory
+    query_connection = sqlite3.connect(
+        f"file:{get_inventory_file(profile)}?mode=ro", uri=True, timeout=30
+    )
+    try:
+        query_connection.execute("PRAGMA query_only = ON")
+        cursor = query_connection.execute(query)
+        columns = [column[0] for column in cursor.description or []]
+        rows = cursor.fetchmany(config.INVENTORY_QUERY_MAX_ROWS + 1)
+    except sqlite3.Error as e:
+        return f"Error while running the query: {e}"
+    finally:
+        query_connection.close()
+
+    lines = [
+        f"Inventory data is up to {format_age(time.time() - collections['oldest'])} old."
+    ]
+    if not rows:
+        lines.append("No rows found")
+        return "\n".join(lines)
+    lines.append(" | ".join(columns))
+    for row in rows[: config.INVENTORY_QUERY_MAX_ROWS]:
+        lines.append(" | ".join("" if value is None else str(value) for value in row))
+    if len(rows) > config.INVENTORY_QUERY_MAX_ROWS:
+        lines.append(
+            f"... (only the first {config.INVENTORY_QUERY_MAX_ROWS} rows are shown)"
+        )
+    return "\n".join(lines)
+
+
+def get_inventory_tool_description():
+    return (
+        "Query the local snapshot of AWS resources (EC2 instances, load balancers, RDS "
+        "instances, EKS clusters and Lambda functions) with an SQLite SELECT statement. "
+        "It answers in milliseconds, so prefer it to the AWS CLI for listing and "
+        "filtering resources; use the CLI for metrics, logs and the current state of "
+        "a specific resource. Table: resources(service, region, resource_type, "
+        "resource_id, name, state, details, collected_at). service is one of "
+        f"{', '.join(INVENTORY_COLLECTORS)}; details is a JSON object, use "
+        "json_extract(details, '$.field'), e.g. "
+        "SELECT name, state, json_extract(details, '$.instance_type') FROM resources "
+        "WHERE service = 'ec2' AND state != 'running'. Fields of details: ec2 - "
+        "instance_type, private_ip, public_ip, vpc_id, subnet_id, launch_time, tags; "
+        "elb - type, scheme, dns_name, vpc_id, created_time; rds - engine, "
+        "engine_version, instance_class, endpoint, multi_az, storage_gb; eks - "
+        "version, endpoint, created_at; lambda - runtime, memory_mb, timeout_seconds, "
+        "last_modified. Table collections(service, "
+        "region, collected_at, error) tells when every service was collected."
+    )
@@ -1,52 +1,284 @@
-import tiktoken
-import openai
-from openai import AzureOpenAI
 import json
-import boto3
-from botocore.config import Config
-from botocore.exceptions import ClientError
-from ollama import Client
-from google import genai
+import time
+import threading
 
 from rofehcloud.config import Config as config
-from rofehcloud.logger import log_message
+from rofehcloud.logger import log_level_enabled, log_message
+from rofehcloud.tracing import span
 
 
 def count_tokens(text):
+    import tiktoken
+
     encoding = tiktoken.encoding_for_model("gpt-4-0613")
     num_tokens = len(encoding.encode(text))
     return num_tokens
 
 
-def call_llm(prompt, llm):
+tokenizer_available = True
+
+
+def estimate_tokens(text):
+    # tiktoken downloads its encoding on first use; without it (e.g. offline) the
+    # number of tokens is approximated as 4 characters per token
+    global tokenizer_available
+
+    if tokenizer_available:
+        try:
+            return count_tokens(text)
+        except Exception as e:
+            log_message("DEBUG", f"Falling back to approximate token counts: {e}")
+            tokenizer_available = False
+    return len(text) // 4
+
+
+# Provider clients are created once and shared between calls (and threads) so that
+# the connection pools, credentials and TLS sessions are reused
+llm_clients = {}
+llm_clients_lock = threading.Lock()
+
+
+def get_llm_client(llm):
+    client = llm_clients.get(llm)
+    if client is None:
+        with llm_clients_lock:
+            client = llm_clients.get(llm)
+            if client is None:
+                log_message("DEBUG", f"Creating a new {llm} client...")
+                client = create_llm_client(llm)
+                llm_clients[llm] = client
+    return client
+
+
+def get_http_limits():
+    import httpx
+
+    return httpx.Limits(
+        max_connections=config.LLM_MAX_POOL_CONNECTIONS,
+        max_keepalive_connections=config.LLM_MAX_POOL_CONNECTIONS,
+    )
+
+
+def get_http_transport():
+    import httpx
+
+    # httpx only retries failed connection attempts
+    return httpx.HTTPTransport(limits=get_http_limits(), retries=config.LLM_MAX_RETRIES)
+
+
+def create_llm_client(llm):
+    # Provider SDKs are imported on first use, so only the selected one is loaded
     if llm == "openai":
-        return call_openai(prompt, config.OPENAI_GENERAL_MODEL_ID)
-    elif llm == "bedrock":
-        return call_bedrock_llm(prompt, config.BEDROCK_GENERAL_MODEL_ID)
+        import openai
+
+        return openai.OpenAI(
+            api_key=config.OPENAI_API_KEY,
+            timeout=config.LLM_REQUEST_TIMEOUT,
+            max_retries=config.LLM_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=get_http_limits()),
+        )
     elif llm == "azure-openai":
-        return call_azure_openai_llm(prompt, config.AZURE_OPENAI_MODEL_ID)
+        import openai
+
+        return openai.AzureOpenAI(
+            api_key=config.AZURE_OPENAI_API_KEY,
+            api_version=config.AZURE_OPENAI_API_VERSION,
+            azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
+            timeout=config.LLM_REQUEST_TIMEOUT,
+            max_retries=config.LLM_MAX_RETRIES,
+            http_client=openai.DefaultHttpxClient(limits=get_http_limits()),
+        )
     elif llm == "ollama":
-        return call_ollama(prompt, config.OLLAMA_MODEL_ID)
+        from ollama import Client
+
+        return Client(
+            host=config.OLLAMA_ENDPOINT_URL,
+            timeout=config.LLM_REQUEST_TIMEOUT,
+            transport=get_http_transport(),
+        )
     elif llm == "gemini":
-        return call_gemini(prompt, config.GEMINI_MODEL_ID)
+        from google import genai
+        from google.genai import types as genai_types
+
+        # google-genai has no retry option, so LLM_MAX_RETRIES does not apply here
+        return genai.Client(
+            api_key=config.GOOGLE_API_KEY,
+            http_options=genai_types.HttpOptions(
+                timeout=int(config.LLM_REQUEST_TIMEOUT * 1000)
+            ),
+        )
+    elif llm == "bedrock":
+        import boto3
+        from botocore.config import Config
+
+        session = boto3.Session(
+            profile_name=config.BEDROCK_PROFILE_NAME,
+            region_name=config.BEDROCK_AWS_REGION,
+        )
+        return session.client(
+            service_name="bedrock-runtime",
+            config=Config(
+                read_timeout=config.LLM_REQUEST_TIMEOUT,
+                retries={
+                    "max_attempts": config.LLM_MAX_RETRIES + 1,
+                    "mode": "standard",
+                },
+                max_pool_connections=config.LLM_MAX_POOL_CONNECTIONS,
+            ),
+        )
     else:
-        log_message("ERROR", f"LLM {llm} not supported.")
-        return False
+        raise ValueError(f"LLM {llm} not supported.")
 
 
-def call_openai(prompt, model_id):
-    client = openai.OpenAI(api_key=config.OPENAI_API_KEY)
+def call_llm(prompt, llm):
+    with span("call_llm", llm=llm, prompt_chars=len(prompt)):
+        if llm == "openai":
+            return call_openai(prompt, config.OPENAI_GENERAL_MODEL_ID)
+        elif llm == "bedrock":
+            return call_bedrock_llm(prompt, config.BEDROCK_GENERAL_MODEL_ID)
+        elif llm == "azure-openai":
+            return call_azure_openai_llm(prompt, config.AZURE_OPENAI_MODEL_ID)
+        elif llm == "ollama":
+            return call_ollama(prompt, config.OLLAMA_MODEL_ID)
+        elif llm == "gemini":
+            return call_gemini(prompt, config.GEMINI_MODEL_ID)
+        elif llm == "cassette":
+            return call_cassette(prompt)
+        else:
+            log_message("ERROR", f"LLM {llm} not supported.")
+            return False
+
+
+def call_cassette(prompt):
+    from rofehcloud.cassette import record_exchange, replay_exchange
+
+    if config.CASSETTE_MODE == "record":
+        response = call_llm(prompt, config.CASSETTE_RECORDED_LLM)
+        if isinstance(response, str):
+            record_exchange("general", prompt, response)
+        return response
+
+    return replay_exchange("general", prompt)
+
+
+def call_llm_stream(prompt, llm, on_chunk):
+    """Streaming variant of call_llm; on_chunk is called with every chunk of the text.
+
+    Returns the whole response, or False on error.
+    """
+    with span("call_llm_stream", llm=llm, prompt_chars=len(prompt)) as stream_span:
+        start_time = time.time()
+        chunks = []
+        try:
+            if llm == "openai" or llm == "azure-openai":
+                stream = stream_openai(prompt, llm)
+            elif llm == "bedrock":
+                stream = stream_bedrock_llm(prompt, config.BEDROCK_GENERAL_MODEL_ID)
+            elif llm == "ollama":
+                stream = stream_ollama(prompt, config.OLLAMA_MODEL_ID)
+            elif llm == "gemini":
+                stream = stream_gemini(prompt, config.GEMINI_MODEL_ID)
+            elif llm == "cassette":
+                stream = [call_cassette(prompt)]
+            else:
+                log_message("ERROR", f"LLM {llm} not supported.")
+                return False
+
+            for chunk in stream:
+                if not chunk:
+                    continue
+                if not chunks:
+                    time_to_first_token = time.time() - start_time
+                    stream_span["attributes"]["time_to_first_token"] = round(
+                        time_to_first_token, 3
+                    )
+                    log_message(
+                        "DEBUG",
+                        f"Time to first token ({llm}): {time_to_first_token:.2f} seconds",
+                    )
+                chunks.append(chunk)
+                on_chunk(chunk)
+        except Exception as e:
+            log_message("ERROR", f"Error while streaming the response from {llm}: {e}")
+            return False
+        return "".join(chunks)
+
+
+def stream_openai(prompt, llm):
+    if llm == "openai":
+        model_id = config.OPENAI_GENERAL_MODEL_ID
+        temperature = config.OPENAI_TEMPERATURE
+    else:
+        model_id = config.AZURE_OPENAI_MODEL_ID
+        temperature = config.AZURE_OPENAI_TEMPERATURE
+
+    stream = get_llm_client(llm).chat.completions.create(
+        model=model_id,
+        temperature=temperature,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices:
+            yield chunk.choices[0].delta.content
+
+
+def stream_ollama(prompt, model_id):
+    stream = get_llm_client("ollama").chat(
+        model=model_id,
+        messages=[{"role": "user", "content": prompt}],
+        stream=True,
+    )
+    for chunk in stream:
+        yield chunk.message.content
+
+
+def stream_gemini(prompt, model_id):
+    for chunk in get_llm_client("gemini").models.generate_content_stream(
+        model=model_id, contents=prompt
+    ):
+        yield chunk.text
+
+
+def stream_bedrock_llm(prompt, model_id):
+    response = get_llm_client("bedrock").invoke_model_with_response_stream(
+        modelId=model_id,
+        body=json.dumps(
+            {
+                "anthropic_version": "bedrock-2023-05-31",
+                "max_tokens": config.BEDROCK_MAX_RESPONSE_TOKENS,
+                "temperature": config.BEDROCK_TEMPERATURE,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [{"type": "text", "text": prompt}],
+                    }
+                ],
+            }
+        ),
+    )
+    for event in response.get("body"):
+        chunk = json.loads(event["chunk"]["bytes"])
+        if chunk.get("type") == "content_block_delta":
+            yield chunk["delta"].get("text")
+
 
+def call_openai(prompt, model_id):
     try:
-        tokens = count_tokens(prompt)
-        log_message("DEBUG", f"Calling OpenAI ({tokens} tokens in the prompt)...")
+        client = get_llm_client("openai")
+        if log_level_enabled("DEBUG"):
+            log_message(
+                "DEBUG",
+                "Calling OpenAI (%s tokens in the prompt)...",
+                estimate_tokens(prompt),
+            )
         response_from_openai = client.chat.completions.create(
             model=model_id,
             temperature=config.OPENAI_TEMPERATURE,
             messages=[{"role": "user", "content": prompt}],
         )
         response = response_from_openai.choices[0].message.content
-        log_message("DEBUG", f"Response from OpenAI: {response}")
+        log_message("DEBUG", "Response from OpenAI: %s", response)
         return response
 
     except Exception as e:
@@ -55,22 +287,21 @@ def call_openai(prompt, model_id):
 
 
 def call_azure_openai_llm(prompt, model_id):
-    client = AzureOpenAI(
-        api_key=config.AZURE_OPENAI_API_KEY,
-        api_version=config.AZURE_OPENAI_API_VERSION,
-        azure_endpoint=config.AZURE_OPENAI_ENDPOINT,
-    )
-
     try:
-        tokens = count_tokens(prompt)
-        log_message("DEBUG", f"Calling Azure OpenAI ({tokens} tokens in the prompt)...")
+        client = get_llm_client("azure-openai")
+        if log_level_enabled("DEBUG"):
+            log_message(
+                "DEBUG",
+                "Calling Azure OpenAI (%s tokens in the prompt)...",
+                estimate_tokens(prompt),
+            )
         response_from_openai = client.chat.completions.create(
             model=model_id,
             temperature=config.AZURE_OPENAI_TEMPERATURE,
             messages=[{"role": "user", "content": prompt}],
         )
         response = response_from_openai.choices[0].message.content
-        log_message("DEBUG", f"Response from Azure OpenAI: {response}")
+        log_message("DEBUG", "Response from Azure OpenAI: %s", response)
         return response
 
     except Exception as e:
@@ -79,10 +310,8 @@ def call_azure_openai_llm(prompt, model_id):
 
 
 def call_ollama(prompt, model_id):
-    client = Client(
-        host=config.OLLAMA_ENDPOINT_URL,
-    )
     try:
+        client = get_llm_client("ollama")
         response_from_ollama = client.chat(
             model=config.OLLAMA_MODEL_ID,
             messages=[
@@ -94,7 +323,7 @@ def call_ollama(prompt, model_id):
             stream=False,
         )
         response = response_from_ollama.message.content
-        log_message("DEBUG", f"Response from Ollama: {response}")
+        log_message("DEBUG", "Response from Ollama: %s", response)
         return response
     except Exception as e:
         log_message("ERROR", f"Error while calling Ollama: {e}")
@@ -103,20 +332,20 @@ def call_ollama(prompt, model_id):
 
 def call_gemini(prompt, model_id):
     try:
-        client = genai.Client(
-            # vertexai=True,
-            api_key=config.GOOGLE_API_KEY,
-            # http_options=types.HttpOptions(api_version='v1')
-        )
+        client = get_llm_client("gemini")
 
-        tokens = count_tokens(prompt)
-        log_message("DEBUG", f"Calling Gemini ({tokens} tokens in the prompt)...")
+        if log_level_enabled("DEBUG"):
+            log_message(
+                "DEBUG",
+                "Calling Gemini (%s tokens in the prompt)...",
+                estimate_tokens(prompt),
+            )
 
         response = client.models.generate_content(
             model=config.GEMINI_MODEL_ID, contents=prompt
         )
         if response.text:
-            log_message("DEBUG", f"Response from Gemini: {response.text}")
+            log_message("DEBUG", "Response from Gemini: %s", response.text)
             return response.text
         return False
 
@@ -126,14 +355,10 @@ def call_gemini(prompt, model_id):
 
 
 def call_bedrock_llm(prompt, model_id):
-    Config(read_timeout=300)
-    session = boto3.Session(
-        profile_name=config.BEDROCK_PROFILE_NAME,
-        region_name=config.BEDROCK_AWS_REGION,
-    )
-    bedrock_client = session.client(service_name="bedrock-runtime")
+    from botocore.exceptions import ClientError
 
     try:
+        bedrock_client = get_llm_client("bedrock")
         response = bedrock_client.invoke_model(
             modelId=model_id,
             body=json.dumps(
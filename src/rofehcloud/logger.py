@@ -1,49 +1,99 @@
 # logger.py
 
+import copy
+import json
+import queue
+import atexit
 import logging
-import inspect
-import os
+import warnings
+from logging.handlers import QueueHandler, QueueListener
 
 from rofehcloud.config import Config as config
 
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "file": record.filename,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def get_log_formatter():
+    if config.LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter(
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s"
+    )
+
+
+# Log records are written to sys.stderr by a background thread, so logging does not
+# block the agent loop on terminal or pipe I/O
+log_queue = queue.SimpleQueue()
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(get_log_formatter())
+log_listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
+
+
+class LogQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Only the arguments are merged into the message; the exception info is kept,
+        # as the record is formatted by the stream handler
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+queue_handler = LogQueueHandler(log_queue)
+
 # Configure the logging module
 logging.basicConfig(
-    level=logging.getLevelName(config.LOG_LEVEL),
-    # level=logging.getLevelName(config.log_level.upper()),
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()],  # Output logs to sys.stderr
+    level=logging.getLevelName(config.LOG_LEVEL.upper()),
+    handlers=[queue_handler],
 )
 
+logger = logging.getLogger(__name__)
 
-# Shutting it up
-try:
-    import warnings
-    from langsmith.utils import LangSmithMissingAPIKeyWarning
 
-    warnings.filterwarnings("ignore", category=LangSmithMissingAPIKeyWarning)
-except:  # noqa: E722
-    pass
+# Shutting it up (matching the message instead of LangSmithMissingAPIKeyWarning
+# avoids importing langsmith when logging is initialized)
+warnings.filterwarnings(
+    "ignore", message="API key must be provided when using hosted LangSmith API"
+)
 
 
-def log_message(level, message):
-    logger = logging.getLogger(__name__)
+def get_level_number(level):
+    level_number = logging.getLevelName(level.upper())
+    if not isinstance(level_number, int):
+        raise ValueError(f"Invalid log level: {level}")
+    return level_number
 
-    # Get the current frame and go back one step to the caller
-    frame = inspect.currentframe()
-    caller_frame = frame.f_back
-    caller_info = inspect.getframeinfo(caller_frame)
 
-    # Get only the last part of the file path
-    filename = os.path.basename(caller_info.filename)
+def log_level_enabled(level):
+    """Check the level before computing something that is only needed for logging."""
+    return logger.isEnabledFor(get_level_number(level))
 
-    # Add caller's file and line number to the message
-    enhanced_message = f"{filename}:{caller_info.lineno} - {message}"
 
-    log_method = getattr(logger, level.lower(), None)
-    if log_method is not None:
-        log_method(enhanced_message)
-    else:
-        raise ValueError(f"Invalid log level: {level}")
+def log_message(level, message, *args):
+    """Log the message on behalf of the caller (file and line of the caller are logged).
+
+    Arguments are merged into the message %-style only if the level is enabled, so
+    large objects should be passed as arguments rather than formatted in advance:
+    log_message("DEBUG", "Chat history: %s", chat_history)
+    """
+    level_number = get_level_number(level)
+    if logger.isEnabledFor(level_number):
+        logger.log(level_number, message, *args, stacklevel=2)
 
 
-__all__ = ["log_message"]
+__all__ = ["log_message", "log_level_enabled"]
@@ -7,6 +7,7 @@ from cerberus import Validator
 from rofehcloud.config import Config as config
 from rofehcloud.chat import load_data
 from rofehcloud.logger import log_message
+from rofehcloud.environment_cache import get_cached_value
 
 init(autoreset=True)
 
@@ -26,11 +27,14 @@ def check_available_tools(profile):
             "Skipping the check for available tools (SKIP_THE_CHECK_FOR_AVAILABLE_TOOLS is set to true)",
         )
         return True
+    tool_paths = get_cached_value(
+        "tool_paths", lambda: {tool: shutil.which(tool) for tool in config.ALL_TOOLS}
+    )
     copy_of_all_tools = config.ALL_TOOLS.copy()
     for tool in copy_of_all_tools:
         # check that the tool is available in the path and executable
         log_message("DEBUG", f"Checking if tool {tool} is available in the PATH")
-        if not shutil.which(tool):
+        if not tool_paths.get(tool):
             log_message("DEBUG", f"Tool {tool} not found in the PATH")
             print(
                 Style.BRIGHT + f'Warning: tool "{tool}" not found in the PATH. '
@@ -0,0 +1,155 @@
+import os
+import re
+import json
+
+import yaml
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_level_enabled, log_message
+from rofehcloud.llm import estimate_tokens
+from rofehcloud.safety import split_pipeline
+
+
+# Structured (JSON or YAML) command output is reduced before it is passed to the
+# agent: noise fields are removed, lists of similar objects are converted to column
+# tables and the result is minified. A table looks like:
+# {"columns": ["Name", "State.Code"], "rows": [["web-1", 16], ["web-2", 80]]}
+# (fields of nested objects become dotted columns)
+
+reduced_output_note = (
+    "(The output was reduced: noise fields removed, lists of similar objects shown "
+    'as {"columns": [...], "rows": [[...], ...]} tables)'
+)
+
+YAML_OUTPUT_PATTERN = re.compile(r"(-o|--output|--format)[ =]?['\"]?yaml\b")
+STRUCTURED_OUTPUT_PATTERN = re.compile(
+    r"(-o|--output|--format)[ =]?['\"]?(json|yaml)\b"
+)
+
+# A list is converted to a table only if its objects share most of their fields
+MIN_TABLE_ROWS = 2
+MIN_SHARED_COLUMNS_RATIO = 0.5
+
+
+def is_reducer_enabled(command):
+    if not config.COMMAND_OUTPUT_REDUCER_ENABLED:
+        return False
+    segments = split_pipeline(command) or []
+    return not any(
+        os.path.basename(segment[0]) in config.COMMAND_OUTPUT_REDUCER_DISABLED_TOOLS
+        for segment in segments
+    )
+
+
+def expects_structured_output(command):
+    """Return True if the command requests JSON/YAML output or pipes it to jq."""
+    if STRUCTURED_OUTPUT_PATTERN.search(command):
+        return True
+    segments = split_pipeline(command) or []
+    return any(os.path.basename(segment[0]) == "jq" for segment in segments[1:])
+
+
+def parse_structured_output(command, output):
+    text = output.strip()
+    if text[:1] in ("{", "["):
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+    # Plain text often parses as YAML too, so YAML is only expected when requested
+    if YAML_OUTPUT_PATTERN.search(command):
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError:
+            return None
+    return None
+
+
+class Table(dict):
+    """A list of objects converted to columns and rows (kept as is when flattening)."""
+
+
+def remove_noise_fields(data):
+    if isinstance(data, dict):
+        reduced_data = {}
+        for key, value in data.items():
+            if key in config.COMMAND_OUTPUT_REDUCER_NOISE_FIELDS:
+                continue
+            reduced_value = remove_noise_fields(value)
+            # Drop objects that held only noise fields (e.g. annotations)
+            if reduced_value == {} and value != {}:
+                continue
+            reduced_data[key] = reduced_value
+        return reduced_data
+    if isinstance(data, list):
+        return [remove_noise_fields(item) for item in data]
+    return data
+
+
+def flatten_object(data, prefix=""):
+    """Flatten nested objects into dotted keys: {"a": {"b": 1}} -> {"a.b": 1}."""
+    flat_data = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and value and not isinstance(value, Table):
+            flat_data.update(flatten_object(value, f"{prefix}{key}."))
+        else:
+            flat_data[f"{prefix}{key}"] = value
+    return flat_data
+
+
+def get_table_columns(items):
+    if len(items) < MIN_TABLE_ROWS or not all(
+        isinstance(item, dict) and item for item in items
+    ):
+        return None
+    columns = list(dict.fromkeys(key for item in items for key in item))
+    shared_columns = set(items[0]).intersection(*items[1:])
+    if len(shared_columns) < len(columns) * MIN_SHARED_COLUMNS_RATIO:
+        return None
+    return columns
+
+
+def convert_lists_to_tables(data):
+    if isinstance(data, dict):
+        return {key: convert_lists_to_tables(value) for key, value in data.items()}
+    if isinstance(data, list):
+        items = [convert_lists_to_tables(item) for item in data]
+        flat_items = [
+            flatten_object(item) if isinstance(item, dict) else item for item in items
+        ]
+        columns = get_table_columns(flat_items)
+        if columns is None:
+            return items
+        return Table(
+            columns=columns,
+            rows=[[item.get(column) for column in columns] for item in flat_items],
+        )
+    return data
+
+
+def reduce_output(command, output):
+    """Return the reduced structured output, or the output as is if it is not reduced."""
+    data = parse_structured_output(command, output)
+    if not isinstance(data, (dict, list)):
+        return output
+
+    data = convert_lists_to_tables(remove_noise_fields(data))
+    # YAML timestamps are loaded as datetime objects
+    reduced_output = (
+        json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=str)
+        + "\n"
+        + reduced_output_note
+    )
+    if len(reduced_output) >= len(output):
+        return output
+
+    if log_level_enabled("DEBUG"):
+        log_message(
+            "DEBUG",
+            "Command output reduced from %s to %s tokens (%s to %s characters)",
+            estimate_tokens(output),
+            estimate_tokens(reduced_output),
+            len(output),
+            len(reduced_output),
+        )
+    return reduced_output
@@ -0,0 +1,1074 @@
+import os
+import re
+import json
+import shlex
+import threading
+from datetime import datetime
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+SAFE = "safe"
+UNSAFE = "unsafe"
+
+# Commands that only read data (as long as the output is not redirected to a file)
+READ_ONLY_COMMANDS = [
+    "cat",
+    "head",
+    "tail",
+    "wc",
+    "grep",
+    "egrep",
+    "fgrep",
+    "cut",
+    "bc",
+    "jq",
+    "ping",
+    "dig",
+    "nslookup",
+    "host",
+    "traceroute",
+    "echo",
+    "ls",
+    "pwd",
+    "whoami",
+    "uname",
+    "tr",
+    "column",
+]
+
+PIPELINE_OPERATORS = ["|", "|&", "&&", "||", ";"]
+WRITE_REDIRECTS = [">", ">>", ">|", "&>", "&>>"]
+
+AWS_OPTIONS_WITH_VALUES = [
+    "--region",
+    "--profile",
+    "--output",
+    "--query",
+    "--endpoint-url",
+    "--cli-read-timeout",
+    "--cli-connect-timeout",
+    "--color",
+    "--ca-bundle",
+]
+AWS_FLAGS = [
+    "--debug",
+    "--no-paginate",
+    "--no-verify-ssl",
+    "--no-sign-request",
+    "--no-cli-pager",
+    "--no-cli-auto-prompt",
+    "--quiet",
+    "--no-progress",
+]
+AWS_READ_ONLY_OPERATION_PREFIXES = [
+    "describe-",
+    "list-",
+    "get-",
+    "batch-get-",
+    "search-",
+    "lookup-",
+    "filter-",
+]
+AWS_READ_ONLY_OPERATIONS = ["scan", "query", "tail", "help", "ls", "wait"]
+AWS_MUTATING_OPERATION_PREFIXES = [
+    "create-",
+    "delete-",
+    "put-",
+    "update-",
+    "modify-",
+    "terminate-",
+    "stop-",
+    "start-",
+    "reboot-",
+    "run-",
+    "attach-",
+    "detach-",
+    "associate-",
+    "disassociate-",
+    "add-",
+    "remove-",
+    "register-",
+    "deregister-",
+    "tag-",
+    "untag-",
+    "enable-",
+    "disable-",
+    "set-",
+    "reset-",
+    "restore-",
+    "copy-",
+    "import-",
+    "send-",
+    "cancel-",
+    "revoke-",
+    "authorize-",
+    "replace-",
+    "release-",
+    "allocate-",
+    "execute-",
+    "rotate-",
+    "upload-",
+    "change-",
+    "invoke",
+    "publish",
+    "deploy",
+]
+AWS_S3_MUTATING_COMMANDS = ["cp", "mv", "rm", "sync", "mb", "rb", "website"]
+# Read-only operations writing the result to the "outfile" argument
+AWS_OUTFILE_OPERATIONS = [
+    "get-object",
+    "get-object-torrent",
+    "select-object-content",
+    "get-media",
+    "get-clip",
+]
+
+KUBECTL_OPTIONS_WITH_VALUES = [
+    "-n",
+    "--namespace",
+    "--context",
+    "--kubeconfig",
+    "--cluster",
+    "--user",
+    "-s",
+    "--server",
+    "--request-timeout",
+]
+KUBECTL_FLAGS = ["--insecure-skip-tls-verify", "-A", "--all-namespaces"]
+KUBECTL_READ_ONLY_VERBS = [
+    "get",
+    "describe",
+    "logs",
+    "top",
+    "explain",
+    "api-resources",
+    "api-versions",
+    "version",
+    "cluster-info",
+    "events",
+]
+KUBECTL_MUTATING_VERBS = [
+    "apply",
+    "create",
+    "delete",
+    "edit",
+    "patch",
+    "replace",
+    "scale",
+    "autoscale",
+    "label",
+    "annotate",
+    "set",
+    "drain",
+    "cordon",
+    "uncordon",
+    "taint",
+    "run",
+    "expose",
+    "cp",
+]
+KUBECTL_READ_ONLY_SUBCOMMANDS = {
+    "config": ["view", "get-contexts", "current-context", "get-clusters", "get-users"],
+    "auth": ["can-i", "whoami"],
+    "rollout": ["status", "history"],
+}
+
+# Command groups are listed, so an unknown verb is not skipped over
+GCLOUD_GROUPS = [
+    "alpha",
+    "beta",
+    "compute",
+    "instances",
+    "disks",
+    "snapshots",
+    "images",
+    "zones",
+    "regions",
+    "networks",
+    "subnets",
+    "firewall-rules",
+    "addresses",
+    "routers",
+    "routes",
+    "forwarding-rules",
+    "backend-services",
+    "health-checks",
+    "url-maps",
+    "target-pools",
+    "instance-groups",
+    "managed",
+    "unmanaged",
+    "instance-templates",
+    "machine-types",
+    "operations",
+    "ssl-certificates",
+    "security-policies",
+    "container",
+    "clusters",
+    "node-pools",
+    "projects",
+    "organizations",
+    "folders",
+    "iam",
+    "roles",
+    "service-accounts",
+    "keys",
+    "storage",
+    "buckets",
+    "objects",
+    "sql",
+    "databases",
+    "users",
+    "run",
+    "services",
+    "revisions",
+    "jobs",
+    "functions",
+    "pubsub",
+    "topics",
+    "subscriptions",
+    "logging",
+    "logs",
+    "sinks",
+    "config",
+    "configurations",
+    "auth",
+    "dns",
+    "managed-zones",
+    "record-sets",
+    "kms",
+    "keyrings",
+    "secrets",
+    "versions",
+    "artifacts",
+    "repositories",
+    "docker",
+    "app",
+    "builds",
+    "scheduler",
+    "redis",
+    "monitoring",
+    "policies",
+    "dashboards",
+    "billing",
+    "accounts",
+    "asset",
+    "dataproc",
+    "spanner",
+    "bigtable",
+    "filestore",
+    "composer",
+    "environments",
+    "tasks",
+    "queues",
+    "deployment-manager",
+    "deployments",
+    "resource-manager",
+]
+GCLOUD_READ_ONLY_VERBS = ["list", "describe", "read", "get-iam-policy", "get-value"]
+GCLOUD_MUTATING_VERBS = [
+    "create",
+    "delete",
+    "update",
+    "set",
+    "unset",
+    "deploy",
+    "start",
+    "stop",
+    "reset",
+    "resize",
+    "get-credentials",
+    "ssh",
+    "scp",
+    "import",
+    "export",
+    "add-iam-policy-binding",
+    "remove-iam-policy-binding",
+    "set-iam-policy",
+    "login",
+    "activate-service-account",
+]
+
+AZ_GROUPS = [
+    "account",
+    "group",
+    "vm",
+    "vmss",
+    "disk",
+    "snapshot",
+    "image",
+    "extension",
+    "aks",
+    "nodepool",
+    "acr",
+    "repository",
+    "network",
+    "vnet",
+    "subnet",
+    "peering",
+    "nsg",
+    "rule",
+    "public-ip",
+    "nic",
+    "ip-config",
+    "lb",
+    "application-gateway",
+    "route-table",
+    "route",
+    "private-endpoint",
+    "firewall",
+    "bastion",
+    "dns",
+    "zone",
+    "record-set",
+    "storage",
+    "container",
+    "blob",
+    "share",
+    "queue",
+    "table",
+    "webapp",
+    "functionapp",
+    "appservice",
+    "plan",
+    "containerapp",
+    "keyvault",
+    "secret",
+    "key",
+    "certificate",
+    "sql",
+    "server",
+    "db",
+    "postgres",
+    "mysql",
+    "flexible-server",
+    "cosmosdb",
+    "redis",
+    "servicebus",
+    "eventhubs",
+    "eventhub",
+    "namespace",
+    "topic",
+    "monitor",
+    "metrics",
+    "activity-log",
+    "log-analytics",
+    "workspace",
+    "diagnostic-settings",
+    "alert",
+    "action-group",
+    "autoscale",
+    "resource",
+    "role",
+    "assignment",
+    "definition",
+    "ad",
+    "sp",
+    "user",
+    "identity",
+    "policy",
+    "deployment",
+    "lock",
+    "tag",
+    "apim",
+    "backup",
+    "vault",
+    "cdn",
+    "profile",
+    "endpoint",
+]
+AZ_READ_ONLY_VERBS = ["list", "show", "query"]
+AZ_READ_ONLY_VERB_PREFIXES = ["list-", "show-"]
+AZ_MUTATING_VERBS = [
+    "create",
+    "delete",
+    "update",
+    "set",
+    "start",
+    "stop",
+    "restart",
+    "add",
+    "remove",
+    "get-credentials",
+    "login",
+    "deploy",
+    "invoke",
+    "run-command",
+    "scale",
+    "upgrade",
+]
+
+GIT_OPTIONS_WITH_VALUES = ["-C", "-c", "--git-dir", "--work-tree"]
+GIT_FLAGS = [
+    "--no-pager",
+    "-p",
+    "--paginate",
+    "-P",
+    "--bare",
+    "--no-replace-objects",
+    "--literal-pathspecs",
+    "--no-optional-locks",
+]
+GIT_READ_ONLY_SUBCOMMANDS = [
+    "log",
+    "show",
+    "diff",
+    "status",
+    "grep",
+    "ls-files",
+    "ls-tree",
+    "blame",
+    "rev-parse",
+    "rev-list",
+    "describe",
+    "shortlog",
+    "cat-file",
+    "for-each-ref",
+    "name-rev",
+    "whatchanged",
+    "count-objects",
+]
+GIT_MUTATING_SUBCOMMANDS = [
+    "commit",
+    "push",
+    "pull",
+    "reset",
+    "checkout",
+    "switch",
+    "merge",
+    "rebase",
+    "add",
+    "rm",
+    "mv",
+    "clean",
+    "stash",
+    "cherry-pick",
+    "revert",
+    "restore",
+    "apply",
+    "am",
+    "init",
+    "clone",
+]
+GIT_READ_ONLY_BRANCH_OPTIONS = [
+    "-a",
+    "-r",
+    "-v",
+    "-vv",
+    "--all",
+    "--remotes",
+    "--list",
+    "--show-current",
+    "--merged",
+    "--no-merged",
+    "--contains",
+]
+
+# Short curl options taking a value (long options are mapped to them when relevant)
+CURL_SHORT_OPTIONS_WITH_VALUES = [
+    f"-{letter}" for letter in "AbcCdDeEFHKmoPQrtTuUwxXyYz"
+]
+CURL_LONG_OPTIONS = {
+    "--request": "-X",
+    "--output": "-o",
+    "--dump-header": "-D",
+    "--cookie-jar": "-c",
+    "--upload-file": "-T",
+    "--header": "-H",
+    "--user": "-u",
+    "--user-agent": "-A",
+    "--cookie": "-b",
+    "--max-time": "-m",
+    "--proxy": "-x",
+    "--config": "-K",
+}
+
+HELM_OPTIONS_WITH_VALUES = ["-n", "--namespace", "--kube-context", "--kubeconfig"]
+HELM_FLAGS = ["--debug"]
+HELM_READ_ONLY_COMMANDS = [
+    "list",
+    "ls",
+    "get",
+    "status",
+    "history",
+    "show",
+    "search",
+    "version",
+    "env",
+    "template",
+    "lint",
+    "verify",
+]
+HELM_MUTATING_COMMANDS = [
+    "install",
+    "upgrade",
+    "uninstall",
+    "delete",
+    "rollback",
+    "push",
+    "package",
+    "pull",
+    "create",
+    "plugin",
+    "dependency",
+]
+
+# Data-like tokens replaced with placeholders when building the command template,
+# so the same verdict is reused for e.g. different instance IDs or time ranges
+TEMPLATE_PLACEHOLDERS = [
+    (re.compile(r"^arn:[\w-]+:.*$"), "<arn>"),
+    (
+        re.compile(
+            r"^(i|vol|sg|subnet|vpc|ami|snap|eni|igw|nat|rtb|acl|lt|eipalloc|tgw|vpce|pcx)"
+            r"-[0-9a-f]{8,17}$"
+        ),
+        "<aws-id>",
+    ),
+    (
+        re.compile(
+            r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.I
+        ),
+        "<uuid>",
+    ),
+    (re.compile(r"^\d{1,3}(\.\d{1,3}){3}(/\d{1,2})?$"), "<ip>"),
+    (re.compile(r"^\d{4}-\d{2}-\d{2}([T ][\d:.]+)?(Z|[+-]\d{2}:?\d{2})?$"), "<time>"),
+    (re.compile(r"^-?\d+(\.\d+)?$"), "<n>"),
+]
+
+safety_check_stats = {
+    "checks": 0,
+    "rule_safe": 0,
+    "rule_unsafe": 0,
+    "cache_hits": 0,
+    "llm_calls": 0,
+}
+
+verdict_cache = None
+verdict_cache_lock = threading.Lock()
+
+
+def split_pipeline(command):
+    """Split a shell command into a list of segments (lists of tokens).
+
+    Returns None if the command uses shell features that are not analyzed
+    (command substitution, subshells, background jobs, etc.).
+    """
+    if any(marker in command for marker in ["$(", "`", "<(", ">("]):
+        return None
+    # Line continuations join lines, other newlines separate commands like ";"
+    command = re.sub(r"\\\r?\n", " ", command)
+    command = re.sub(r"[\r\n]+", " ; ", command)
+
+    try:
+        lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+        lexer.whitespace_split = True
+        tokens = list(lexer)
+    except ValueError:
+        return None
+
+    segments = [[]]
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        next_token = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token in PIPELINE_OPERATORS:
+            segments.append([])
+        elif token in WRITE_REDIRECTS:
+            if next_token != "/dev/null":
+                # Writing to a file; mark the segment so it is classified as unsafe
+                segments[-1].append(token)
+            index += 1
+        elif token in [">&", "<&"] and next_token is not None and next_token.isdigit():
+            index += 1
+        elif token == "<":
+            index += 1
+        elif set(token) <= set("()&;|<>"):
+            return None
+        elif token.isdigit() and next_token in WRITE_REDIRECTS + [">&"]:
+            pass
+        else:
+            segments[-1].append(token)
+        index += 1
+
+    segments = [segment for segment in segments if segment]
+    return segments if segments else None
+
+
+def get_positional_arguments(arguments, options_with_values, flags=None):
+    """Return the positional arguments, skipping the options and their values.
+
+    If flags (options without a value) are given, the scan stops at any other option
+    without "=", as its value could otherwise be taken for a positional argument.
+    """
+    positional_arguments = []
+    skip_next = False
+    for argument in arguments:
+        if skip_next:
+            skip_next = False
+            continue
+        if argument.startswith("-"):
+            if argument in options_with_values:
+                skip_next = True
+            elif flags is not None and argument not in flags and "=" not in argument:
+                break
+            continue
+        positional_arguments.append(argument)
+    return positional_arguments
+
+
+def classify_aws(arguments):
+    positional_arguments = get_positional_arguments(
+        arguments, AWS_OPTIONS_WITH_VALUES, AWS_FLAGS
+    )
+    if len(positional_arguments) < 2:
+        return None
+    service, operation = positional_arguments[0], positional_arguments[1]
+
+    if operation in AWS_OUTFILE_OPERATIONS:
+        outfile = get_positional_arguments(arguments, AWS_OPTIONS_WITH_VALUES)[-1]
+        return SAFE if outfile in ["-", "/dev/stdout", "/dev/null"] else UNSAFE
+
+    if service == "s3":
+        if operation == "cp" and positional_arguments[-1] == "-":
+            return SAFE
+        if operation in AWS_S3_MUTATING_COMMANDS:
+            return UNSAFE
+    if service == "configure":
+        return SAFE if operation in ["get", "list", "list-profiles"] else UNSAFE
+
+    if operation in AWS_READ_ONLY_OPERATIONS or any(
+        operation.startswith(prefix) for prefix in AWS_READ_ONLY_OPERATION_PREFIXES
+    ):
+        return SAFE
+    if any(operation.startswith(prefix) for prefix in AWS_MUTATING_OPERATION_PREFIXES):
+        return UNSAFE
+    return None
+
+
+def classify_kubectl(arguments):
+    positional_arguments = get_positional_arguments(
+        arguments, KUBECTL_OPTIONS_WITH_VALUES, KUBECTL_FLAGS
+    )
+    if not positional_arguments:
+        return None
+    verb = positional_arguments[0]
+
+    if verb in KUBECTL_READ_ONLY_SUBCOMMANDS:
+        if len(positional_arguments) < 2:
+            return None
+        if positional_arguments[1] in KUBECTL_READ_ONLY_SUBCOMMANDS[verb]:
+            return SAFE
+        return UNSAFE
+    if verb in KUBECTL_READ_ONLY_VERBS:
+        return SAFE
+    if verb in KUBECTL_MUTATING_VERBS:
+        return UNSAFE
+    return None
+
+
+def classify_by_verb(
+    arguments, groups, read_only_verbs, mutating_verbs, read_only_verb_prefixes=()
+):
+    # gcloud/az commands are "<group> [<subgroup>...] <verb> [arguments]"
+    for argument in arguments:
+        if argument in mutating_verbs:
+            return UNSAFE
+        if argument in read_only_verbs or any(
+            argument.startswith(prefix) for prefix in read_only_verb_prefixes
+        ):
+            return SAFE
+        if argument not in groups:
+            return None
+    return None
+
+
+def classify_git(arguments):
+    positional_arguments = get_positional_arguments(
+        arguments, GIT_OPTIONS_WITH_VALUES, GIT_FLAGS
+    )
+    if not positional_arguments:
+        return None
+    subcommand = positional_arguments[0]
+    global_options = arguments[: arguments.index(subcommand)]
+    subcommand_arguments = arguments[arguments.index(subcommand) + 1 :]
+
+    # "-c core.pager=..." and similar settings can run arbitrary commands
+    if any(
+        option.startswith(("-c", "--config-env", "--exec-path"))
+        for option in global_options
+    ):
+        return None
+    if any(
+        argument.startswith(("--output", "-O", "--open-files-in-pager"))
+        for argument in subcommand_arguments
+    ):
+        return None
+
+    if subcommand in GIT_READ_ONLY_SUBCOMMANDS:
+        return SAFE
+    if subcommand in GIT_MUTATING_SUBCOMMANDS:
+        return UNSAFE
+    if subcommand == "branch":
+        if all(
+            argument in GIT_READ_ONLY_BRANCH_OPTIONS
+            for argument in subcommand_arguments
+        ):
+            return SAFE
+        return None
+    if subcommand == "tag":
+        return SAFE if subcommand_arguments in [[], ["-l"], ["--list"]] else None
+    if subcommand == "remote":
+        return SAFE if subcommand_arguments in [[], ["-v"], ["show"]] else None
+    if subcommand == "config":
+        if any(
+            argument in ["--get", "--list", "-l"] for argument in subcommand_arguments
+        ):
+            return SAFE
+        return None
+    return None
+
+
+def classify_helm(arguments):
+    positional_arguments = get_positional_arguments(
+        arguments, HELM_OPTIONS_WITH_VALUES, HELM_FLAGS
+    )
+    if not positional_arguments:
+        return None
+    subcommand = positional_arguments[0]
+    if subcommand == "repo":
+        return SAFE if positional_arguments[1:2] == ["list"] else UNSAFE
+    if subcommand in HELM_READ_ONLY_COMMANDS:
+        return SAFE
+    if subcommand in HELM_MUTATING_COMMANDS:
+        return UNSAFE
+    return None
+
+
+def classify_sed(arguments):
+    for argument in arguments:
+        if argument.startswith("--in-place"):
+            return UNSAFE
+        if argument.startswith("--file"):
+            return None
+        if argument.startswith("--expression="):
+            script = argument.split("=", 1)[1]
+        elif argument.startswith("-") and not argument.startswith("--"):
+            # The script may be attached to -e ("-nes/a/b/")
+            short_options, _, script = argument[1:].partition("e")
+            if "i" in short_options:
+                return UNSAFE
+            if "f" in short_options:
+                return None
+        elif argument.startswith("-"):
+            continue
+        else:
+            script = argument
+        # The "w" command and the "w" flag of "s" write to a file, "e" runs a command
+        if re.search(r"(^|[;{}/$\d\s])[ewW](\s|;|}|$)", script):
+            return None
+        if re.search(r"s(.)(?:\\.|(?!\1).)*\1(?:\\.|(?!\1).)*\1[^;}]*[ewW]", script):
+            return None
+    return SAFE
+
+
+def classify_find(arguments):
+    for argument in arguments:
+        if argument in ["-delete", "-fprint", "-fprint0", "-fprintf", "-fls"]:
+            return UNSAFE
+        if argument in ["-exec", "-execdir", "-ok", "-okdir"]:
+            return None
+    return SAFE
+
+
+def get_curl_options(arguments):
+    """Return (option, value) pairs; short options may be combined ("-sXPOST")."""
+    options = []
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        next_argument = arguments[index + 1] if index + 1 < len(arguments) else ""
+        index += 1
+        if argument.startswith("--"):
+            option, equal_sign, value = argument.partition("=")
+            option = CURL_LONG_OPTIONS.get(option, option)
+            if not equal_sign and option in CURL_SHORT_OPTIONS_WITH_VALUES:
+                value = next_argument
+                index += 1
+            options.append((option, value))
+        elif argument.startswith("-"):
+            for position, letter in enumerate(argument[1:], start=2):
+                option = f"-{letter}"
+                if option in CURL_SHORT_OPTIONS_WITH_VALUES:
+                    value = argument[position:]
+                    if not value:
+                        value = next_argument
+                        index += 1
+                    options.append((option, value))
+                    break
+                options.append((option, ""))
+    return options
+
+
+def classify_curl(arguments):
+    for option, value in get_curl_options(arguments):
+        # A config file may hold any option
+        if option == "-K":
+            return None
+        if option == "-X" and value.upper() not in ["GET", "HEAD"]:
+            return UNSAFE
+        if option in ["-d", "-F", "-T", "-O"] or option.startswith(
+            ("--data", "--form", "--json", "--remote-name")
+        ):
+            return UNSAFE
+        # Writing the output, headers or cookies to a file
+        if option in ["-o", "-D", "-c"] and value not in ["-", "/dev/null"]:
+            return UNSAFE
+    return SAFE
+
+
+def classify_date(arguments):
+    # "date -s <time>" and "date MMDDhhmm" set the system time
+    if any(
+        argument.startswith("--set") or re.match(r"^-[uR]*s", argument)
+        for argument in arguments
+    ):
+        return UNSAFE
+    positional_arguments = get_positional_arguments(
+        arguments, ["-d", "--date", "-f", "--file", "-r", "--reference"]
+    )
+    if all(argument.startswith("+") for argument in positional_arguments):
+        return SAFE
+    return UNSAFE
+
+
+def classify_wget(arguments):
+    for index, argument in enumerate(arguments):
+        option, _, value = argument.partition("=")
+        if option == "--method":
+            method = value or "".join(arguments[index + 1 : index + 2])
+            if method.upper() not in ["GET", "HEAD"]:
+                return UNSAFE
+        if option.startswith(("--post", "--body-")):
+            return UNSAFE
+        # Log files (-o, -a) are written; -e and --config can set any option
+        if option in ["--execute", "--config"]:
+            return None
+        if option in ["--output-file", "--append-output"]:
+            return UNSAFE
+        short_option = re.match(r"^-[qvSNcbxrkKpEHLn]*([oae])", argument)
+        if short_option:
+            return None if short_option.group(1) == "e" else UNSAFE
+    for index, argument in enumerate(arguments):
+        if argument in ["--spider", "-O-", "-qO-", "--output-document=-"]:
+            return SAFE
+        if argument in ["-O", "-qO"] and arguments[index + 1 : index + 2] == ["-"]:
+            return SAFE
+    # By default wget saves the downloaded file
+    return UNSAFE
+
+
+def classify_awk(arguments):
+    for argument in arguments:
+        # Program files (-f) and gawk extensions (-i, -l, -E) are not inspected
+        if argument.startswith(
+            ("-f", "-i", "-l", "-E", "--file", "--include", "--load", "--exec")
+        ):
+            return None
+        if argument.startswith("-"):
+            continue
+        if any(marker in argument for marker in ["system(", "getline", "|"]):
+            return None
+        if re.search(r"printf?[^;}]*>", argument):
+            return None
+    return SAFE
+
+
+def classify_xargs(arguments):
+    index = 0
+    while index < len(arguments) and arguments[index].startswith("-"):
+        if arguments[index] in ["-n", "-I", "-P", "-L", "-d", "-s", "-E"]:
+            index += 1
+        index += 1
+    if index >= len(arguments):
+        return SAFE
+    return classify_segment(arguments[index:])
+
+
+def classify_segment(tokens):
+    # Skip environment variable assignments like "AWS_PAGER= aws ..."
+    while tokens and re.match(r"^[A-Za-z_][A-Za-z0-9_]*=", tokens[0]):
+        tokens = tokens[1:]
+    if not tokens:
+        return None
+
+    if any(token in WRITE_REDIRECTS for token in tokens):
+        return UNSAFE
+
+    tool = os.path.basename(tokens[0])
+    arguments = tokens[1:]
+
+    if tool in READ_ONLY_COMMANDS:
+        return SAFE
+    if tool == "aws":
+        return classify_aws(arguments)
+    if tool == "kubectl":
+        return classify_kubectl(arguments)
+    if tool == "gcloud":
+        return classify_by_verb(
+            arguments, GCLOUD_GROUPS, GCLOUD_READ_ONLY_VERBS, GCLOUD_MUTATING_VERBS
+        )
+    if tool == "az":
+        return classify_by_verb(
+            arguments,
+            AZ_GROUPS,
+            AZ_READ_ONLY_VERBS,
+            AZ_MUTATING_VERBS,
+            AZ_READ_ONLY_VERB_PREFIXES,
+        )
+    if tool == "git":
+        return classify_git(arguments)
+    if tool == "helm":
+        return classify_helm(arguments)
+    if tool == "sed":
+        return classify_sed(arguments)
+    if tool == "find":
+        return classify_find(arguments)
+    if tool == "curl":
+        return classify_curl(arguments)
+    if tool == "wget":
+        return classify_wget(arguments)
+    if tool == "date":
+        return classify_date(arguments)
+    if tool == "hostname":
+        # "hostname <name>", "hostname -F <file>" and "hostname -b" set the host name
+        if any(a.startswith(("-F", "--file", "-b", "--boot")) for a in arguments):
+            return UNSAFE
+        return UNSAFE if get_positional_arguments(arguments, []) else SAFE
+    if tool == "uniq":
+        # The second file argument is the output file
+        positional_arguments = get_positional_arguments(arguments, ["-f", "-s", "-w"])
+        return UNSAFE if len(positional_arguments) > 1 else SAFE
+    if tool == "awk":
+        return classify_awk(arguments)
+    if tool == "xargs":
+        return classify_xargs(arguments)
+    if tool == "sort":
+        # -o may be combined with other short options ("-uo out")
+        if any(
+            a.startswith("--output") or re.match(r"^-[bdfghiMnRrcCsuVz]*o", a)
+            for a in arguments
+        ):
+            return UNSAFE
+        return (
+            None if any(a.startswith("--compress-program") for a in arguments) else SAFE
+        )
+    if tool == "yq":
+        return UNSAFE if any(a in ["-i", "--inplace"] for a in arguments) else SAFE
+    if tool == "tee":
+        return SAFE if all(a.startswith("-") for a in arguments) else UNSAFE
+    return None
+
+
+def classify_command(command):
+    """Classify a shell command as SAFE (read-only), UNSAFE (making changes) or None.
+
+    None means the rules do not know the command, and the decision is left to the LLM.
+    """
+    segments = split_pipeline(command)
+    if segments is None:
+        return None
+
+    verdicts = [classify_segment(segment) for segment in segments]
+    if UNSAFE in verdicts:
+        return UNSAFE
+    if None in verdicts:
+        return None
+    return SAFE
+
+
+def get_command_template(command):
+    # Only plain words are replaced, so quoting and shell operators are kept as they are
+    template_words = []
+    for word in re.split(r"(\s+)", command.strip()):
+        prefix = ""
+        if word.startswith("--") and "=" in word:
+            prefix, word = word.split("=", 1)
+            prefix += "="
+        if re.fullmatch(r"[\w@%+=:,./-]+", word):
+            for pattern, placeholder in TEMPLATE_PLACEHOLDERS:
+                if pattern.match(word):
+                    word = placeholder
+                    break
+        template_words.append(prefix + word)
+    return "".join(template_words)
+
+
+def load_verdict_cache():
+    global verdict_cache
+
+    if verdict_cache is None:
+        verdict_cache = {}
+        if os.path.exists(config.COMMAND_SAFETY_CACHE_FILE):
+            try:
+                with open(config.COMMAND_SAFETY_CACHE_FILE, "r") as file:
+                    verdict_cache = json.load(file)
+            except Exception as e:
+                log_message("ERROR", f"Error while loading command safety cache: {e}")
+    return verdict_cache
+
+
+def get_cached_verdict(command):
+    with verdict_cache_lock:
+        entry = load_verdict_cache().get(get_command_template(command))
+    return entry["verdict"] if entry else None
+
+
+def save_verdict(command, verdict):
+    with verdict_cache_lock:
+        cache = load_verdict_cache()
+        cache[get_command_template(command)] = {
+            "verdict": verdict,
+            "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            temporary_file = f"{config.COMMAND_SAFETY_CACHE_FILE}.tmp"
+            with open(temporary_file, "w") as file:
+                json.dump(cache, file, indent=1)
+            os.replace(temporary_file, config.COMMAND_SAFETY_CACHE_FILE)
+        except Exception as e:
+            log_message("ERROR", f"Error while saving command safety cache: {e}")
+
+
+def get_local_verdict(command):
+    """Return the verdict from the rules or the cache, or None if the LLM is needed."""
+    safety_check_stats["checks"] += 1
+
+    verdict = classify_command(command)
+    if verdict is not None:
+        safety_check_stats[f"rule_{verdict}"] += 1
+        source = "rules"
+    else:
+        verdict = get_cached_verdict(command)
+        if verdict is not None:
+            safety_check_stats["cache_hits"] += 1
+            source = "cache"
+        else:
+            safety_check_stats["llm_calls"] += 1
+            source = "LLM"
+
+    log_message(
+        "DEBUG",
+        "Command safety verdict source: %s (local hit rate: %.0f%%, stats: %s)",
+        source,
+        get_local_hit_rate() * 100,
+        safety_check_stats,
+    )
+    return verdict
+
+
+def get_local_hit_rate():
+    if safety_check_stats["checks"] == 0:
+        return 0.0
+    return 1 - safety_check_stats["llm_calls"] / safety_check_stats["checks"]
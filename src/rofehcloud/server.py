@@ -0,0 +1,305 @@
+import re
+import json
+import uuid
+import threading
+from datetime import datetime
+from urllib.parse import urlparse, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+from rofehcloud.chat import (
+    generate_conversation_label_in_background,
+    get_conversations_list,
+    get_heuristic_conversation_label,
+    get_troubleshooting_prompt,
+    load_session,
+    save_session,
+)
+from rofehcloud.history import get_history_for_prompt
+from rofehcloud.profile import check_available_tools, read_profile
+
+
+# API:
+#   GET  /health
+#   GET  /sessions?profile=<profile>          list conversations of the profile
+#   GET  /sessions/<session_id>               conversation details
+#   POST /sessions                            {"question": ..., "profile": ...,
+#                                              "conversation_type": "question" |
+#                                              "troubleshooting"}
+#   POST /sessions/<session_id>/messages      {"question": ...}
+
+SESSION_PATH = re.compile(r"^/sessions/([A-Za-z0-9-]+)$")
+SESSION_MESSAGES_PATH = re.compile(r"^/sessions/([A-Za-z0-9-]+)/messages$")
+# Profile names are file names in PROFILES_DIR; path separators are not allowed
+PROFILE_NAME = re.compile(r"^[A-Za-z0-9_][A-Za-z0-9_.-]*$")
+
+# Agents keep no conversation state, so one agent per profile serves all sessions.
+# Each profile has its own lock, so building an agent does not block other profiles
+profile_agents = {}
+profile_agent_locks = {}
+profile_agent_locks_lock = threading.Lock()
+
+# Turns of the same session are answered one at a time
+session_locks = {}
+session_locks_lock = threading.Lock()
+
+worker_pool = None
+in_flight_requests = None
+default_profile = "default"
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def validate_profile_name(profile):
+    if not isinstance(profile, str) or not PROFILE_NAME.match(profile):
+        raise RequestError(400, "Invalid profile name")
+    return profile
+
+
+def get_profile_agent(profile):
+    from rofehcloud.agent import build_agent
+
+    validate_profile_name(profile)
+    agent = profile_agents.get(profile)
+    if agent is not None:
+        return agent
+    with profile_agent_locks_lock:
+        profile_lock = profile_agent_locks.setdefault(profile, threading.Lock())
+    with profile_lock:
+        agent = profile_agents.get(profile)
+        if agent is None:
+            profile_data = read_profile(profile)
+            if profile_data is None:
+                raise RequestError(404, f"Profile {profile} not found")
+            agent = build_agent(profile_data)
+            profile_agents[profile] = agent
+    return agent
+
+
+def get_session_lock(session_id):
+    with session_locks_lock:
+        return session_locks.setdefault(session_id, threading.Lock())
+
+
+def answer_question(conversation_details, question):
+    from rofehcloud.agent import handle_user_prompt
+
+    profile = conversation_details["profile"]
+    agent = get_profile_agent(profile)
+
+    user_input = question
+    if (
+        conversation_details["conversation_type"] == "troubleshooting"
+        and not conversation_details["conversation_history"]
+    ):
+        user_input = get_troubleshooting_prompt(question)
+
+    history_summary, recent_history = get_history_for_prompt(conversation_details)
+    turn_stats = {}
+    answer = handle_user_prompt(
+        profile,
+        user_input,
+        recent_history,
+        turn_stats=turn_stats,
+        agent=agent,
+        history_summary=history_summary,
+    )
+    conversation_details["conversation_history"].append(
+        {"question": question, "answer": answer}
+    )
+    if not save_session(conversation_details):
+        raise RequestError(
+            500,
+            "Error while saving the conversation details "
+            f"({conversation_details['session_id']})",
+        )
+
+    return {
+        "session_id": conversation_details["session_id"],
+        "conversation_label": conversation_details["conversation_label"],
+        "answer": answer,
+        "stats": turn_stats,
+    }
+
+
+def start_conversation(profile, question, conversation_type):
+    # Fail fast on unknown profiles before spending an LLM call on the label
+    get_profile_agent(profile)
+    conversation_details = {
+        "start_time": datetime.now(),
+        "profile": profile,
+        "session_id": str(uuid.uuid4()),
+        "conversation_label": get_heuristic_conversation_label(question),
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "conversation_type": conversation_type,
+        "conversation_history": [],
+    }
+    generate_conversation_label_in_background(profile, question, conversation_details)
+    return answer_question(conversation_details, question)
+
+
+def continue_conversation(session_id, question):
+    conversation_details = load_session(session_id)
+    if not conversation_details:
+        raise RequestError(404, f"Session {session_id} not found")
+    return answer_question(conversation_details, question)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        log_message("DEBUG", "%s - " + format, self.address_string(), *args)
+
+    def send_json(self, status, data, headers=None):
+        body = json.dumps(data, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            raise RequestError(400, f"Invalid JSON body: {e}")
+        if not isinstance(data, dict):
+            raise RequestError(400, "The request body must be a JSON object")
+        return data
+
+    def handle_request(self, handler):
+        try:
+            self.send_json(*handler())
+        except RequestError as e:
+            self.send_json(e.status, {"error": str(e)})
+        except Exception as e:
+            log_message("ERROR", f"Error while handling {self.path}: {e}")
+            self.send_json(500, {"error": "Internal server error"})
+
+    def do_GET(self):
+        self.handle_request(self.get_resource)
+
+    def do_POST(self):
+        self.handle_request(self.run_turn)
+
+    def get_resource(self):
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return 200, {"status": "ok", "profiles": sorted(profile_agents)}
+
+        if url.path == "/sessions":
+            profile = validate_profile_name(
+                parse_qs(url.query).get("profile", [default_profile])[0]
+            )
+            conversations = get_conversations_list(profile)
+            if conversations is None:
+                raise RequestError(500, "Error while listing conversations")
+            return 200, {"profile": profile, "sessions": conversations}
+
+        match = SESSION_PATH.match(url.path)
+        if match:
+            conversation_details = load_session(match.group(1))
+            if not conversation_details:
+                raise RequestError(404, f"Session {match.group(1)} not found")
+            return 200, conversation_details
+
+        raise RequestError(404, f"Unknown resource {url.path}")
+
+    def run_turn(self):
+        path = urlparse(self.path).path
+        match = SESSION_MESSAGES_PATH.match(path)
+        if path != "/sessions" and not match:
+            raise RequestError(404, f"Unknown resource {path}")
+
+        data = self.read_json()
+        question = data.get("question")
+        if not question or not isinstance(question, str):
+            raise RequestError(400, 'The request must have a "question" string')
+
+        # Backpressure: reject instead of queueing without a bound
+        if not in_flight_requests.acquire(blocking=False):
+            return (
+                503,
+                {"error": "Too many requests in flight, retry later"},
+                {"Retry-After": "1"},
+            )
+        try:
+            if match is None:
+                conversation_type = data.get("conversation_type", "question")
+                if conversation_type not in ["question", "troubleshooting"]:
+                    raise RequestError(400, "Invalid conversation_type")
+                future = worker_pool.submit(
+                    start_conversation,
+                    data.get("profile", default_profile),
+                    question,
+                    conversation_type,
+                )
+                return 201, future.result()
+
+            session_id = match.group(1)
+            session_lock = get_session_lock(session_id)
+            if not session_lock.acquire(blocking=False):
+                raise RequestError(
+                    409, f"Session {session_id} is already answering a question"
+                )
+            try:
+                future = worker_pool.submit(continue_conversation, session_id, question)
+                return 200, future.result()
+            finally:
+                session_lock.release()
+        finally:
+            in_flight_requests.release()
+
+
+def run_server(profile, host=None, port=None):
+    global worker_pool, in_flight_requests, default_profile
+
+    host = host or config.SERVER_HOST
+    port = port or config.SERVER_PORT
+    default_profile = profile
+
+    # Nobody can confirm commands on behalf of the API clients
+    config.NON_INTERACTIVE = True
+    # A short cassette recording can serve any number of load test requests
+    config.CASSETTE_REPLAY_REUSE = True
+    if not check_available_tools(profile):
+        return 1
+    # The agent of the default profile is built up front, so the first request is fast
+    # and configuration errors show up at startup
+    try:
+        get_profile_agent(profile)
+    except RequestError as e:
+        log_message("ERROR", str(e))
+        return 1
+
+    worker_pool = ThreadPoolExecutor(
+        max_workers=config.SERVER_MAX_WORKERS, thread_name_prefix="agent"
+    )
+    in_flight_requests = threading.BoundedSemaphore(
+        config.SERVER_MAX_IN_FLIGHT_REQUESTS
+    )
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    log_message(
+        "INFO",
+        f"Serving on http://{host}:{server.server_address[1]} "
+        f"({config.SERVER_MAX_WORKERS} workers, "
+        f"{config.SERVER_MAX_IN_FLIGHT_REQUESTS} requests in flight at most)",
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log_message("INFO", "Shutting down the server...")
+    finally:
+        server.server_close()
+        worker_pool.shutdown(wait=False, cancel_futures=True)
+    return 0
@@ -0,0 +1,359 @@
+import os
+import re
+import json
+import glob
+import sqlite3
+import threading
+from datetime import datetime
+
+import yaml
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+# Conversation details stored in dedicated columns/tables; everything else is kept
+# in the "details" JSON column
+SESSION_COLUMNS = ["session_id", "profile", "conversation_label", "date"]
+
+_local = threading.local()
+
+search_index_available = False
+
+# Label matches rank higher than matches in questions, which rank higher than
+# matches in answers (bm25() scores are negative, lower is better)
+LABEL_MATCH_WEIGHT = 2.0
+QUESTION_MATCH_WEIGHT = 1.5
+
+
+def get_connection():
+    # sqlite3 connections cannot be shared between threads, so each thread gets its own
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = sqlite3.connect(config.SESSION_DB_FILE, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        # "INSERT OR REPLACE" fires the delete triggers of the search index only
+        # with recursive triggers enabled
+        connection.execute("PRAGMA recursive_triggers=ON")
+        initialize_schema(connection)
+        initialize_search_index(connection)
+        _local.connection = connection
+    return connection
+
+
+def initialize_schema(connection):
+    with connection:
+        connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                profile TEXT NOT NULL,
+                conversation_label TEXT,
+                date TEXT,
+                details TEXT
+            );
+            CREATE INDEX IF NOT EXISTS sessions_by_profile_and_date
+                ON sessions (profile, date DESC);
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                turn_index INTEGER NOT NULL,
+                question TEXT,
+                answer TEXT,
+                PRIMARY KEY (session_id, turn_index)
+            );
+            CREATE TABLE IF NOT EXISTS metadata (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+            """
+        )
+
+
+def initialize_search_index(connection):
+    """Create the full-text index of labels, questions and answers.
+
+    The index is kept up to date by triggers on the sessions and turns tables;
+    the existing conversations are indexed once when the index is created.
+    """
+    global search_index_available
+
+    try:
+        with connection:
+            connection.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+                    conversation_label, content='sessions', content_rowid='rowid'
+                );
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_insert AFTER INSERT ON sessions
+                BEGIN
+                    INSERT INTO sessions_fts (rowid, conversation_label)
+                    VALUES (new.rowid, new.conversation_label);
+                END;
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_delete AFTER DELETE ON sessions
+                BEGIN
+                    INSERT INTO sessions_fts (sessions_fts, rowid, conversation_label)
+                    VALUES ('delete', old.rowid, old.conversation_label);
+                END;
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_update
+                AFTER UPDATE OF conversation_label ON sessions
+                BEGIN
+                    INSERT INTO sessions_fts (sessions_fts, rowid, conversation_label)
+                    VALUES ('delete', old.rowid, old.conversation_label);
+                    INSERT INTO sessions_fts (rowid, conversation_label)
+                    VALUES (new.rowid, new.conversation_label);
+                END;
+
+                CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+                    question, answer, content='turns', content_rowid='rowid'
+                );
+                CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns
+                BEGIN
+                    INSERT INTO turns_fts (rowid, question, answer)
+                    VALUES (new.rowid, new.question, new.answer);
+                END;
+                CREATE TRIGGER IF NOT EXISTS turns_fts_delete AFTER DELETE ON turns
+                BEGIN
+                    INSERT INTO turns_fts (turns_fts, rowid, question, answer)
+                    VALUES ('delete', old.rowid, old.question, old.answer);
+                END;
+                CREATE TRIGGER IF NOT EXISTS turns_fts_update AFTER UPDATE ON turns
+                BEGIN
+                    INSERT INTO turns_fts (turns_fts, rowid, question, answer)
+                    VALUES ('delete', old.rowid, old.question, old.answer);
+                    INSERT INTO turns_fts (rowid, question, answer)
+                    VALUES (new.rowid, new.question, new.answer);
+                END;
+                """
+            )
+            if not connection.execute(
+                "SELECT value FROM metadata WHERE key = 'search_index_built'"
+            ).fetchone():
+                connection.execute(
+                    "INSERT INTO sessions_fts (sessions_fts) VALUES ('rebuild')"
+                )
+                connection.execute(
+                    "INSERT INTO turns_fts (turns_fts) VALUES ('rebuild')"
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+                    ("search_index_built", datetime.now().isoformat()),
+                )
+        search_index_available = True
+    except sqlite3.OperationalError as e:
+        # SQLite may be built without FTS5; searches then scan the tables
+        log_message(
+            "WARNING", f"Full-text search of conversations is not available: {e}"
+        )
+        search_index_available = False
+
+
+def _serialize_details(conversation_details):
+    details = {
+        key: value
+        for key, value in conversation_details.items()
+        if key not in SESSION_COLUMNS and key != "conversation_history"
+    }
+    return json.dumps(details, default=str)
+
+
+def _deserialize_details(details):
+    details = json.loads(details) if details else {}
+    if isinstance(details.get("start_time"), str):
+        try:
+            details["start_time"] = datetime.fromisoformat(details["start_time"])
+        except ValueError:
+            pass
+    return details
+
+
+def save_conversation(conversation_details):
+    """Save the session metadata and append the turns that are not stored yet."""
+    connection = get_connection()
+    session_id = conversation_details["session_id"]
+    history = conversation_details.get("conversation_history", [])
+
+    with connection:
+        connection.execute(
+            "INSERT INTO sessions (session_id, profile, conversation_label, date, details) "
+            "VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (session_id) DO UPDATE SET "
+            "conversation_label = excluded.conversation_label, details = excluded.details",
+            (
+                session_id,
+                conversation_details["profile"],
+                conversation_details.get("conversation_label"),
+                str(conversation_details.get("date")),
+                _serialize_details(conversation_details),
+            ),
+        )
+        stored_turns = connection.execute(
+            "SELECT COUNT(*) FROM turns WHERE session_id = ?", (session_id,)
+        ).fetchone()[0]
+        connection.executemany(
+            "INSERT OR REPLACE INTO turns (session_id, turn_index, question, answer) "
+            "VALUES (?, ?, ?, ?)",
+            [
+                (session_id, turn_index, turn["question"], turn["answer"])
+                for turn_index, turn in enumerate(history)
+                if turn_index >= stored_turns
+            ],
+        )
+    return True
+
+
+def load_conversation(session_id):
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT * FROM sessions WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    if row is None:
+        return None
+
+    conversation_details = {column: row[column] for column in SESSION_COLUMNS}
+    conversation_details.update(_deserialize_details(row["details"]))
+    conversation_details["conversation_history"] = [
+        {"question": turn["question"], "answer": turn["answer"]}
+        for turn in connection.execute(
+            "SELECT question, answer FROM turns WHERE session_id = ? "
+            "ORDER BY turn_index",
+            (session_id,),
+        )
+    ]
+    return conversation_details
+
+
+def list_conversations(profile):
+    connection = get_connection()
+    return [
+        {
+            "session_id": row["session_id"],
+            "label": row["conversation_label"],
+            "date": row["date"],
+        }
+        for row in connection.execute(
+            "SELECT session_id, conversation_label, date FROM sessions "
+            "WHERE profile = ? ORDER BY date DESC",
+            (profile,),
+        )
+    ]
+
+
+def get_search_query(query):
+    # Every word must match (as a prefix); quoting keeps FTS5 syntax characters literal
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def search_conversations(profile, query, limit=50):
+    """Return conversations matching all words of the query, best matches first.
+
+    Every conversation has the keys of list_conversations() and a snippet of the
+    best matching label, question or answer.
+    """
+    search_query = get_search_query(query)
+    if not search_query:
+        return []
+
+    connection = get_connection()
+    if search_index_available:
+        rows = connection.execute(
+            """
+            SELECT sessions.session_id, sessions.conversation_label, sessions.date,
+                MIN(matches.score) AS score, matches.snippet
+            FROM (
+                SELECT sessions.session_id,
+                    bm25(sessions_fts) * :label_weight AS score,
+                    sessions.conversation_label AS snippet
+                FROM sessions_fts JOIN sessions ON sessions.rowid = sessions_fts.rowid
+                WHERE sessions_fts MATCH :query
+                UNION ALL
+                SELECT turns.session_id,
+                    bm25(turns_fts, :question_weight, 1.0) AS score,
+                    snippet(turns_fts, -1, '', '', '...', 12) AS snippet
+                FROM turns_fts JOIN turns ON turns.rowid = turns_fts.rowid
+                WHERE turns_fts MATCH :query
+            ) AS matches
+            JOIN sessions ON sessions.session_id = matches.session_id
+            WHERE sessions.profile = :profile
+            GROUP BY sessions.session_id
+            ORDER BY score
+            LIMIT :limit
+            """,
+            {
+                "query": search_query,
+                "profile": profile,
+                "limit": limit,
+                "label_weight": LABEL_MATCH_WEIGHT,
+                "question_weight": QUESTION_MATCH_WEIGHT,
+            },
+        ).fetchall()
+    else:
+        words = re.findall(r"\w+", query.lower())
+        conditions = " AND ".join(
+            "LOWER(COALESCE(sessions.conversation_label, '') || ' ' || "
+            "COALESCE(turns.question, '') || ' ' || COALESCE(turns.answer, '')) "
+            "LIKE ?"
+            for _ in words
+        )
+        rows = connection.execute(
+            "SELECT sessions.session_id, sessions.conversation_label, sessions.date, "
+            "turns.question AS snippet FROM sessions "
+            "LEFT JOIN turns ON turns.session_id = sessions.session_id "
+            f"WHERE sessions.profile = ? AND {conditions} "
+            "GROUP BY sessions.session_id ORDER BY sessions.date DESC LIMIT ?",
+            (profile, *(f"%{word}%" for word in words), limit),
+        ).fetchall()
+
+    return [
+        {
+            "session_id": row["session_id"],
+            "label": row["conversation_label"],
+            "date": row["date"],
+            "snippet": " ".join((row["snippet"] or "").split()),
+        }
+        for row in rows
+    ]
+
+
+def import_yaml_sessions():
+    """Import existing YAML session files once; the files are left in place."""
+    connection = get_connection()
+    if connection.execute(
+        "SELECT value FROM metadata WHERE key = 'yaml_sessions_imported'"
+    ).fetchone():
+        return 0
+
+    imported = 0
+    for session_file in glob.glob(f"{config.SESSION_DIR}/*.yaml"):
+        try:
+            with open(session_file, "r") as file:
+                session = yaml.safe_load(file)
+            if not session or "session_id" not in session:
+                continue
+            if connection.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session["session_id"],)
+            ).fetchone():
+                continue
+            session["date"] = str(session.get("date"))
+            session.setdefault("conversation_history", [])
+            save_conversation(session)
+            imported += 1
+        except Exception as e:
+            log_message(
+                "ERROR", f"Error while importing session file {session_file}: {e}"
+            )
+
+    with connection:
+        connection.execute(
+            "INSERT OR REPLACE INTO metadata (key, value) VALUES (?, ?)",
+            ("yaml_sessions_imported", datetime.now().isoformat()),
+        )
+    if imported:
+        log_message(
+            "INFO",
+            f"Imported {imported} session files from {config.SESSION_DIR} "
+            f"to {os.path.basename(config.SESSION_DB_FILE)}",
+        )
+    return imported
@@ -0,0 +1,208 @@
+import os
+import time
+import atexit
+import codecs
+import signal
+import selectors
+import tempfile
+import subprocess
+from collections import deque
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+READ_CHUNK_SIZE = 65536
+
+# Run statistics per tool (the first command of the pipeline), used to tune timeouts
+command_stats = {}
+
+# Overflow files stay available to the agent (it is told their paths) until exit
+overflow_files = []
+
+
+def remove_overflow_files():
+    for path in overflow_files:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    overflow_files.clear()
+
+
+atexit.register(remove_overflow_files)
+
+
+def get_command_tool(command):
+    words = command.split()
+    return os.path.basename(words[0]) if words else ""
+
+
+def get_command_timeout(command):
+    # A pipeline gets the longest timeout of the tools it uses
+    timeouts = [
+        config.COMMAND_TIMEOUTS[os.path.basename(word)]
+        for word in command.split()
+        if os.path.basename(word) in config.COMMAND_TIMEOUTS
+    ]
+    return max(timeouts) if timeouts else config.COMMAND_TIMEOUT_SECONDS
+
+
+def record_command_stats(command, elapsed_time, timed_out):
+    stats = command_stats.setdefault(
+        get_command_tool(command),
+        {"executed": 0, "timed_out": 0, "total_seconds": 0.0, "max_seconds": 0.0},
+    )
+    stats["executed"] += 1
+    stats["timed_out"] += 1 if timed_out else 0
+    stats["total_seconds"] += elapsed_time
+    stats["max_seconds"] = max(stats["max_seconds"], elapsed_time)
+
+
+def terminate_process_group(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        try:
+            process.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+    except ProcessLookupError:
+        pass
+
+
+def run_shell_command(
+    command, cwd=None, max_output_length=None, timeout=None, merge_stderr=True
+):
+    """Run a shell command and capture at most max_output_length characters of output.
+
+    The whole process group is terminated if the command runs longer than timeout
+    seconds (the per-tool COMMAND_TIMEOUTS value by default; 0 disables the timeout).
+    Stdout and stderr are merged in arrival order (stderr is discarded if merge_stderr
+    is False). Once the limit is reached, the
+    process group is terminated (COMMAND_OUTPUT_OVERFLOW_MODE=terminate) or the rest
+    of the output is written to a temporary file, keeping only the last
+    COMMAND_OUTPUT_TAIL_WINDOW_CHARS characters in memory (COMMAND_OUTPUT_OVERFLOW_MODE=drain).
+    """
+    if max_output_length is None:
+        max_output_length = config.COMMAND_OUTPUT_MAX_LENGTH_CHARS
+    if timeout is None:
+        timeout = get_command_timeout(command)
+
+    start_time = time.monotonic()
+    deadline = start_time + timeout if timeout else None
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        cwd=cwd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT if merge_stderr else subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    selector = selectors.DefaultSelector()
+    selector.register(process.stdout, selectors.EVENT_READ)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    head = []
+    head_length = 0
+    tail = deque()
+    tail_length = 0
+    total_length = 0
+    overflow_file = None
+    terminated = False
+    timed_out = False
+
+    try:
+        while True:
+            if deadline is not None:
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    timed_out = True
+                    terminate_process_group(process)
+                    break
+                if not selector.select(remaining_time):
+                    continue
+
+            data = os.read(process.stdout.fileno(), READ_CHUNK_SIZE)
+            text = decoder.decode(data, final=not data)
+            total_length += len(text)
+
+            if head_length < max_output_length:
+                text_for_head = text[: max_output_length - head_length]
+                head.append(text_for_head)
+                head_length += len(text_for_head)
+                text = text[len(text_for_head) :]
+
+            if text:
+                if config.COMMAND_OUTPUT_OVERFLOW_MODE != "drain":
+                    terminated = True
+                    terminate_process_group(process)
+                    break
+
+                if overflow_file is None:
+                    overflow_file = tempfile.NamedTemporaryFile(
+                        "w", prefix="rofehcloud-output-", suffix=".txt", delete=False
+                    )
+                    overflow_files.append(overflow_file.name)
+                    overflow_file.write("".join(head))
+                overflow_file.write(text)
+
+                tail.append(text)
+                tail_length += len(text)
+                while (
+                    tail_length - len(tail[0])
+                    >= config.COMMAND_OUTPUT_TAIL_WINDOW_CHARS
+                ):
+                    tail_length -= len(tail.popleft())
+
+            if not data:
+                break
+    finally:
+        selector.close()
+        process.stdout.close()
+        if overflow_file is not None:
+            overflow_file.close()
+
+    # The command may close its output and keep running
+    try:
+        exit_code = process.wait(
+            timeout=max(0, deadline - time.monotonic()) if deadline else None
+        )
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        terminate_process_group(process)
+        exit_code = process.wait()
+    elapsed_time = time.monotonic() - start_time
+    record_command_stats(command, elapsed_time, timed_out)
+    output = "".join(head)
+    tail_text = "".join(tail)[-config.COMMAND_OUTPUT_TAIL_WINDOW_CHARS :]
+
+    result = {
+        "output": output,
+        "exit_code": exit_code,
+        "truncated": terminated or overflow_file is not None,
+        "terminated": terminated,
+        "timed_out": timed_out,
+        "timeout": timeout,
+        "elapsed_time": elapsed_time,
+        "total_length": total_length,
+        "tail": tail_text,
+        "overflow_file": overflow_file.name if overflow_file is not None else None,
+    }
+    if timed_out:
+        log_message(
+            "WARNING",
+            f"Command timed out after {timeout} seconds and was terminated: {command}",
+        )
+    if result["truncated"]:
+        log_message(
+            "DEBUG",
+            f"Output is too long: kept {head_length} of {total_length} characters "
+            + (
+                "(process terminated)"
+                if terminated
+                else f"(complete output saved to {result['overflow_file']})"
+            ),
+        )
+    return result
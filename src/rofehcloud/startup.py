@@ -0,0 +1,76 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from rofehcloud.logger import log_message
+
+
+class StartupStageError(Exception):
+    pass
+
+
+def run_startup_stages(stages):
+    """Run startup stages concurrently, each one as soon as its dependencies are done.
+
+    stages is a list of (name, function, dependencies) tuples; a function receives
+    the dict of results of the finished stages. A stage fails if it raises or
+    returns False. Returns the results and the timing of every stage: a dict of
+    (start, end) offsets in seconds from the start of the pipeline.
+    """
+    start_time = time.time()
+    results = {}
+    timings = {}
+    pending_stages = {name: (function, set(deps)) for name, function, deps in stages}
+
+    def run_stage(name, function):
+        stage_start_time = time.time()
+        try:
+            return function(results)
+        finally:
+            timings[name] = (stage_start_time - start_time, time.time() - start_time)
+
+    with ThreadPoolExecutor(max_workers=len(stages)) as executor:
+        running = {}
+        while pending_stages or running:
+            for name, (function, deps) in list(pending_stages.items()):
+                if deps <= results.keys():
+                    del pending_stages[name]
+                    running[executor.submit(run_stage, name, function)] = name
+            if not running:
+                raise StartupStageError(
+                    f"Unresolvable startup stage dependencies: {list(pending_stages)}"
+                )
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    result = future.result()
+                    error = None
+                except Exception as e:
+                    result = False
+                    error = e
+                if result is False:
+                    for other_future in running:
+                        other_future.cancel()
+                    raise StartupStageError(
+                        f"Startup stage {name} failed" + (f": {error}" if error else "")
+                    )
+                results[name] = result
+                log_message(
+                    "DEBUG",
+                    "Startup stage %s finished in %.2f seconds",
+                    name,
+                    timings[name][1] - timings[name][0],
+                )
+
+    return results, timings
+
+
+def format_startup_timings(timings):
+    total_time = max(end for _, end in timings.values())
+    lines = [f"Startup timing ({total_time:.2f} seconds):"]
+    for name, (start, end) in sorted(timings.items(), key=lambda item: item[1]):
+        lines.append(
+            f"  {name:<20} {start:6.2f}s - {end:6.2f}s ({end - start:.2f} seconds)"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from rofehcloud.config import Config as config
+from rofehcloud.logger import log_message
+
+
+# A span is a dict:
+# {"trace_id", "span_id", "parent_id", "name", "start_time", "end_time", "duration",
+#  "status", "attributes"}
+# plus private "_trace"/"_parent" references that are not exported. The spans of a
+# trace are exported when its root span ends.
+current_span = contextvars.ContextVar("current_span", default=None)
+export_lock = threading.Lock()
+
+WATERFALL_NAME_WIDTH = 44
+WATERFALL_BAR_WIDTH = 40
+
+
+def is_tracing_enabled():
+    return config.TRACING_ENABLED or config.TRACE_SHOW_WATERFALL
+
+
+def start_span(name, parent=None, **attributes):
+    if parent is None:
+        parent = current_span.get()
+    if parent:
+        trace = parent["_trace"]
+    else:
+        trace = {"trace_id": secrets.token_hex(16), "spans": []}
+    span = {
+        "trace_id": trace["trace_id"],
+        "span_id": secrets.token_hex(8),
+        "parent_id": parent["span_id"] if parent else None,
+        "name": name,
+        "start_time": time.time(),
+        "end_time": None,
+        "duration": None,
+        "status": "ok",
+        "attributes": attributes,
+        "_trace": trace,
+        "_parent": parent,
+    }
+    current_span.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    span["end_time"] = time.time()
+    span["duration"] = span["end_time"] - span["start_time"]
+    if error is not None:
+        span["status"] = "error"
+        span["attributes"]["error"] = str(error)
+    span["_trace"]["spans"].append(span)
+    current_span.set(span["_parent"])
+
+    if span["_parent"] is None and config.TRACING_ENABLED:
+        export_trace(span["_trace"]["spans"])
+
+
+@contextmanager
+def span(name, **attributes):
+    """Trace the enclosed block as a child of the current span.
+
+    Yields the span, so attributes known only at the end can be added; without
+    tracing a throwaway dict is yielded instead.
+    """
+    if not is_tracing_enabled():
+        yield {"attributes": attributes}
+        return
+
+    current = start_span(name, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, e)
+        raise
+    end_span(current)
+
+
+def get_exported_span(span):
+    return {key: value for key, value in span.items() if not key.startswith("_")}
+
+
+def get_otlp_attribute(key, value):
+    if isinstance(value, bool):
+        typed_value = {"boolValue": value}
+    elif isinstance(value, int):
+        typed_value = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed_value = {"doubleValue": value}
+    else:
+        typed_value = {"stringValue": str(value)}
+    return {"key": key, "value": typed_value}
+
+
+def get_otlp_trace(spans):
+    # One OTLP/JSON ExportTraceServiceRequest per trace, as written by the
+    # OpenTelemetry collector file exporter
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [get_otlp_attribute("service.name", "rofehcloud")]
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "rofehcloud"},
+                        "spans": [
+                            {
+                                "traceId": span["trace_id"],
+                                "spanId": span["span_id"],
+                                "parentSpanId": span["parent_id"] or "",
+                                "name": span["name"],
+                                "kind": 1,
+                                "startTimeUnixNano": str(int(span["start_time"] * 1e9)),
+                                "endTimeUnixNano": str(int(span["end_time"] * 1e9)),
+                                "attributes": [
+                                    get_otlp_attribute(key, value)
+                                    for key, value in span["attributes"].items()
+                                ],
+                                "status": {
+                                    "code": 2 if span["status"] == "error" else 1
+                                },
+                            }
+                            for span in spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def export_trace(spans):
+    try:
+        if config.TRACE_EXPORT_FORMAT == "otlp":
+            lines = [json.dumps(get_otlp_trace(spans))]
+        else:
+            lines = [json.dumps(get_exported_span(span), default=str) for span in spans]
+
+        with export_lock:
+            os.makedirs(
+                os.path.dirname(os.path.abspath(config.TRACE_FILE)), exist_ok=True
+            )
+            with open(config.TRACE_FILE, "a") as file:
+                file.write("\n".join(lines) + "\n")
+
+    except Exception as e:
+        log_message("ERROR", f"Error while exporting trace spans: {e}")
+
+
+def format_waterfall(root_span):
+    """Render the spans of the root span's trace as a text waterfall chart."""
+    spans = [
+        s
+        for s in root_span.get("_trace", {}).get("spans", [])
+        if s["start_time"] >= root_span["start_time"]
+    ]
+    if not spans:
+        return ""
+
+    depths = {root_span["span_id"]: 0}
+    total_duration = max(root_span["duration"], 1e-6)
+    lines = [f"Time breakdown ({root_span['duration']:.2f} seconds):"]
+    for s in sorted(spans, key=lambda s: s["start_time"]):
+        depth = depths.setdefault(s["span_id"], depths.get(s["parent_id"], -1) + 1)
+        label = "  " * depth + s["name"]
+        details = s["attributes"].get("tool") or s["attributes"].get("command")
+        if details:
+            label += f" ({details})"
+        if len(label) > WATERFALL_NAME_WIDTH:
+            label = label[: WATERFALL_NAME_WIDTH - 3] + "..."
+
+        offset = s["start_time"] - root_span["start_time"]
+        bar_start = int(offset / total_duration * WATERFALL_BAR_WIDTH)
+        bar_length = max(1, int(s["duration"] / total_duration * WATERFALL_BAR_WIDTH))
+        bar = " " * bar_start + "#" * min(bar_length, WATERFALL_BAR_WIDTH - bar_start)
+        lines.append(
+            f"{label:<{WATERFALL_NAME_WIDTH}} {offset:7.2f}s {s['duration']:7.2f}s "
+            f"|{bar:<{WATERFALL_BAR_WIDTH}}|"
+            + (" ERROR" if s["status"] == "error" else "")
+        )
+    return "\n".join(lines)
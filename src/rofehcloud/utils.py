@@ -3,6 +3,7 @@ import os
 from rofehcloud.logger import log_message
 from rofehcloud.config import Config as config
 from rofehcloud.chat import save_data
+from rofehcloud.session_store import import_yaml_sessions
 from rofehcloud.constants import default_profile_data
 
 
@@ -41,6 +42,9 @@ def initialize_environment():
             log_message("INFO", f"Creating the directory {config.PROFILES_DIR}")
             os.makedirs(config.PROFILES_DIR)
 
+        if config.SESSION_STORAGE_BACKEND == "sqlite":
+            import_yaml_sessions()
+
         default_profile = f"{config.PROFILES_DIR}/default.yaml"
 
         if not os.path.exists(default_profile):
@@ -55,3 +55,58 @@ docker run --rm -i \
     "${IMAGE}" \
         bash -ec "pip install -r requirements.txt && python ./src/rofehcloud/__main__.py -v"
 set +e
+
+###
+### Check startup time budget: "rofehcloud -v" and the import/setup of the agent
+### (time to menu) must be fast, must not touch the network and must load only
+### the modules of the selected LLM provider
+###
+VERSION_TIME_BUDGET_SECONDS="2"
+TIME_TO_MENU_BUDGET_SECONDS="6"
+set -e
+docker run --rm -i \
+    --volume "${REPOROOT}:/app:rw" \
+    --workdir /app \
+    --env VERSION_TIME_BUDGET_SECONDS="${VERSION_TIME_BUDGET_SECONDS}" \
+    --env TIME_TO_MENU_BUDGET_SECONDS="${TIME_TO_MENU_BUDGET_SECONDS}" \
+    "${IMAGE}" \
+        bash -ec 'pip install . && cd / &>/dev/null && python - <<PYTHON
+import os
+import sys
+import time
+import socket
+import subprocess
+
+start_time = time.time()
+subprocess.run(["rofehcloud", "-v"], check=True)
+elapsed_time = time.time() - start_time
+print(f"rofehcloud -v: {elapsed_time:.2f} seconds")
+assert elapsed_time < float(os.environ["VERSION_TIME_BUDGET_SECONDS"]), "rofehcloud -v is too slow"
+
+def no_network(*args, **kwargs):
+    raise AssertionError(f"Unexpected network access: {args}")
+
+socket.socket.connect = no_network
+os.environ.update(
+    {
+        "LLM_TO_USE": "openai",
+        "OPENAI_API_KEY": "test",
+        "SKIP_THE_CHECK_FOR_AVAILABLE_TOOLS": "true",
+        "SKIP_LLM_FUNCTIONALITY_VERIFICATION": "true",
+    }
+)
+start_time = time.time()
+from rofehcloud.agent import setup_services
+setup_services({"name": "default", "description": "Default profile"})
+elapsed_time = time.time() - start_time
+print(f"Time to menu: {elapsed_time:.2f} seconds")
+assert elapsed_time < float(os.environ["TIME_TO_MENU_BUDGET_SECONDS"]), "Startup is too slow"
+
+unexpected_modules = [
+    module
+    for module in ["langchain_aws", "langchain_ollama", "langchain_google_genai", "boto3", "ollama", "google.genai"]
+    if module in sys.modules
+]
+assert not unexpected_modules, f"Modules of other LLM providers are loaded: {unexpected_modules}"
+PYTHON'
+set +e
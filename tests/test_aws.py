@@ -0,0 +1,81 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+from moto import mock_aws
+
+from rofehcloud import aws
+
+
+@pytest.fixture
+def session(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+    with mock_aws():
+        yield boto3.Session(region_name="us-east-1")
+
+
+def stub_resource_explorer(monkeypatch, session, responses):
+    """Serve Resource Explorer calls (not supported by moto) from recorded responses."""
+    client = boto3.client("resource-explorer-2", region_name="us-east-1")
+    stubber = Stubber(client)
+    for method, response in responses:
+        stubber.add_response(method, response)
+    stubber.activate()
+
+    original_client = session.client
+
+    def get_client(service_name, **kwargs):
+        if service_name == "resource-explorer-2":
+            return client
+        return original_client(service_name, **kwargs)
+
+    monkeypatch.setattr(session, "client", get_client)
+    return stubber
+
+
+def test_tagging_api_finds_regions_with_tagged_resources(session):
+    session.client("ec2", region_name="us-west-2").create_vpc(
+        CidrBlock="10.0.0.0/16",
+        TagSpecifications=[
+            {"ResourceType": "vpc", "Tags": [{"Key": "team", "Value": "sre"}]}
+        ],
+    )
+
+    assert aws.get_regions_with_resources_using_tagging_api(session) == ["us-west-2"]
+
+
+def test_resource_explorer_finds_regions_with_resources(monkeypatch, session):
+    stubber = stub_resource_explorer(
+        monkeypatch,
+        session,
+        [
+            (
+                "list_indexes",
+                {"Indexes": [{"Region": "us-east-1", "Type": "AGGREGATOR"}]},
+            ),
+            (
+                "search",
+                {
+                    "Resources": [{"Region": "eu-west-1"}, {"Region": "global"}],
+                    "Count": {"Complete": True, "TotalResources": 2},
+                    "ViewArn": "arn:aws:resource-explorer-2:us-east-1:123456789012:view/x",
+                },
+            ),
+        ],
+    )
+
+    assert aws.get_regions_with_resources_using_resource_explorer(session) == [
+        "eu-west-1"
+    ]
+    stubber.assert_no_pending_responses()
+
+
+def test_falls_back_to_probes_on_client_error(monkeypatch, session):
+    # Without an aggregator index the Resource Explorer backend raises ClientError
+    stub_resource_explorer(monkeypatch, session, [("list_indexes", {"Indexes": []})])
+    monkeypatch.setattr(
+        aws, "get_regions_with_resources_using_probes", lambda: ["us-east-2"]
+    )
+
+    assert aws.get_regions_with_resources("resource-explorer", session) == ["us-east-2"]
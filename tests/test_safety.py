@@ -0,0 +1,84 @@
+import pytest
+
+from rofehcloud.safety import SAFE, classify_command, get_command_template
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "kubectl get pods -n default | grep web",
+        "aws ec2 describe-instances \\\n  --region us-east-1",
+        "date +%s",
+        "date -u -d yesterday +%F",
+        "hostname -f",
+        "uniq -c",
+        "sort names.txt | uniq -c -f 1",
+        "sed -n 's/foo/bar/gp' file.txt",
+        "sed -e '/error/d' app.log",
+        "git log --oneline -n 5",
+        "git -C /tmp/repo diff HEAD~1",
+        "curl -s https://example.com",
+        "curl -sI -X HEAD https://example.com",
+        "curl -s -o /dev/null -w '%{http_code}' https://example.com",
+        "kubectl -n default get pods -o wide",
+        "git --no-pager log -5",
+        "gcloud container clusters describe cluster-1 --zone us-central1-a",
+        "az vm list -g group-1",
+        "aws s3api get-object --bucket b --key k /dev/stdout",
+        "sort -u names.txt",
+        "wget -qO- https://example.com",
+    ],
+)
+def test_read_only_commands_are_safe(command):
+    assert classify_command(command) == SAFE
+
+
+@pytest.mark.parametrize(
+    "command",
+    [
+        "kubectl get pods\nkubectl delete pod x",
+        "aws ec2 describe-instances\naws ec2 terminate-instances --instance-ids i-123",
+        "date -s '2020-01-01'",
+        "date --set=tomorrow",
+        "date 010112002026",
+        "hostname evil",
+        "hostname -F /tmp/name",
+        "uniq a b",
+        "sed 's/.*/rm -rf ~/e' file.txt",
+        "sed '1e id' file.txt",
+        "sed 's/a/b/w /etc/x' file.txt",
+        "git -c core.pager=id log",
+        "git diff --output=/etc/x",
+        "curl -dfoo=bar https://example.com",
+        "curl -sXPOST https://example.com",
+        "curl --request=DELETE https://example.com",
+        "curl --data=x https://example.com",
+        "curl -so out.html https://example.com",
+        "kubectl --cache-dir get delete pod foo",
+        "kubectl --as get delete pod foo",
+        "helm --registry-config get uninstall foo",
+        "gcloud compute instances add-metadata list --metadata=a=b",
+        "gcloud pubsub topics publish list --message=x",
+        "sed --expression='s/a/b/w /tmp/f' file.txt",
+        "awk -f /tmp/x.awk file.txt",
+        "curl -K cfg https://example.com",
+        "curl --config cfg https://example.com",
+        "wget --method=DELETE -qO- https://example.com",
+        "sort -uo out in",
+        "hostname --file=x",
+        "aws s3api get-object --bucket b --key k /tmp/out",
+    ],
+)
+def test_commands_with_side_effects_are_not_safe(command):
+    assert classify_command(command) != SAFE
+
+
+def test_command_template_keeps_quoting():
+    assert get_command_template("foo 'x ; rm -rf /'") != get_command_template(
+        "foo x ; rm -rf /"
+    )
+    assert get_command_template(
+        "aws ec2 describe-instances --instance-ids i-0123456789abcdef0"
+    ) == get_command_template(
+        "aws ec2 describe-instances --instance-ids i-0fedcba9876543210"
+    )